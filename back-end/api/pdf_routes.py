@@ -1,16 +1,19 @@
 """
 PDF upload and management routes.
 """
-from fastapi import APIRouter, File, UploadFile, Depends, HTTPException
+from fastapi import APIRouter, File, UploadFile, Depends, HTTPException, Query
+from fastapi.responses import Response
 from sqlmodel import Session, select
-from typing import List
+from typing import List, Optional
 import tempfile
 import shutil
 import uuid
 import os
 from starlette.concurrency import run_in_threadpool
 from utils.database import get_session
-from utils.models import PDFS
+from utils.models import PDFS, Image
+from services.image_store import image_store
+from services.speculative_fill import schedule_speculative_fill
 
 router = APIRouter(prefix="/api/pdf", tags=["pdf"])
 
@@ -49,7 +52,11 @@ async def upload_pdfs(
             await run_in_threadpool(session.add, pdf)
             await run_in_threadpool(session.commit)
 
-            response.append({"filename": file.filename, "file_uuid": tmp_id})
+            response.append({
+                "filename": file.filename,
+                "file_uuid": tmp_id,
+                "images": retriever.image_stats.as_dict()
+            })
 
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error processing {file.filename}: {str(e)}")
@@ -57,9 +64,44 @@ async def upload_pdfs(
         finally:
             await run_in_threadpool(os.remove, temp_file_path)
 
+    # Draft answers for the configured template folders against the new corpus
+    try:
+        await run_in_threadpool(schedule_speculative_fill)
+    except Exception as e:
+        print(f"[SPECULATIVE FILL] Could not schedule pre-generation: {e}")
+
     return response
 
 
+@router.get("/images/{image_id}")
+def get_pdf_image(
+    image_id: str,
+    thumbnail: Optional[int] = Query(None, ge=16, le=1024),
+    session: Session = Depends(get_session)
+):
+    """Return an extracted PDF image, or a JPEG thumbnail of at most ``thumbnail`` pixels."""
+    image = session.exec(select(Image).where(Image.image_id == image_id)).first()
+    if image is None:
+        raise HTTPException(status_code=404, detail=f"No image found with ID '{image_id}'.")
+
+    headers = {"Cache-Control": "public, max-age=31536000, immutable"}
+    if image.image_hash:
+        headers["ETag"] = f'"{image.image_hash}"'
+
+    if thumbnail and image.image_hash:
+        data = image_store.thumbnail(image.image_hash, thumbnail)
+        if data is None:
+            raise HTTPException(status_code=404, detail=f"Image data missing for '{image_id}'.")
+        return Response(content=data, media_type="image/jpeg", headers=headers)
+
+    blob = image_store.get(image.image_hash) if image.image_hash else None
+    data = blob.data if blob else image_store.load(image)
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"Image data missing for '{image_id}'.")
+    media_type = blob.mime if blob else "application/octet-stream"
+    return Response(content=data, media_type=media_type, headers=headers)
+
+
 @router.get("/list")
 def get_all_pdfs(session: Session = Depends(get_session)):
     """Get all uploaded PDFs."""
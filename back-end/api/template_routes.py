@@ -1,28 +1,62 @@
 """
 Template processing routes.
 """
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Header, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlmodel import Session
 from pydantic import BaseModel
 from typing import Optional, List
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from urllib.parse import quote, unquote
 import os
 import uuid
 import asyncio
+import time
 from utils.database import get_session
-from services.template_filler import TemplateFiller, extract_placeholders, retrieve_placeholder_content
-from services.llm_service import LLMService
-from utils.config import INPUT_FOLDER, GENERATED_FOLDER
+from services.template_filler import TemplateFiller, retrieve_placeholder_content
+from services.placeholder_memo import PlaceholderMemo
+from services.fill_plan import fill_plan_cache
+from services.generated_files import generated_files, stream_zip
+from services.llm_service import LLMService, PROCESS_FLOW_PROMPT, decode_image
+from services.caption_cache import caption_cache
+from services.image_store import image_store
+from services.fill_tasks import process_templates_background, enqueue_fill_task, describe_registered_process_flow
+from utils.image_processing import image_size, image_mime
+from utils.config import (
+    INPUT_FOLDER,
+    GENERATED_FOLDER,
+    TEMPLATE_FILL_MODE,
+    PROGRESS_MAX_WAIT_SECONDS,
+    PROGRESS_WAIT_POLL_SECONDS,
+    BUNDLE_IDLE_TIMEOUT_SECONDS,
+    TASK_ACTIVE_WINDOW_SECONDS,
+)
+from utils.task_store import task_store
 from docx import Document
-from api.websocket import broadcast_progress_update_sync
 
 router = APIRouter(prefix="/api/template", tags=["template"])
 
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
 
 class TemplateRequest(BaseModel):
     folder_name: str
     user_prompt: Optional[str] = ""
     process_flow: Optional[str] = ""
     selected_files: Optional[List[str]] = None  # List of specific files to process
+    process_flow_id: Optional[str] = None  # id from POST /process-flow, instead of process_flow
+
+
+class ProcessFlowRequest(BaseModel):
+    process_flow: str  # base64 image or data: URL
+
+
+class ProcessFlowResponse(BaseModel):
+    process_flow_id: str
+    description: str
+    cached: bool
 
 
 class TemplateResponse(BaseModel):
@@ -30,15 +64,10 @@ class TemplateResponse(BaseModel):
     message: str
 
 
-# Store for tracking template processing tasks
-template_tasks = {}
-
-
 @router.post("/fill", response_model=TemplateResponse)
 def start_template_filling(
     request: TemplateRequest, 
-    background_tasks: BackgroundTasks,
-    session: Session = Depends(get_session)
+    background_tasks: BackgroundTasks
 ):
     """Start template filling process and return task ID."""
     folder_name = request.folder_name
@@ -49,25 +78,28 @@ def start_template_filling(
     if not os.path.exists(folder_path) or not os.path.isdir(folder_path):
         raise HTTPException(status_code=404, detail=f"Folder '{folder_name}' not found in inputs")
 
+    process_flow_description = resolve_process_flow_id(request.process_flow_id)
+
     # Generate unique task ID
     task_id = str(uuid.uuid4())
     
     # Initialize task tracking
-    template_tasks[task_id] = {
-        "status": "processing",
-        "files_done": 0,
-        "files_total": 0,
-        "generated_files": []
-    }
+    task_store.create_task(
+        task_id,
+        folder_name=folder_name,
+        user_prompt=request.user_prompt,
+        process_flow=None if process_flow_description else request.process_flow,
+        selected_files=request.selected_files
+    )
+    if process_flow_description:
+        task_store.set_process_flow_description(task_id, process_flow_description)
 
-    # Start background processing
-    background_tasks.add_task(
-        process_templates_background,
+    dispatch_fill_task(
+        background_tasks,
         task_id,
         folder_path,
         request.user_prompt,
-        request.process_flow,
-        session,
+        None if process_flow_description else request.process_flow,
         request.selected_files
     )
 
@@ -77,233 +109,297 @@ def start_template_filling(
     )
 
 
-def process_templates_background(
+@router.post("/process-flow", response_model=ProcessFlowResponse)
+def register_process_flow(request: ProcessFlowRequest):
+    """Describe a process flow image once and return an id that fill requests can reference."""
+    try:
+        image_bytes = decode_image(request.process_flow)
+        image_size(image_bytes)
+    except Exception:
+        raise HTTPException(status_code=400, detail="process_flow is not a valid base64 encoded image")
+
+    # The id is the content hash of the stored image
+    process_flow_id = image_store.put(image_bytes, image_mime(image_bytes))
+    cached = caption_cache.lookup(process_flow_id, PROCESS_FLOW_PROMPT)
+    if cached:
+        return ProcessFlowResponse(process_flow_id=process_flow_id, description=cached, cached=True)
+
+    description = LLMService().generate_process_flow_description(image_bytes)
+    if description is None:
+        raise HTTPException(status_code=502, detail="Process flow description could not be generated")
+    return ProcessFlowResponse(process_flow_id=process_flow_id, description=description, cached=False)
+
+
+def resolve_process_flow_id(process_flow_id: Optional[str]) -> Optional[str]:
+    """Description of a registered process flow; 404 for unknown ids, 502 if it cannot be described."""
+    if not process_flow_id:
+        return None
+    description = describe_registered_process_flow(process_flow_id)
+    if description is None:
+        if image_store.get(process_flow_id) is None:
+            raise HTTPException(status_code=404, detail=f"Process flow '{process_flow_id}' not found")
+        raise HTTPException(status_code=502, detail="Process flow description could not be generated")
+    return description
+
+
+@router.post("/tasks/{task_id}/resume", response_model=TemplateResponse)
+def resume_template_filling(task_id: str, background_tasks: BackgroundTasks):
+    """Resume a crashed or failed task, retrying only unfinished templates and placeholders."""
+    task_request = task_store.get_request(task_id)
+    if task_request is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    folder_name = task_request["folder_name"]
+    folder_path = os.path.join(INPUT_FOLDER, folder_name or "")
+    if not folder_name or not os.path.isdir(folder_path):
+        raise HTTPException(status_code=404, detail=f"Folder '{folder_name}' not found in inputs")
+
+    if not task_store.reset_for_resume(task_id, TASK_ACTIVE_WINDOW_SECONDS):
+        raise HTTPException(status_code=409, detail=(
+            f"Task is still processing; it can be resumed after {TASK_ACTIVE_WINDOW_SECONDS}s without progress"
+        ))
+    print(f"[TEMPLATE FILL] Resuming task {task_id}")
+
+    dispatch_fill_task(
+        background_tasks,
+        task_id,
+        folder_path,
+        task_request["user_prompt"],
+        task_request["process_flow"],
+        task_request["selected_files"]
+    )
+
+    return TemplateResponse(
+        task_id=task_id,
+        message="Template processing resumed"
+    )
+
+
+def dispatch_fill_task(
+    background_tasks: BackgroundTasks,
     task_id: str,
     folder_path: str,
     user_prompt: str,
     process_flow: str,
-    session: Session,
     selected_files: List[str] = None
 ):
-    """Background task to process templates."""
-    print(f"[TEMPLATE PROCESSING] Starting task {task_id}")
-    try:
-        # Generate process flow description if provided
-        process_flow_description = None
-        if process_flow:
-            llm_service = LLMService()
-            process_flow_description = llm_service.generate_process_flow_description(process_flow)
+    """Hand the work to the queue workers, or process it in this API process."""
+    if TEMPLATE_FILL_MODE == "queue":
+        enqueue_fill_task(task_id, folder_path, user_prompt, process_flow, selected_files)
+    else:
+        background_tasks.add_task(
+            process_templates_background,
+            task_id,
+            folder_path,
+            user_prompt,
+            process_flow,
+            selected_files
+        )
 
-        # Get .docx files to process
-        all_docx_files = [f for f in os.listdir(folder_path) if f.endswith(".docx")]
-        
-        # Filter by selected files if provided
-        if selected_files:
-            # Check which selected files actually exist in the folder
-            existing_selected = [f for f in selected_files if f in all_docx_files]
-            missing_files = [f for f in selected_files if f not in all_docx_files]
-            
-            if existing_selected:
-                docx_files = existing_selected
-                print(f"[TEMPLATE PROCESSING] Processing {len(existing_selected)} selected files")
-            else:
-                docx_files = all_docx_files
-                print(f"[TEMPLATE PROCESSING] No selected files found, processing all {len(all_docx_files)} files")
-        else:
-            docx_files = all_docx_files
-            print(f"[TEMPLATE PROCESSING] Processing all {len(all_docx_files)} files")
-            
-        template_tasks[task_id]["files_total"] = len(docx_files)
 
-        # Send initial call log
+@router.get("/progress/{task_id}")
+async def get_template_progress(
+    task_id: str,
+    wait: float = 0,
+    since: Optional[int] = None,
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """Get progress of template processing task.
+
+    ``wait`` long-polls up to that many seconds until the version differs from
+    ``since`` (or the If-None-Match ETag); ``since`` also limits ``files`` and
+    ``generated_files`` to the ones changed after that version.
+    """
+    # Weak and strong tags of the same version are equivalent for this comparison
+    etag_version = None
+    if if_none_match:
         try:
-            log_data = {
-                "type": "call_log",
-                "service": "template_processor",
-                "message": f"Starting to process {len(docx_files)} template files",
-                "logType": "info"
-            }
-            broadcast_progress_update_sync(task_id, log_data)
-        except Exception as ws_error:
-            print(f"[TEMPLATE PROCESSING] WebSocket error (start): {ws_error}")
-
-        # Process each template
-        for file_name in docx_files:
-            
-            # Send call log for file start
-            try:
-                log_data = {
-                    "type": "call_log",
-                    "service": "template_processor",
-                    "message": f"Processing template: {file_name}",
-                    "logType": "info"
-                }
-                broadcast_progress_update_sync(task_id, log_data)
-            except Exception as ws_error:
-                print(f"[TEMPLATE PROCESSING] WebSocket error (start): {ws_error}")
-            
-            try:
-                file_path = os.path.join(folder_path, file_name)
-                doc = Document(file_path)
-                placeholders = extract_placeholders(doc)
-                filler = TemplateFiller(task_id=task_id)
-
-                # Create retrieve function with context
-                def retrieve_fn(ph, context_type):
-                    return retrieve_placeholder_content(
-                        ph,
-                        context_type,
-                        session,
-                        user_prompt=user_prompt,
-                        process_flow=process_flow_description,
-                        task_id=task_id
-                    )
-
-                # Fill placeholders
-                filled_doc = filler.fill_placeholders(doc, placeholders, retrieve_fn)
-
-                # Save filled document
-                output_filename = f"filled_{file_name}"
-                output_path = os.path.join(GENERATED_FOLDER, output_filename)
-                filled_doc.save(output_path)
-
-                # Update task progress
-                template_tasks[task_id]["files_done"] += 1
-                # URL encode the filename for proper download URL
-                from urllib.parse import quote
-                encoded_filename = quote(output_filename)
-                template_tasks[task_id]["generated_files"].append({
-                    "fileName": output_filename,
-                    "status": "done",
-                    "downloadUrl": f"/api/template/download/{encoded_filename}"
-                })
-                
-                # Send file completion update (legacy support)
-                file_update = {
-                    "fileName": output_filename,
-                    "status": "done",
-                    "downloadUrl": f"/api/template/download/{encoded_filename}",
-                    "filesDone": template_tasks[task_id]["files_done"],
-                    "filesTotal": template_tasks[task_id]["files_total"]
-                }
-                
-                # Send call log for file completion
-                try:
-                    log_data = {
-                        "type": "call_log",
-                        "service": "template_processor",
-                        "message": f"Completed: {output_filename}",
-                        "logType": "success"
-                    }
-                    broadcast_progress_update_sync(task_id, log_data)
-                    
-                    # Send file update for download functionality
-                    broadcast_progress_update_sync(task_id, file_update)
-                except Exception as ws_error:
-                    print(f"[TEMPLATE PROCESSING] WebSocket error: {ws_error}")
-
-            except Exception as e:
-                print(f"Error processing {file_name}: {e}")
-                template_tasks[task_id]["generated_files"].append({
-                    "fileName": file_name,
-                    "status": "error",
-                    "downloadUrl": None
-                })
+            etag_version = int(if_none_match.strip().removeprefix("W/").strip('"'))
+        except ValueError:
+            etag_version = None
+    known = since if since is not None else etag_version
 
-        # Send final completion message
-        try:
-            final_message = f"Template processing completed successfully! Generated {len(template_tasks[task_id]['generated_files'])} files."
-            final_response = {
-                "type": "final_response",
-                "message": final_message
-            }
-            broadcast_progress_update_sync(task_id, final_response)
-        except Exception as ws_error:
-            print(f"[TEMPLATE PROCESSING] WebSocket error (final): {ws_error}")
-
-        # Mark task as completed
-        template_tasks[task_id]["status"] = "completed"
-        print(f"[TEMPLATE PROCESSING] Task {task_id} completed successfully")
+    version = await run_in_threadpool(task_store.get_version, task_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Task not found")
 
-    except Exception as e:
-        template_tasks[task_id]["status"] = "error"
-        print(f"[TEMPLATE PROCESSING] Background task error: {e}")
-        import traceback
-        traceback.print_exc()
+    deadline = time.monotonic() + min(max(wait, 0), PROGRESS_MAX_WAIT_SECONDS)
+    while version == known and time.monotonic() < deadline:
+        await asyncio.sleep(PROGRESS_WAIT_POLL_SECONDS)
+        version = await run_in_threadpool(task_store.get_version, task_id)
+        if version is None:
+            raise HTTPException(status_code=404, detail="Task not found")
 
+    etag = f'"{version}"'
+    if etag_version == version:
+        return Response(status_code=304, headers={"ETag": etag})
 
-@router.get("/progress/{task_id}")
-def get_template_progress(task_id: str):
-    """Get progress of template processing task."""
-    if task_id not in template_tasks:
+    task = await run_in_threadpool(task_store.get_task, task_id, since)
+    if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
-    
-    task = template_tasks[task_id]
-    return {
+
+    return JSONResponse({
         "task_id": task_id,
         "status": task["status"],
+        "version": task["version"],
         "files_done": task["files_done"],
         "files_total": task["files_total"],
-        "generated_files": task["generated_files"]
-    }
+        "generated_files": task["generated_files"],
+        "files": task["files"]
+    }, headers={"ETag": f'"{task["version"]}"', "Cache-Control": "no-cache"})
+
+
+@router.get("/tasks/{task_id}/bundle")
+async def download_task_bundle(task_id: str, follow: bool = True):
+    """Stream a ZIP of a task's generated files without building it on disk.
+
+    With ``follow`` (default) the archive stays open while the task is still
+    processing and each template is added as soon as it is done.
+    """
+    if await run_in_threadpool(task_store.get_version, task_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    return StreamingResponse(
+        stream_zip(iter_bundle_entries(task_id, follow)),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{task_id}.zip"'}
+    )
+
+
+async def iter_bundle_entries(task_id: str, follow: bool):
+    """Yield (archive name, path) of finished templates, waiting for new ones while following."""
+    added = set()
+    version = None
+    idle_since = time.monotonic()
+    while True:
+        task = await run_in_threadpool(task_store.get_task, task_id)
+        if task is None:
+            return
+        for generated in task["generated_files"]:
+            file_name = generated["fileName"]
+            if generated["status"] != "done" or file_name in added:
+                continue
+            record = await run_in_threadpool(generated_files.get, file_name)
+            # Only files this task wrote, never a same-named output of another task
+            if record is not None and record.task_id == task_id:
+                added.add(file_name)
+                yield os.path.basename(file_name), generated_files.resolve(record)
+
+        if not follow or task["status"] != "processing":
+            return
+        # Give up on tasks that stopped making progress, closing the archive with what is there
+        if task["version"] != version:
+            version, idle_since = task["version"], time.monotonic()
+        elif time.monotonic() - idle_since > BUNDLE_IDLE_TIMEOUT_SECONDS:
+            print(f"[BUNDLE] Task {task_id} made no progress, closing the archive")
+            return
+        await asyncio.sleep(PROGRESS_WAIT_POLL_SECONDS)
 
 
 @router.get("/download/{filename:path}")
-def download_generated_file(filename: str):
-    """Download a generated template file."""
-    from urllib.parse import unquote
-    
+def download_generated_file(filename: str, request: Request):
+    """Download a generated template file.
+
+    Served from the generated file manifest with ETag / Last-Modified
+    validation and single byte-range requests.
+    """
     # Decode URL-encoded filename
     decoded_filename = unquote(filename)
-    
-    # Try multiple possible paths
-    possible_paths = [
-        os.path.join(GENERATED_FOLDER, decoded_filename),  # Local path
-        os.path.join("/app/generated", decoded_filename),   # Docker path
-        os.path.join("./generated", decoded_filename),      # Relative path
-        os.path.join("../generated", decoded_filename),     # Parent relative path
-        os.path.join("/app", "generated", decoded_filename), # Alternative Docker path
-    ]
-    
-    print(f"[DOWNLOAD] Requested filename: {filename}")
-    print(f"[DOWNLOAD] Decoded filename: {decoded_filename}")
-    
-    # Check each possible path
-    file_path = None
-    for path in possible_paths:
-        print(f"[DOWNLOAD] Checking path: {path} - Exists: {os.path.exists(path)}")
-        if os.path.exists(path):
-            file_path = path
-            break
-    
-    # List all files in possible generated folders for debugging
-    for folder_path in [GENERATED_FOLDER, "/app/generated", "./generated", "../generated"]:
-        if os.path.exists(folder_path):
-            try:
-                generated_files = os.listdir(folder_path)
-                print(f"[DOWNLOAD] Available files in {folder_path}: {generated_files}")
-            except Exception as e:
-                print(f"[DOWNLOAD] Error listing {folder_path}: {e}")
-    
-    if not file_path:
-        available_paths = []
-        for folder_path in [GENERATED_FOLDER, "/app/generated", "./generated", "../generated"]:
-            if os.path.exists(folder_path):
-                available_paths.append(folder_path)
-        raise HTTPException(
-            status_code=404, 
-            detail=f"File not found: {decoded_filename}. Searched paths: {possible_paths}. Available folders: {available_paths}"
+
+    record = generated_files.get(decoded_filename)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"File not found: {decoded_filename}")
+
+    file_path = generated_files.resolve(record)
+    etag = f'"{record.sha256}"'
+    modified_at = record.modified_at
+    if modified_at.tzinfo is None:
+        modified_at = modified_at.replace(tzinfo=timezone.utc)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(modified_at, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "no-cache",
+    }
+
+    if not_modified(request, etag, modified_at):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = parse_range(request, etag, record.size)
+    if byte_range == "unsatisfiable":
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{record.size}"})
+    if byte_range is not None:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{record.size}"
+        headers["Content-Length"] = str(end - start + 1)
+        headers["Content-Disposition"] = f"attachment; filename*=utf-8''{quote(os.path.basename(decoded_filename))}"
+        return StreamingResponse(
+            read_file_range(file_path, start, end),
+            status_code=206,
+            media_type=DOCX_MEDIA_TYPE,
+            headers=headers
         )
-    
-    from fastapi.responses import FileResponse
-    print(f"[DOWNLOAD] Serving file from: {file_path}")
+
     return FileResponse(
         path=file_path,
-        filename=decoded_filename,
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        filename=os.path.basename(decoded_filename),
+        media_type=DOCX_MEDIA_TYPE,
+        headers=headers
     )
 
 
+def not_modified(request: Request, etag: str, modified_at: datetime) -> bool:
+    """Evaluate If-None-Match, then If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return modified_at.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(request: Request, etag: str, size: int):
+    """Return (start, end) of a single "bytes=" range, None to send everything, or "unsatisfiable"."""
+    range_header = request.headers.get("range")
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() != etag:
+        return None
+
+    first, _, last = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        return "unsatisfiable"
+    return start, end
+
+
+def read_file_range(file_path: str, start: int, end: int, chunk_size: int = 64 * 1024):
+    """Yield the bytes start..end (inclusive) of a file."""
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
 @router.get("/list-templates/{folder_name}")
 def list_template_files(folder_name: str):
     """List all available template files in a package."""
@@ -321,11 +417,20 @@ def list_template_files(folder_name: str):
             file_path = os.path.join(folder_path, file)
             if os.path.isfile(file_path):
                 stat = os.stat(file_path)
+                try:
+                    plan = fill_plan_cache.get(file_path)
+                    placeholder_count = len(plan.placeholders)
+                    unique_placeholder_count = len(set(plan.placeholders))
+                except Exception as e:
+                    print(f"[LIST TEMPLATES] Could not compile fill plan for {file}: {e}")
+                    placeholder_count = unique_placeholder_count = None
                 file_info.append({
                     "filename": file,
                     "size_bytes": stat.st_size,
                     "size_mb": round(stat.st_size / (1024 * 1024), 2),
-                    "modified": stat.st_mtime
+                    "modified": stat.st_mtime,
+                    "placeholder_count": placeholder_count,
+                    "unique_placeholder_count": unique_placeholder_count
                 })
         
         return {
@@ -340,68 +445,37 @@ def list_template_files(folder_name: str):
 @router.get("/test-download")
 def test_download():
     """Test endpoint to check download functionality."""
-    import glob
-    
-    # Check all possible generated folders
-    possible_folders = [
-        GENERATED_FOLDER,
-        "/app/generated",
-        "./generated", 
-        "../generated",
-        "/app/generated"
-    ]
-    
-    result = {}
-    for folder in possible_folders:
-        if os.path.exists(folder):
-            try:
-                files = os.listdir(folder)
-                result[folder] = {
-                    "exists": True,
-                    "files": files,
-                    "count": len(files)
-                }
-            except Exception as e:
-                result[folder] = {
-                    "exists": True,
-                    "error": str(e)
-                }
-        else:
-            result[folder] = {"exists": False}
-    
+    total, _ = generated_files.list(limit=0)
     return {
         "message": "Download test results",
-        "folders": result,
-        "generated_folder_config": GENERATED_FOLDER
+        "generated_folder_config": GENERATED_FOLDER,
+        "generated_folder_exists": os.path.isdir(GENERATED_FOLDER),
+        "indexed_files": total
     }
 
 
 @router.get("/list-generated")
-def list_generated_files():
-    """List all generated files in the generated folder."""
-    if not os.path.exists(GENERATED_FOLDER):
-        return {"message": "Generated folder does not exist", "files": []}
-    
-    try:
-        files = os.listdir(GENERATED_FOLDER)
-        file_info = []
-        for file in files:
-            file_path = os.path.join(GENERATED_FOLDER, file)
-            if os.path.isfile(file_path):
-                stat = os.stat(file_path)
-                file_info.append({
-                    "filename": file,
-                    "size_bytes": stat.st_size,
-                    "size_mb": round(stat.st_size / (1024 * 1024), 2),
-                    "download_url": f"/api/template/download/{file}"
-                })
-        
-        return {
-            "message": f"Found {len(file_info)} generated files",
-            "files": file_info
+def list_generated_files(offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    """List generated files from the manifest, one page at a time."""
+    total, records = generated_files.list(offset, limit)
+    file_info = [
+        {
+            "filename": record.name,
+            "size_bytes": record.size,
+            "size_mb": round(record.size / (1024 * 1024), 2),
+            "sha256": record.sha256,
+            "modified": record.modified_at.isoformat(),
+            "download_url": f"/api/template/download/{quote(record.name)}"
         }
-    except Exception as e:
-        return {"error": f"Error listing files: {str(e)}"}
+        for record in records
+    ]
+    return {
+        "message": f"Found {total} generated files",
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "files": file_info
+    }
 
 
 @router.post("/test-fill")
@@ -416,6 +490,9 @@ def test_template_fill(
     if not os.path.exists(folder_path) or not os.path.isdir(folder_path):
         raise HTTPException(status_code=404, detail=f"Folder '{folder_name}' not found in inputs")
 
+    # Outside the try below, so unknown ids stay a 404 instead of becoming a 500
+    process_flow_description = resolve_process_flow_id(request.process_flow_id)
+
     try:
         # Get all .docx files in folder
         docx_files = [f for f in os.listdir(folder_path) if f.endswith(".docx")]
@@ -427,41 +504,44 @@ def test_template_fill(
         file_name = docx_files[0]
         file_path = os.path.join(folder_path, file_name)
         doc = Document(file_path)
-        placeholders = extract_placeholders(doc)
+        plan = fill_plan_cache.get(file_path, doc)
         
         # Generate process flow description if provided
-        process_flow_description = None
-        if request.process_flow:
+        if request.process_flow and not process_flow_description:
             llm_service = LLMService()
             process_flow_description = llm_service.generate_process_flow_description(request.process_flow)
 
         # Create retrieve function with context
-        def retrieve_fn(ph, context_type):
+        def generate_fn(ph, context_type):
             return retrieve_placeholder_content(
                 ph,
                 context_type,
                 session,
                 user_prompt=request.user_prompt,
-                process_flow=process_flow_description
+                process_flow=process_flow_description,
+                folder=folder_name
             )
 
+        memo = PlaceholderMemo(request.user_prompt, process_flow_description)
+        retrieve_fn = memo.wrap(generate_fn)
+
         # Fill placeholders
         filler = TemplateFiller()
-        filled_doc = filler.fill_placeholders(doc, placeholders, retrieve_fn)
+        filled_doc = filler.fill_from_plan(doc, plan, retrieve_fn)
 
         # Save filled document
         output_filename = f"test_filled_{file_name}"
-        output_path = os.path.join(GENERATED_FOLDER, output_filename)
-        filled_doc.save(output_path)
+        generated_files.save(filled_doc, output_filename)
 
         # URL encode the filename for proper download URL
-        from urllib.parse import quote
         encoded_filename = quote(output_filename)
         
         return {
             "message": f"Successfully processed {file_name}",
             "output_file": output_filename,
-            "placeholders_found": len(placeholders),
+            "placeholders_found": len(plan.placeholders),
+            "llm_calls": memo.misses,
+            "llm_calls_saved": memo.hits,
             "download_url": f"/api/template/download/{encoded_filename}"
         }
 
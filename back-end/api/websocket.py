@@ -2,71 +2,318 @@
 WebSocket endpoints for real-time progress updates.
 """
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import Dict, List
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
 import json
 import asyncio
+from utils.config import (
+    PROGRESS_FLUSH_SECONDS,
+    PROGRESS_QUEUE_MAX,
+    EVENT_HISTORY_SIZE,
+    EVENT_HISTORY_TASKS,
+    WS_SEND_QUEUE_SIZE,
+    WS_SEND_TIMEOUT_SECONDS,
+)
 
 router = APIRouter(prefix="/api/ws", tags=["websocket"])
 
+# Sequence counters are a few bytes, keep them for this many times more tasks than event buffers
+SEQUENCES_PER_BUFFER = 50
+
+
+class Subscriber:
+    """One WebSocket with its bounded outbound queue and writer task."""
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer = None
+
 
 class ConnectionManager:
-    """Manages WebSocket connections."""
+    """Manages WebSocket connections.
+
+    Each connection has its own writer task, so a stalled client never
+    delays the others: a message is serialized once and queued to every
+    subscriber, and a subscriber whose queue is full or whose send times
+    out is dropped.
+    """
     
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+    def __init__(self, queue_size: int = WS_SEND_QUEUE_SIZE, send_timeout: float = WS_SEND_TIMEOUT_SECONDS):
+        self.active_connections: Dict[str, Dict[WebSocket, Subscriber]] = {}
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.evicted = 0
 
     async def connect(self, websocket: WebSocket, task_id: str):
         """Accept a WebSocket connection for a specific task."""
         await websocket.accept()
-        if task_id not in self.active_connections:
-            self.active_connections[task_id] = []
-        self.active_connections[task_id].append(websocket)
+        self.subscribe(websocket, task_id)
+
+    def subscribe(self, websocket: WebSocket, task_id: str) -> Subscriber:
+        """Register an accepted connection and start its writer."""
+        subscriber = Subscriber(websocket, self.queue_size)
+        subscriber.writer = asyncio.create_task(self._write(task_id, subscriber))
+        self.active_connections.setdefault(task_id, {})[websocket] = subscriber
+        return subscriber
 
     def disconnect(self, websocket: WebSocket, task_id: str):
-        """Remove a WebSocket connection."""
-        if task_id in self.active_connections:
-            self.active_connections[task_id].remove(websocket)
-            if not self.active_connections[task_id]:
-                del self.active_connections[task_id]
+        """Remove a WebSocket connection; safe to call more than once."""
+        subscribers = self.active_connections.get(task_id)
+        if not subscribers:
+            return None
+        subscriber = subscribers.pop(websocket, None)
+        if not subscribers:
+            del self.active_connections[task_id]
+        if subscriber is not None and subscriber.writer is not asyncio.current_task():
+            subscriber.writer.cancel()
+        return subscriber
 
     async def send_progress_update(self, task_id: str, message: dict):
-        """Send progress update to all connections for a task."""
-        if task_id in self.active_connections:
-            for connection in self.active_connections[task_id]:
-                try:
-                    await connection.send_text(json.dumps(message))
-                except:
-                    # Remove dead connections
-                    self.active_connections[task_id].remove(connection)
+        """Queue a progress update to all connections for a task without waiting for sends."""
+        subscribers = self.active_connections.get(task_id)
+        if not subscribers:
+            return
+        text = json.dumps(message)
+        # Iterate over a copy, evictions change the dict
+        for subscriber in list(subscribers.values()):
+            try:
+                subscriber.queue.put_nowait(text)
+            except asyncio.QueueFull:
+                self.evict(task_id, subscriber, "outbound queue full")
+
+    def evict(self, task_id: str, subscriber: Subscriber, reason: str):
+        """Drop a slow or dead consumer and close its socket in the background."""
+        if self.disconnect(subscriber.websocket, task_id) is None:
+            return
+        self.evicted += 1
+        print(f"[WEBSOCKET] Dropping subscriber of task {task_id}: {reason}")
+        asyncio.create_task(self._close(subscriber.websocket))
+
+    async def _write(self, task_id: str, subscriber: Subscriber):
+        while True:
+            text = await subscriber.queue.get()
+            try:
+                await asyncio.wait_for(subscriber.websocket.send_text(text), self.send_timeout)
+            except asyncio.TimeoutError:
+                self.evict(task_id, subscriber, "send timed out")
+                return
+            except Exception as e:
+                self.evict(task_id, subscriber, f"send failed: {e}")
+                return
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=1008), self.send_timeout)
+        except Exception:
+            pass
 
 
 manager = ConnectionManager()
 
 
+class EventHistory:
+    """Bounded per-task ring buffers of sent events, for replay to late joiners.
+
+    Events get a per-task sequence number; only the last ``size`` events of
+    the ``max_tasks`` most recently active tasks are kept. Sequence numbers
+    are remembered for many more tasks than buffers, so a task whose buffer
+    was dropped keeps counting up and clients do not discard its new events.
+    """
+
+    def __init__(self, size: int = EVENT_HISTORY_SIZE, max_tasks: int = EVENT_HISTORY_TASKS):
+        self.size = size
+        self.max_tasks = max_tasks
+        self.max_sequences = max_tasks * SEQUENCES_PER_BUFFER
+        self.tasks: "OrderedDict[str, deque]" = OrderedDict()
+        self.last_seq: "OrderedDict[str, int]" = OrderedDict()
+
+    def record(self, task_id: str, update_data: dict) -> dict:
+        """Number an event and keep it; returns the numbered copy to send."""
+        seq = self.last_seq.get(task_id, 0) + 1
+        event = dict(update_data, seq=seq)
+        events = self.tasks.get(task_id)
+        if events is None:
+            events = self.tasks[task_id] = deque(maxlen=self.size)
+            if len(self.tasks) > self.max_tasks:
+                self.tasks.popitem(last=False)
+        self.tasks.move_to_end(task_id)
+        events.append(event)
+        self.last_seq[task_id] = seq
+        self.last_seq.move_to_end(task_id)
+        if len(self.last_seq) > self.max_sequences:
+            self.last_seq.popitem(last=False)
+        return event
+
+    def since(self, task_id: str, seq: int):
+        """Events after ``seq``, and whether older ones were already dropped."""
+        events = self.tasks.get(task_id, ())
+        replay = [event for event in events if event["seq"] > seq]
+        if events:
+            missed = events[0]["seq"] > seq + 1
+        else:
+            # The buffer is gone but the task did send events after seq
+            missed = self.last_seq.get(task_id, 0) > seq
+        return replay, missed
+
+
+history = EventHistory()
+
+
 @router.websocket("/progress/{task_id}")
-async def websocket_progress(websocket: WebSocket, task_id: str):
-    """WebSocket endpoint for real-time progress updates."""
-    await manager.connect(websocket, task_id)
+async def websocket_progress(websocket: WebSocket, task_id: str, since: Optional[int] = None):
+    """WebSocket endpoint for real-time progress updates.
+
+    With ``since=<seq>`` the events after that sequence number are replayed
+    in one batch frame before the live events.
+    """
+    await websocket.accept()
+    # No await between subscribing and queueing the replay, so no live event is lost or reordered
+    subscriber = manager.subscribe(websocket, task_id)
+    if since is not None:
+        replay, missed = history.since(task_id, since)
+        subscriber.queue.put_nowait(json.dumps({
+            "type": "batch",
+            "replay": True,
+            "missed": missed,
+            "events": replay
+        }))
     
     try:
         while True:
             # Keep connection alive
             await websocket.receive_text()
-    except WebSocketDisconnect:
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: the socket was closed on our side after an eviction
+        pass
+    finally:
         manager.disconnect(websocket, task_id)
 
 
+class ProgressEventBus:
+    """Hands progress events from worker threads to the server event loop.
+
+    Producers only append to a deque (atomic, never blocks the template
+    threads). A single consumer task on the server loop drains it every
+    PROGRESS_FLUSH_SECONDS, coalesces repeated file updates and sends each
+    task's events as one frame.
+    """
+
+    def __init__(self, max_pending: int = PROGRESS_QUEUE_MAX, flush_seconds: float = PROGRESS_FLUSH_SECONDS):
+        # Oldest events are dropped rather than blocking workers when the loop falls behind
+        self.events = deque(maxlen=max_pending)
+        self.flush_seconds = flush_seconds
+        self.loop = None
+        self.consumer = None
+        self._wakeup = None
+        self._wakeup_scheduled = False
+        # Where events go in processes without a server loop (fill workers), None drops them
+        self.forward = None
+
+    def start(self):
+        """Start the consumer on the running event loop."""
+        self.loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self.consumer = self.loop.create_task(self._consume())
+
+    async def stop(self):
+        """Flush pending events and stop the consumer."""
+        if self.consumer is None:
+            return
+        self.consumer.cancel()
+        try:
+            await self.consumer
+        except asyncio.CancelledError:
+            pass
+        await self.flush()
+        self.consumer = None
+        self.loop = None
+
+    def publish(self, task_id: str, update_data: dict):
+        """Queue an event from any thread; without a server loop it goes to ``forward``."""
+        loop = self.loop
+        if loop is None:
+            if self.forward is not None:
+                self.forward(task_id, update_data)
+            return
+        self.events.append((task_id, update_data))
+        # One wakeup per batch instead of one cross-thread call per event
+        if not self._wakeup_scheduled:
+            self._wakeup_scheduled = True
+            try:
+                loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                # Loop closed during shutdown
+                pass
+
+    async def _consume(self):
+        while True:
+            await self._wakeup.wait()
+            # Let rapid events accumulate into one frame
+            await asyncio.sleep(self.flush_seconds)
+            self._wakeup.clear()
+            self._wakeup_scheduled = False
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[WEBSOCKET] Progress flush failed: {e}")
+
+    def drain(self) -> Dict[str, List[dict]]:
+        """Take all queued events, grouped by task and coalesced."""
+        batches: Dict[str, Dict[object, dict]] = {}
+        while True:
+            try:
+                task_id, update_data = self.events.popleft()
+            except IndexError:
+                break
+            events = batches.setdefault(task_id, {})
+            key = coalesce_key(update_data)
+            if key is None:
+                key = len(events)
+            else:
+                # Keep only the latest state, at the position of the latest update
+                events.pop(key, None)
+            events[key] = update_data
+        return {task_id: list(events.values()) for task_id, events in batches.items()}
+
+    async def flush(self):
+        """Send every queued event, one frame per task."""
+        for task_id, events in self.drain().items():
+            events = [history.record(task_id, event) for event in events]
+            frame = events[0] if len(events) == 1 else {"type": "batch", "events": events}
+            await manager.send_progress_update(task_id, frame)
+
+
+def coalesce_key(update_data: dict):
+    """Events with the same key supersede each other within a batch."""
+    if update_data.get("fileName") and update_data.get("type") is None:
+        return ("file", update_data["fileName"])
+    return None
+
+
+progress_bus = ProgressEventBus()
+
+
 async def broadcast_progress_update(task_id: str, update_data: dict):
     """Broadcast progress update to all connected clients for a task."""
     await manager.send_progress_update(task_id, update_data)
 
 
 def broadcast_progress_update_sync(task_id: str, update_data: dict):
-    """Synchronous version of broadcast progress update."""
-    import asyncio
-    try:
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(manager.send_progress_update(task_id, update_data))
-    except RuntimeError:
-        # If no event loop is running, create a new one
-        asyncio.run(manager.send_progress_update(task_id, update_data))
+    """Queue a progress update from a worker thread; it is sent by the server loop."""
+    progress_bus.publish(task_id, update_data)
+
+
+def send_call_log(task_id: str, service: str, message: str, log_type: str = 'info'):
+    """Send a call log via WebSocket."""
+    if task_id:
+        try:
+            log_data = {
+                "type": "call_log",
+                "service": service,
+                "message": message,
+                "logType": log_type
+            }
+            broadcast_progress_update_sync(task_id, log_data)
+        except Exception as e:
+            print(f"Failed to send call log: {e}")
@@ -0,0 +1,103 @@
+"""
+Benchmark placeholder location on a large synthetic template.
+
+Compares python-docx proxy traversal with the XPath traversal engine, and
+the legacy paragraph x placeholder substring scan with the single-pass
+PlaceholderMatcher, on a ~500 page document with thousands of table cells.
+
+    python benchmarks/placeholder_matcher_benchmark.py
+"""
+import sys
+import time
+from pathlib import Path
+
+# Add the back-end directory to Python path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from docx import Document
+from parsers.docx_parser import PLACEHOLDER_PATTERN, PlaceholderMatcher, iter_paragraph_refs, paragraph_text
+
+PAGES = 500
+PARAGRAPHS_PER_PAGE = 30
+TABLES = 100
+TABLE_ROWS = 10
+TABLE_COLS = 5
+
+
+def build_template():
+    """Build a synthetic template with section and table placeholders."""
+    doc = Document()
+    counter = 0
+    for page in range(PAGES):
+        for line in range(PARAGRAPHS_PER_PAGE):
+            if line % 5 == 0:
+                doc.add_paragraph(f"Section {page}.{line}: <Describe requirement {counter}>")
+                counter += 1
+            else:
+                doc.add_paragraph(f"Static boilerplate text for page {page}, line {line}.")
+    for t in range(TABLES):
+        table = doc.add_table(rows=TABLE_ROWS, cols=TABLE_COLS)
+        for r, row in enumerate(table.rows):
+            for c, cell in enumerate(row.cells):
+                if c == 0:
+                    cell.text = f"Row {t}.{r}"
+                else:
+                    cell.text = f"<Cell value {t}.{r}.{c}> and <Owner {c}>"
+    return doc
+
+
+def iter_paragraphs(doc_or_cell):
+    for para in doc_or_cell.paragraphs:
+        yield para
+    for table in doc_or_cell.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                yield from iter_paragraphs(cell)
+
+
+def legacy_locate(texts, placeholders):
+    """Paragraph x placeholder scan, stopping at the first match."""
+    occurrences = {}
+    for i, text in enumerate(texts):
+        for ph in placeholders:
+            if f"<{ph}>" in text:
+                occurrences[i] = [ph]
+                break
+    return occurrences
+
+
+def main():
+    doc = build_template()
+
+    start = time.perf_counter()
+    legacy_texts = [para.text for para in iter_paragraphs(doc)]
+    legacy_traversal_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    texts = [paragraph_text(ref.element) for ref in iter_paragraph_refs(doc)]
+    traversal_time = time.perf_counter() - start
+
+    print(f"Proxy traversal: {legacy_traversal_time:8.3f}s, {len(legacy_texts)} paragraphs visited")
+    print(f"XPath traversal: {traversal_time:8.3f}s, {len(texts)} paragraphs visited")
+    placeholders = [ph for text in texts for ph in PLACEHOLDER_PATTERN.findall(text)]
+    print(f"Paragraphs: {len(texts)}, table cells: {TABLES * TABLE_ROWS * TABLE_COLS}, "
+          f"placeholders: {len(placeholders)} ({len(set(placeholders))} unique)")
+
+    start = time.perf_counter()
+    legacy = legacy_locate(texts, placeholders)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matcher = PlaceholderMatcher(placeholders)
+    occurrences = matcher.index(texts)
+    matcher_time = time.perf_counter() - start
+
+    legacy_found = sum(len(found) for found in legacy.values())
+    matcher_found = sum(len(found) for found in occurrences.values())
+    print(f"Legacy scan:     {legacy_time:8.3f}s, {legacy_found} placeholder occurrences located")
+    print(f"Matcher:         {matcher_time:8.3f}s, {matcher_found} placeholder occurrences located")
+    print(f"Speedup:         {legacy_time / matcher_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
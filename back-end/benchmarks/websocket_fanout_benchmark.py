@@ -0,0 +1,111 @@
+"""
+Benchmark WebSocket progress fan-out with thousands of subscribers on one task.
+
+Compares the legacy sequential send loop with the ConnectionManager's
+per-connection writers. A few subscribers stall on every send, like a
+frozen browser tab; the rest have a small network delay.
+
+    python benchmarks/websocket_fanout_benchmark.py
+"""
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+# Add the back-end directory to Python path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from api.websocket import ConnectionManager
+
+SUBSCRIBERS = 5000
+STALLED = 5
+MESSAGES = 5
+SEND_DELAY = 0.0005
+SEND_TIMEOUT = 0.5
+
+
+class FakeWebSocket:
+    """Counts received frames; stalled sockets never finish a send."""
+
+    def __init__(self, stalled: bool = False):
+        self.stalled = stalled
+        self.received = 0
+
+    async def send_text(self, text: str):
+        await asyncio.sleep(3600 if self.stalled else SEND_DELAY)
+        self.received += 1
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def make_sockets():
+    return [FakeWebSocket(stalled=i < STALLED) for i in range(SUBSCRIBERS)]
+
+
+async def wait_delivered(sockets, timeout: float):
+    """Wait until every healthy socket got all messages, return the elapsed time."""
+    start = time.perf_counter()
+    healthy = [ws for ws in sockets if not ws.stalled]
+    while any(ws.received < MESSAGES for ws in healthy):
+        if time.perf_counter() - start > timeout:
+            break
+        await asyncio.sleep(0.01)
+    return sum(ws.received for ws in healthy)
+
+
+async def legacy_fanout(sockets, message: dict):
+    """Original loop: one awaited send after another, json.dumps per connection."""
+    for connection in sockets:
+        try:
+            await asyncio.wait_for(connection.send_text(json.dumps(message)), SEND_TIMEOUT)
+        except Exception:
+            pass
+
+
+async def bench_legacy():
+    sockets = make_sockets()
+    start = time.perf_counter()
+    for i in range(MESSAGES):
+        await legacy_fanout(sockets, {"type": "call_log", "message": f"event {i}"})
+    delivered = await wait_delivered(sockets, timeout=0)
+    return time.perf_counter() - start, delivered
+
+
+async def bench_manager():
+    sockets = make_sockets()
+    manager = ConnectionManager(queue_size=MESSAGES * 2, send_timeout=SEND_TIMEOUT)
+    for ws in sockets:
+        manager.subscribe(ws, "task")
+
+    start = time.perf_counter()
+    for i in range(MESSAGES):
+        await manager.send_progress_update("task", {"type": "call_log", "message": f"event {i}"})
+    publish = time.perf_counter() - start
+    delivered = await wait_delivered(sockets, timeout=30)
+    elapsed = time.perf_counter() - start
+
+    # Let the stalled sends time out and be evicted
+    await asyncio.sleep(SEND_TIMEOUT * 2)
+    evicted = manager.evicted
+    for ws in list(manager.active_connections.get("task", {})):
+        manager.disconnect(ws, "task")
+    return elapsed, publish, delivered, evicted
+
+
+async def main():
+    expected = (SUBSCRIBERS - STALLED) * MESSAGES
+    print(f"{SUBSCRIBERS} subscribers ({STALLED} stalled), {MESSAGES} messages, "
+          f"{SEND_DELAY * 1000:.1f} ms per send, {SEND_TIMEOUT}s send timeout\n")
+
+    legacy_time, legacy_delivered = await bench_legacy()
+    print(f"Legacy sequential:  {legacy_time:8.2f}s  delivered {legacy_delivered}/{expected}")
+
+    elapsed, publish, delivered, evicted = await bench_manager()
+    print(f"Concurrent writers: {elapsed:8.2f}s  delivered {delivered}/{expected}  "
+          f"(publish {publish * 1000:.1f} ms, evicted {evicted} stalled subscribers)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -4,9 +4,13 @@ Main FastAPI application with refactored structure.
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from utils.database import init_db
+from utils.task_store import task_store
+from services.generated_files import generated_files
 from api.pdf_routes import router as pdf_router
 from api.template_routes import router as template_router
-from api.websocket import router as websocket_router
+from api.websocket import router as websocket_router, progress_bus
+from services.progress_relay import progress_relay
+from utils.config import TEMPLATE_FILL_MODE
 
 # Create FastAPI app
 app = FastAPI(
@@ -28,6 +32,22 @@ app.add_middleware(
 @app.on_event("startup")
 def on_startup():
     init_db()
+    task_store.collect_garbage()
+    added, removed = generated_files.sync()
+    print(f"[GENERATED FILES] Manifest synced: {added} files indexed, {removed} stale entries removed")
+
+# Progress events from template threads are sent by a consumer on the server loop
+@app.on_event("startup")
+async def start_progress_bus():
+    progress_bus.start()
+    # Fill workers write their events to the database, every API process relays them to its clients
+    if TEMPLATE_FILL_MODE == "queue":
+        progress_relay.start_reader(progress_bus)
+
+@app.on_event("shutdown")
+async def stop_progress_bus():
+    await progress_relay.stop_reader()
+    await progress_bus.stop()
 
 # Include routers
 app.include_router(pdf_router)
@@ -2,8 +2,284 @@
 DOCX parsing and processing utilities.
 """
 import re
+from copy import deepcopy
 from docx import Document
-from typing import List
+from docx.oxml import OxmlElement
+from docx.oxml.ns import nsmap, qn
+from lxml import etree
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+PLACEHOLDER_PATTERN = re.compile(r"<(.*?)>")
+
+NAMESPACES = {
+    "w": nsmap["w"],
+    "mc": "http://schemas.openxmlformats.org/markup-compatibility/2006",
+}
+
+# mc:Fallback holds a legacy copy of textbox content, skip it so each paragraph is visited once
+PARAGRAPH_XPATH = etree.XPath(".//w:p[not(ancestor::mc:Fallback)]", namespaces=NAMESPACES)
+TABLE_XPATH = etree.XPath(".//w:tbl[not(ancestor::mc:Fallback)]", namespaces=NAMESPACES)
+TABLE_PARAGRAPH_XPATH = etree.XPath(".//w:tc//w:p[not(ancestor::mc:Fallback)]", namespaces=NAMESPACES)
+TEXT_XPATH = etree.XPath(
+    "./w:r/w:t | ./w:hyperlink/w:r/w:t | ./w:ins/w:r/w:t | ./w:smartTag/w:r/w:t | ./w:fldSimple/w:r/w:t",
+    namespaces=NAMESPACES,
+)
+
+
+class ParagraphRef(NamedTuple):
+    """A paragraph element located by the traversal engine."""
+    index: int
+    element: etree._Element
+    context_type: str  # "table" or "section"
+    table_index: Optional[int]  # innermost table in document order, None outside tables
+
+
+def iter_paragraph_refs(doc: Document) -> List[ParagraphRef]:
+    """Walk every body paragraph exactly once, in document order.
+
+    Works on the body XML directly instead of python-docx table/row/cell
+    proxies, so horizontally merged cells are not visited repeatedly and
+    the table context is known without per-paragraph parent lookups.
+    """
+    body = doc.element.body
+    paragraphs = PARAGRAPH_XPATH(body)
+
+    # Tables come back in document order, so inner tables overwrite their outer table
+    table_of = {}
+    for table_index, table in enumerate(TABLE_XPATH(body)):
+        for p in TABLE_PARAGRAPH_XPATH(table):
+            table_of[p] = table_index
+
+    refs = []
+    for i, p in enumerate(paragraphs):
+        table_index = table_of.get(p)
+        context_type = "section" if table_index is None else "table"
+        refs.append(ParagraphRef(i, p, context_type, table_index))
+    return refs
+
+
+def paragraph_elements(doc: Document) -> list:
+    """Return the body paragraph elements in the same order as iter_paragraph_refs."""
+    return PARAGRAPH_XPATH(doc.element.body)
+
+
+def paragraph_style(p) -> Optional[str]:
+    """Return the style id of a paragraph element, if any."""
+    style = p.find(qn("w:pPr") + "/" + qn("w:pStyle"))
+    return style.get(qn("w:val")) if style is not None else None
+
+
+def paragraph_text(p) -> str:
+    """Return the run text of a paragraph element."""
+    return "".join(t.text or "" for t in TEXT_XPATH(p))
+
+
+def replace_placeholders(p, answers: Dict[str, str]) -> int:
+    """Replace placeholders in a paragraph element, keeping runs and formatting.
+
+    Placeholders may be split across several ``w:t`` nodes. Only the matched
+    span is rewritten. A multi-paragraph answer splits ``p`` at the
+    placeholder: its first paragraph goes in place, the middle ones become new
+    ``w:p`` elements with cloned paragraph and run properties, and the last one
+    starts the paragraph that holds the text following the placeholder. A
+    section break (``w:sectPr``) of ``p`` moves to the last of these
+    paragraphs, so the section still ends after the answer.
+    Returns the number of replacements.
+    """
+    nodes = TEXT_XPATH(p)
+    texts = [t.text or "" for t in nodes]
+    starts = []
+    offset = 0
+    for text in texts:
+        starts.append(offset)
+        offset += len(text)
+
+    matches = [m for m in PLACEHOLDER_PATTERN.finditer("".join(texts)) if m.group(1) in answers]
+    if not matches:
+        return 0
+
+    paragraph_props = p.find(qn("w:pPr"))
+    cloned_props = _without_section(paragraph_props)
+    last_p = None
+    # Work backwards so offsets of earlier matches stay valid and split-off tails stay in order
+    for m in reversed(matches):
+        answer_paragraphs = [a.strip() for a in (answers[m.group(1)] or "").split("\n\n") if a.strip()]
+        first = _node_at(starts, texts, m.start())
+        last = _node_at(starts, texts, m.end() - 1)
+        run_props = nodes[first].getparent().find(qn("w:rPr"))
+
+        if len(answer_paragraphs) > 1:
+            # Everything after the placeholder moves to a new paragraph behind the last answer paragraph
+            tail_p = _split_paragraph(p, nodes[last], m.end() - starts[last], cloned_props)
+            tail_p.insert(1 if cloned_props is not None else 0, _answer_run(answer_paragraphs[-1], run_props))
+            p.addnext(tail_p)
+            if last_p is None:
+                last_p = tail_p
+            anchor = p
+            for text in answer_paragraphs[1:-1]:
+                new_p = OxmlElement("w:p")
+                if cloned_props is not None:
+                    new_p.append(deepcopy(cloned_props))
+                new_p.append(_answer_run(text, run_props))
+                anchor.addnext(new_p)
+                anchor = new_p
+
+        _replace_span(nodes, starts, first, last, m.start(), m.end(), answer_paragraphs[0] if answer_paragraphs else "")
+
+    section = paragraph_props.find(qn("w:sectPr")) if paragraph_props is not None else None
+    if last_p is not None and section is not None:
+        # Same position as in the original properties, which the clone mirrors apart from sectPr
+        position = paragraph_props.index(section)
+        last_p.find(qn("w:pPr")).insert(position, section)
+
+    return len(matches)
+
+
+def _without_section(paragraph_props):
+    """Copy of paragraph properties without a section break, or None."""
+    if paragraph_props is None:
+        return None
+    props = deepcopy(paragraph_props)
+    for section in props.findall(qn("w:sectPr")):
+        props.remove(section)
+    return props
+
+
+def _answer_run(text: str, run_props):
+    """A run holding answer text with cloned run properties."""
+    run = OxmlElement("w:r")
+    if run_props is not None:
+        run.append(deepcopy(run_props))
+    _append_run_text(run, text)
+    return run
+
+
+def _split_paragraph(p, t, offset: int, paragraph_props):
+    """Move the content of p after character offset of text node t into a new, detached w:p.
+
+    Runs and wrappers (hyperlinks, insertions) cut by the split are cloned
+    with their properties, so the moved text keeps its formatting.
+    """
+    tail = None
+    rest = (t.text or "")[offset:]
+    if rest:
+        tail = deepcopy(t)
+        tail.text = rest
+        _preserve_space(tail)
+    t.text = (t.text or "")[:offset]
+
+    node = t
+    while node.getparent() is not p:
+        parent = node.getparent()
+        clone = deepcopy(parent)
+        for child in list(clone):
+            if child.tag != qn("w:rPr"):
+                clone.remove(child)
+        if tail is not None:
+            clone.append(tail)
+        for sibling in list(node.itersiblings()):
+            clone.append(sibling)
+        # Nothing of this run or wrapper follows the split
+        if any(child.tag != qn("w:rPr") for child in clone):
+            tail = clone
+        node = parent
+
+    new_p = OxmlElement("w:p")
+    if paragraph_props is not None:
+        new_p.append(deepcopy(paragraph_props))
+    if tail is not None:
+        new_p.append(tail)
+    for sibling in list(node.itersiblings()):
+        new_p.append(sibling)
+    return new_p
+
+
+def _node_at(starts: List[int], texts: List[str], position: int) -> int:
+    """Index of the text node holding the character at position."""
+    for i in range(len(starts) - 1, -1, -1):
+        if starts[i] <= position and texts[i]:
+            return i
+    return 0
+
+
+def _replace_span(nodes, starts, first: int, last: int, start: int, end: int, text: str):
+    """Replace the [start, end) character span spread over nodes[first..last]."""
+    head = nodes[first]
+    local_start = start - starts[first]
+    local_end = end - starts[last]
+    if first == last:
+        head.text = head.text[:local_start] + text + head.text[local_end:]
+    else:
+        tail = nodes[last]
+        head.text = head.text[:local_start] + text
+        for node in nodes[first + 1:last]:
+            node.text = ""
+        tail.text = tail.text[local_end:]
+        _preserve_space(tail)
+    _preserve_space(head)
+    if "\n" in text or "\t" in text:
+        _split_special_characters(head)
+
+
+def _split_special_characters(t):
+    """Turn newlines and tabs inside a w:t into w:br / w:tab siblings in the same run."""
+    pieces = re.split(r"(\n|\t)", t.text)
+    t.text = pieces[0]
+    anchor = t
+    for piece in pieces[1:]:
+        if piece == "\n":
+            element = OxmlElement("w:br")
+        elif piece == "\t":
+            element = OxmlElement("w:tab")
+        elif piece:
+            element = OxmlElement("w:t")
+            element.text = piece
+            _preserve_space(element)
+        else:
+            continue
+        anchor.addnext(element)
+        anchor = element
+
+
+def _append_run_text(run, text: str):
+    """Append text to a run element, mapping newlines and tabs to w:br / w:tab."""
+    for piece in re.split(r"(\n|\t)", text):
+        if piece == "\n":
+            run.append(OxmlElement("w:br"))
+        elif piece == "\t":
+            run.append(OxmlElement("w:tab"))
+        elif piece:
+            t = OxmlElement("w:t")
+            t.text = piece
+            _preserve_space(t)
+            run.append(t)
+
+
+def _preserve_space(t):
+    """Keep leading and trailing whitespace of a w:t node."""
+    t.set(qn("xml:space"), "preserve")
+
+
+class PlaceholderMatcher:
+    """Compiled matcher that locates every known placeholder in a single pass."""
+
+    def __init__(self, placeholders: Iterable[str]):
+        self.placeholders = set(placeholders)
+
+    def find(self, text: str) -> List[str]:
+        """Return the known placeholders in text, in order of appearance."""
+        if "<" not in text:
+            return []
+        return [m.group(1) for m in PLACEHOLDER_PATTERN.finditer(text) if m.group(1) in self.placeholders]
+
+    def index(self, texts: Iterable[str]) -> Dict[int, List[str]]:
+        """Map paragraph position to the placeholders it contains."""
+        occurrences = {}
+        for i, text in enumerate(texts):
+            found = self.find(text)
+            if found:
+                occurrences[i] = found
+        return occurrences
 
 
 class DOCXParser:
@@ -13,19 +289,8 @@ class DOCXParser:
     def extract_placeholders(doc: Document) -> List[str]:
         """Extract all placeholders from document including tables."""
         placeholders = []
-
-        def iter_paragraphs(doc_or_cell):
-            for para in doc_or_cell.paragraphs:
-                yield para
-            for table in doc_or_cell.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        yield from iter_paragraphs(cell)
-
-        for para in iter_paragraphs(doc):
-            matches = re.findall(r"<(.*?)>", para.text)
-            placeholders.extend(matches)
-
+        for ref in iter_paragraph_refs(doc):
+            placeholders.extend(PLACEHOLDER_PATTERN.findall(paragraph_text(ref.element)))
         return placeholders
 
     @staticmethod
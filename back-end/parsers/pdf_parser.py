@@ -1,9 +1,11 @@
 """
 PDF parsing service using LlamaParse.
 """
+import asyncio
 import re
 from llama_cloud_services import LlamaParse
 from utils.config import LLAMAPARSE_API_KEY
+from services.image_store import image_store
 
 
 class PDFParser:
@@ -34,16 +36,14 @@ class PDFParser:
             for image in page.images:
                 try:
                     image_data = await result.aget_image_data(image.name)
-                    import base64
-                    image_b64 = base64.b64encode(image_data).decode("utf-8")
-                    image_list.append({
-                        "filename": image.name,
-                        "mime": "image/" + str(image.name).split(".")[-1],
-                        "base64": image_b64
-                    })
-                    num_images += 1
                 except Exception as e:
                     print(f"Failed to fetch image {image.name}: {e}")
+                    continue
+                # Stored right away, pages only keep the hash
+                entry = await asyncio.to_thread(image_store.put_extracted, image.name, image_data)
+                if entry is not None:
+                    image_list.append(entry)
+                    num_images += 1
 
             table_list = []
             for item in page.items:
@@ -0,0 +1,98 @@
+"""
+Standalone template fill worker.
+
+Claims jobs from the Postgres work queue and fills templates outside the
+API process. Start as many workers as needed, on any host that can reach
+the database and shares the inputs/generated folders:
+
+    TEMPLATE_FILL_MODE=queue python run_worker.py --threads 2
+"""
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+
+# Add the current directory to Python path
+current_dir = Path(__file__).parent
+sys.path.insert(0, str(current_dir))
+
+from utils.database import init_db
+from utils.config import JOB_POLL_SECONDS, JOB_MAX_ATTEMPTS
+from utils.task_store import task_store
+from services.job_queue import job_queue
+from services.fill_tasks import JOB_HANDLERS
+from services.progress_relay import progress_relay
+from api.websocket import progress_bus
+
+
+def work(worker_id: str, stop: threading.Event):
+    """Claim and run jobs until stopped."""
+    while not stop.is_set():
+        try:
+            job = job_queue.claim(worker_id)
+        except Exception as e:
+            print(f"[WORKER {worker_id}] Failed to claim job: {e}")
+            stop.wait(JOB_POLL_SECONDS)
+            continue
+
+        if job is None:
+            stop.wait(JOB_POLL_SECONDS)
+            continue
+
+        print(f"[WORKER {worker_id}] Running {job.kind} job {job.id} for task {job.task_id}")
+        try:
+            # Long templates renew the lease so they are not handed to a second worker
+            with job_queue.keep_alive(job.id, worker_id):
+                JOB_HANDLERS[job.kind](job.task_id, job_queue.payload(job))
+            if not job_queue.complete(job.id, worker_id):
+                print(f"[WORKER {worker_id}] Job {job.id} finished after its lease was lost")
+        except Exception as e:
+            traceback.print_exc()
+            if not job_queue.fail(job.id, worker_id, str(e)):
+                task_store.set_status(job.task_id, "error")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Template fill worker")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("WORKER_THREADS", "1")))
+    args = parser.parse_args()
+
+    init_db()
+    # No WebSocket clients here, progress events reach them through the API processes
+    progress_bus.forward = progress_relay.publish
+    progress_relay.start_writer()
+    worker_prefix = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    print(f"🚀 Starting template fill worker {worker_prefix} with {args.threads} thread(s)")
+
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=work, args=(f"{worker_prefix}-{i}", stop), daemon=True)
+        for i in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            requeued, failed_tasks = job_queue.requeue_stale()
+            if requeued:
+                print(f"[WORKER] Requeued {requeued} stale jobs")
+            for task_id in failed_tasks:
+                print(f"[WORKER] Stale job of task {task_id} failed after {JOB_MAX_ATTEMPTS} attempts")
+                task_store.set_status(task_id, "error")
+            time.sleep(60)
+    except KeyboardInterrupt:
+        print("Stopping worker...")
+        stop.set()
+        for thread in threads:
+            thread.join()
+        progress_relay.stop_writer()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Answers of previous fills, reused when a template or request is filled again.
+
+Snapshots are only valid for the PDF corpus they were generated from: the
+corpus version changes whenever a PDF is uploaded or deleted.
+"""
+import hashlib
+import json
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from sqlmodel import Session, select, delete
+from utils.database import engine
+from utils.models import PDFS, TemplateSnapshot, SpeculativeAnswer, RetrievalCache, utc_now
+
+
+def corpus_version() -> str:
+    """Version of the uploaded PDF corpus, derived from the stored PDF ids."""
+    with Session(engine) as session:
+        pdf_uuids = sorted(session.exec(select(PDFS.pdf_uuid)).all())
+    return hashlib.sha256(json.dumps(pdf_uuids).encode("utf-8")).hexdigest()
+
+
+def answer_key(ph: str, context_type: str, user_prompt: str = "", process_flow: str = "") -> str:
+    """Key of a placeholder answer for a request.
+
+    Pre-generated drafts use the key without user prompt and process flow,
+    so every fill on the same corpus can find them.
+    """
+    raw = json.dumps([ph, context_type, user_prompt or "", process_flow or ""])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class RetrievedChunk(NamedTuple):
+    """A cached retrieval hit, shaped like the retriever's scored nodes."""
+    text: str
+    metadata: dict
+    score: float
+
+
+class AnswerStore:
+    """Per-template placeholder -> answer snapshots of the last successful fill."""
+
+    def load_snapshot(self, template_key: str, corpus_version: str) -> Dict[str, str]:
+        """Answers of the previous fill, or nothing if the corpus has changed since."""
+        with Session(engine) as session:
+            snapshot = session.get(TemplateSnapshot, template_key)
+        if snapshot is None or snapshot.corpus_version != corpus_version:
+            return {}
+        return json.loads(snapshot.answers)
+
+    def save_snapshot(self, template_key: str, content_hash: str, corpus_version: str, answers: Dict[str, str]):
+        """Replace the snapshot of a template with the answers of this fill."""
+        try:
+            with Session(engine) as session:
+                snapshot = session.get(TemplateSnapshot, template_key) or TemplateSnapshot(template_key=template_key)
+                snapshot.content_hash = content_hash
+                snapshot.corpus_version = corpus_version
+                snapshot.answers = json.dumps(answers)
+                snapshot.updated_at = utc_now()
+                session.add(snapshot)
+                session.commit()
+        except Exception as e:
+            # Snapshots are only an optimisation, a concurrent writer winning is fine
+            print(f"[ANSWER STORE] Could not save snapshot for {template_key}: {e}")
+
+    def load_speculative_answers(self, answer_keys: Iterable[str], corpus_version: str) -> Dict[str, str]:
+        """Pre-generated drafts on this corpus for the given prompt-free answer keys."""
+        answer_keys = list(answer_keys)
+        if not answer_keys:
+            return {}
+        with Session(engine) as session:
+            rows = session.exec(
+                select(SpeculativeAnswer)
+                .where(SpeculativeAnswer.corpus_version == corpus_version)
+                .where(SpeculativeAnswer.answer_key.in_(answer_keys))
+            ).all()
+        return {row.answer_key: row.answer for row in rows}
+
+    def save_speculative_answer(self, answer_key: str, corpus_version: str, ph: str, context_type: str, answer: str):
+        """Store a pre-generated answer."""
+        with Session(engine) as session:
+            session.add(SpeculativeAnswer(
+                answer_key=answer_key,
+                corpus_version=corpus_version,
+                placeholder=ph,
+                context_type=context_type,
+                answer=answer
+            ))
+            session.commit()
+
+    def load_retrieval(self, query: str, corpus_version: str) -> Optional[List[RetrievedChunk]]:
+        """Cached retrieval results for a query on this corpus, or None."""
+        with Session(engine) as session:
+            row = session.exec(
+                select(RetrievalCache)
+                .where(RetrievalCache.query_key == _query_key(query))
+                .where(RetrievalCache.corpus_version == corpus_version)
+            ).first()
+        if row is None:
+            return None
+        return [RetrievedChunk(**chunk) for chunk in json.loads(row.chunks)]
+
+    def save_retrieval(self, query: str, corpus_version: str, docs) -> None:
+        """Cache the scored nodes retrieved for a query."""
+        chunks = [
+            {"text": doc.text, "metadata": dict(doc.metadata or {}), "score": doc.score}
+            for doc in docs
+        ]
+        try:
+            with Session(engine) as session:
+                session.add(RetrievalCache(
+                    query_key=_query_key(query),
+                    corpus_version=corpus_version,
+                    chunks=json.dumps(chunks)
+                ))
+                session.commit()
+        except Exception as e:
+            print(f"[ANSWER STORE] Could not cache retrieval for {query}: {e}")
+
+    def prune(self, corpus_version: str) -> None:
+        """Drop pre-generated answers and retrievals of older corpus versions."""
+        with Session(engine) as session:
+            session.exec(delete(SpeculativeAnswer).where(SpeculativeAnswer.corpus_version != corpus_version))
+            session.exec(delete(RetrievalCache).where(RetrievalCache.corpus_version != corpus_version))
+            session.commit()
+
+
+def _query_key(query: str) -> str:
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+answer_store = AnswerStore()
@@ -0,0 +1,130 @@
+"""
+Caption cache for images sent to the multimodal model.
+
+Captions are looked up by exact SHA-256 first, then by perceptual hash so a
+re-scanned, re-compressed or slightly cropped copy of an image reuses the
+description instead of costing another multimodal call.
+"""
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+from sqlmodel import Session, select
+from utils.database import engine
+from utils.models import ImageCaption
+from utils.config import IMAGE_CAPTION_MAX_DISTANCE
+from utils.image_processing import difference_hash
+
+
+class CaptionIndex:
+    """Captions of one prompt: exact lookup by SHA-256 and a perceptual hash list."""
+
+    def __init__(self):
+        self.by_hash: Dict[str, str] = {}
+        self.phashes: List[Tuple[int, str]] = []
+
+    def add(self, image_hash: str, phash: int, caption: str):
+        self.by_hash.setdefault(image_hash, caption)
+        self.phashes.append((phash, caption))
+
+    def nearest(self, phash: int) -> Tuple[int, Optional[str]]:
+        """Hamming distance and caption of the closest image."""
+        best_distance, best_caption = 65, None
+        for cached_phash, caption in self.phashes:
+            distance = bin(phash ^ cached_phash).count("1")
+            if distance < best_distance:
+                best_distance, best_caption = distance, caption
+        return best_distance, best_caption
+
+
+class CaptionCache:
+    """Image -> caption per prompt, shared by every process through the database."""
+
+    def __init__(self, max_distance: int = IMAGE_CAPTION_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        # Loaded from the database on first use of a prompt
+        self._indexes: Dict[str, CaptionIndex] = {}
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def prompt_key(prompt: str) -> str:
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    def get(self, data: bytes, prompt: str, image_hash: str = None, similar: bool = True) -> Optional[str]:
+        """Caption of this image, or of a perceptually similar one, for the same prompt.
+
+        ``similar=False`` only accepts the exact same image bytes.
+        """
+        image_hash = image_hash or hashlib.sha256(data).hexdigest()
+        index = self._index(self.prompt_key(prompt))
+
+        caption = index.by_hash.get(image_hash)
+        if caption is not None:
+            self.exact_hits += 1
+            return caption
+
+        if similar and self.max_distance > 0 and index.phashes:
+            distance, caption = index.nearest(difference_hash(data))
+            if distance <= self.max_distance:
+                self.similar_hits += 1
+                return caption
+
+        self.misses += 1
+        return None
+
+    def lookup(self, image_hash: str, prompt: str) -> Optional[str]:
+        """Caption stored for exactly this image hash, without the image bytes."""
+        caption = self._index(self.prompt_key(prompt)).by_hash.get(image_hash)
+        if caption is None:
+            # Another process may have captioned it since the index was loaded
+            with Session(engine) as session:
+                caption = session.exec(
+                    select(ImageCaption.caption)
+                    .where(ImageCaption.image_hash == image_hash, ImageCaption.prompt_key == self.prompt_key(prompt))
+                ).first()
+        return caption
+
+    def put(self, data: bytes, prompt: str, caption: str, image_hash: str = None):
+        """Remember the caption generated for an image."""
+        image_hash = image_hash or hashlib.sha256(data).hexdigest()
+        prompt_key = self.prompt_key(prompt)
+        phash = difference_hash(data)
+        with Session(engine) as session:
+            session.add(ImageCaption(
+                image_hash=image_hash,
+                prompt_key=prompt_key,
+                phash=f"{phash:016x}",
+                caption=caption
+            ))
+            session.commit()
+        index = self._index(prompt_key)
+        with self._lock:
+            index.add(image_hash, phash, caption)
+
+    def summary(self) -> str:
+        """Human readable summary of the cache usage."""
+        return (
+            f"{self.exact_hits} identical and {self.similar_hits} similar images reused a caption, "
+            f"{self.misses} captioned"
+        )
+
+    def _index(self, prompt_key: str) -> CaptionIndex:
+        index = self._indexes.get(prompt_key)
+        if index is not None:
+            return index
+        with Session(engine) as session:
+            rows = session.exec(
+                select(ImageCaption.image_hash, ImageCaption.phash, ImageCaption.caption)
+                .where(ImageCaption.prompt_key == prompt_key)
+                .order_by(ImageCaption.id)
+            ).all()
+        loaded = CaptionIndex()
+        for image_hash, phash, caption in rows:
+            loaded.add(image_hash, int(phash, 16), caption)
+        with self._lock:
+            return self._indexes.setdefault(prompt_key, loaded)
+
+
+caption_cache = CaptionCache()
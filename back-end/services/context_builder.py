@@ -0,0 +1,176 @@
+"""
+Token-budgeted assembly of the retrieved chunks that go into a prompt.
+
+Every PDF contributes its own top hits and neighbouring chunks overlap by
+the splitter's 50 tokens, so the raw retrieval for a large corpus is long
+and repetitive. Chunks below RETRIEVAL_MIN_SCORE are dropped, duplicates
+and overlapping neighbours are merged, and the rest is added best score
+first until the context type's token budget is spent.
+"""
+import re
+import threading
+from typing import List, NamedTuple
+from utils.config import CONTEXT_TOKEN_BUDGETS, RETRIEVAL_MIN_SCORE
+from utils.prompt_templates import format_retrieved_chunks
+from services.answer_store import RetrievedChunk
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    # tiktoken comes with llama-index; without it tokens are estimated
+    _encoding = None
+
+# Shortest shared text (in characters) treated as splitter overlap rather than coincidence
+MIN_OVERLAP_CHARS = 40
+
+# Budget for context types without one of their own
+DEFAULT_CONTEXT_TYPE = "section"
+
+
+def count_tokens(text: str) -> int:
+    """Prompt tokens of a text, about four characters per token without tiktoken."""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+class BuiltContext(NamedTuple):
+    text: str
+    tokens: int
+    tokens_retrieved: int
+    chunks_used: int
+    chunks_retrieved: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_retrieved - self.tokens
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def _overlap(first: str, second: str) -> int:
+    """Length of the start of second that ends first, 0 if they do not overlap."""
+    probe = second[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    start = first.find(probe, max(0, len(first) - len(second)))
+    while start != -1:
+        if second.startswith(first[start:]):
+            return len(first) - start
+        start = first.find(probe, start + 1)
+    return 0
+
+
+def _skip_normalized(text: str, count: int) -> int:
+    """Index in text just past the characters that make up its first count normalized ones."""
+    i = len(text) - len(text.lstrip())
+    for _ in range(count):
+        if i >= len(text):
+            break
+        if text[i].isspace():
+            while i < len(text) and text[i].isspace():
+                i += 1
+        else:
+            i += 1
+    return i
+
+
+def _stitch(first: str, second: str, shared: int) -> str:
+    """first followed by what second adds after its first shared normalized characters."""
+    return (first.rstrip() + second[_skip_normalized(second, shared):]).rstrip()
+
+
+def merge_chunks(chunks: List[RetrievedChunk]) -> List[RetrievedChunk]:
+    """Drop duplicate and contained chunks and stitch overlapping neighbours together.
+
+    Chunks are compared with whitespace normalized, the merged text keeps the
+    original line breaks so markdown tables stay intact. A merged chunk keeps
+    the best score of its parts.
+    """
+    merged: List[RetrievedChunk] = []
+    normalized: List[str] = []
+    for chunk in chunks:
+        text = _normalize(chunk.text)
+        if not text:
+            continue
+        chunk_type = (chunk.metadata or {}).get("type")
+        for i, other in enumerate(merged):
+            if (other.metadata or {}).get("type") != chunk_type:
+                continue
+            other_text = normalized[i]
+            if text in other_text:
+                combined = other.text
+            elif other_text in text:
+                combined = chunk.text.strip()
+            else:
+                shared = _overlap(other_text, text)
+                if shared:
+                    combined = _stitch(other.text, chunk.text, shared)
+                else:
+                    shared = _overlap(text, other_text)
+                    if not shared:
+                        continue
+                    combined = _stitch(chunk.text.strip(), other.text, shared)
+            merged[i] = RetrievedChunk(combined, other.metadata, max(other.score, chunk.score))
+            normalized[i] = _normalize(combined)
+            break
+        else:
+            merged.append(RetrievedChunk(chunk.text.strip(), dict(chunk.metadata or {}), chunk.score))
+            normalized.append(text)
+    return merged
+
+
+def build_context(docs, context_type: str, budget: int = None) -> BuiltContext:
+    """Formatted retrieved chunks that fit the token budget, by default the context type's."""
+    if budget is None:
+        budget = CONTEXT_TOKEN_BUDGETS.get(context_type, CONTEXT_TOKEN_BUDGETS[DEFAULT_CONTEXT_TYPE])
+    chunks = [RetrievedChunk(doc.text, doc.metadata or {}, doc.score or 0.0) for doc in docs]
+    tokens_retrieved = count_tokens(format_retrieved_chunks(chunks))
+
+    ranked = sorted(chunks, key=lambda c: c.score, reverse=True)
+    # The best hit is always kept so a low-scoring corpus still gives the model something
+    relevant = ranked[:1] + [c for c in ranked[1:] if c.score >= RETRIEVAL_MIN_SCORE]
+    candidates = sorted(merge_chunks(relevant), key=lambda c: c.score, reverse=True)
+
+    selected = []
+    used = 0
+    for chunk in candidates:
+        # Separator tokens between chunks are small enough to ignore
+        tokens = count_tokens(format_retrieved_chunks([chunk]))
+        if selected and used + tokens > budget:
+            continue
+        selected.append(chunk)
+        used += tokens
+
+    text = format_retrieved_chunks(selected)
+    return BuiltContext(text, count_tokens(text), tokens_retrieved, len(selected), len(chunks))
+
+
+class ContextUsage:
+    """Task-wide totals of the prompt tokens retrieved and actually sent."""
+
+    def __init__(self):
+        self.tokens_retrieved = 0
+        self.tokens_used = 0
+        self.prompts = 0
+        self._lock = threading.Lock()
+
+    def add(self, context: BuiltContext):
+        with self._lock:
+            self.tokens_retrieved += context.tokens_retrieved
+            self.tokens_used += context.tokens
+            self.prompts += 1
+
+    def summary(self) -> str:
+        """Human readable summary of the context tokens saved."""
+        saved = self.tokens_retrieved - self.tokens_used
+        percent = 100 * saved / self.tokens_retrieved if self.tokens_retrieved else 0
+        return (
+            f"Context of {self.prompts} prompts: {self.tokens_used} tokens sent, "
+            f"{saved} of {self.tokens_retrieved} retrieved tokens saved ({percent:.0f}%)"
+        )
@@ -0,0 +1,138 @@
+"""
+Precompiled template fill plans, cached on disk by template content hash.
+
+A plan records everything the filler would otherwise rediscover on every
+run: the placeholder list, the paragraph positions holding them, their
+context type (table or section) and paragraph style.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Iterable, List
+from docx import Document
+from parsers.docx_parser import PLACEHOLDER_PATTERN, iter_paragraph_refs, paragraph_style, paragraph_text
+from utils.config import FILL_PLAN_FOLDER
+
+# Bump when the plan layout changes so stale cache entries are ignored
+PLAN_VERSION = 1
+
+
+class FillPlan:
+    """Placeholder locations of one template."""
+
+    def __init__(self, content_hash: str, placeholders: List[str], locations: List[dict]):
+        self.content_hash = content_hash
+        self.placeholders = placeholders
+        self.locations = locations  # {"index", "placeholders", "context_type", "table_index", "style"}
+
+    @property
+    def occurrences(self) -> Dict[int, List[str]]:
+        """Paragraph index to placeholders, as returned by index_placeholders."""
+        return {location["index"]: location["placeholders"] for location in self.locations}
+
+    @classmethod
+    def build(cls, doc: Document, content_hash: str) -> "FillPlan":
+        """Compile the plan of an opened template."""
+        locations = []
+        for ref in iter_paragraph_refs(doc):
+            found = PLACEHOLDER_PATTERN.findall(paragraph_text(ref.element))
+            if found:
+                locations.append({
+                    "index": ref.index,
+                    "placeholders": found,
+                    "context_type": ref.context_type,
+                    "table_index": ref.table_index,
+                    "style": paragraph_style(ref.element),
+                })
+        placeholders = [ph for location in locations for ph in location["placeholders"]]
+        return cls(content_hash, placeholders, locations)
+
+    def table_batches(self, batch_size: int, exclude: Iterable[str] = ()) -> List[List[str]]:
+        """Unique placeholders of each table, in document order, split into batches of batch_size.
+
+        Placeholders in exclude are left out, they are answered one by one.
+        """
+        exclude = set(exclude)
+        tables = {}
+        for location in self.locations:
+            if location["context_type"] == "table":
+                tables.setdefault(location.get("table_index"), {}).update(
+                    dict.fromkeys(ph for ph in location["placeholders"] if ph not in exclude)
+                )
+        batches = []
+        for placeholders in tables.values():
+            placeholders = list(placeholders)
+            batches.extend(placeholders[i:i + batch_size] for i in range(0, len(placeholders), batch_size))
+        return batches
+
+    def to_dict(self) -> dict:
+        return {
+            "version": PLAN_VERSION,
+            "content_hash": self.content_hash,
+            "placeholders": self.placeholders,
+            "locations": self.locations,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FillPlan":
+        return cls(data["content_hash"], data["placeholders"], data["locations"])
+
+
+class FillPlanCache:
+    """Disk cache of fill plans keyed by content hash, with an mtime/size shortcut."""
+
+    def __init__(self, cache_dir: str = FILL_PLAN_FOLDER):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._hashes = {}  # path -> (mtime_ns, size, content_hash)
+        self._plans = {}  # content_hash -> FillPlan
+        self._lock = threading.Lock()
+
+    def content_hash(self, file_path: str) -> str:
+        """Hash of the template bytes, only recomputed when mtime or size change."""
+        stat = os.stat(file_path)
+        with self._lock:
+            cached = self._hashes.get(file_path)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        content_hash = digest.hexdigest()
+        with self._lock:
+            self._hashes[file_path] = (stat.st_mtime_ns, stat.st_size, content_hash)
+        return content_hash
+
+    def get(self, file_path: str, doc: Document = None) -> FillPlan:
+        """Return the plan of a template, compiling and caching it on first use."""
+        content_hash = self.content_hash(file_path)
+        with self._lock:
+            plan = self._plans.get(content_hash)
+        if plan is not None:
+            return plan
+
+        plan_path = os.path.join(self.cache_dir, f"{content_hash}.v{PLAN_VERSION}.json")
+        plan = None
+        if os.path.exists(plan_path):
+            try:
+                with open(plan_path, "r", encoding="utf-8") as f:
+                    plan = FillPlan.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[FILL PLAN] Ignoring unreadable plan {plan_path}: {e}")
+
+        if plan is None:
+            plan = FillPlan.build(doc if doc is not None else Document(file_path), content_hash)
+            tmp_path = f"{plan_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(plan.to_dict(), f)
+            os.replace(tmp_path, plan_path)
+
+        with self._lock:
+            self._plans[content_hash] = plan
+        return plan
+
+
+fill_plan_cache = FillPlanCache()
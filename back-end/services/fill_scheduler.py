@@ -0,0 +1,42 @@
+"""
+Per-task scheduling for filling several templates concurrently.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.config import TEMPLATE_FILL_CONCURRENCY, LLM_CALL_CONCURRENCY
+
+
+class TaskBudget:
+    """Shared limit on concurrent retrieval + LLM calls for one task."""
+
+    def __init__(self, max_calls: int = LLM_CALL_CONCURRENCY):
+        self._semaphore = threading.BoundedSemaphore(max(1, max_calls))
+
+    def wrap(self, generate_fn):
+        """Wrap a generate function so it runs within the task budget."""
+        def limited(ph, context_type):
+            with self._semaphore:
+                return generate_fn(ph, context_type)
+        return limited
+
+
+class TemplateFillScheduler:
+    """Fill the templates of one task concurrently, reporting completions in order."""
+
+    def __init__(self, max_workers: int = TEMPLATE_FILL_CONCURRENCY):
+        self.max_workers = max(1, max_workers)
+
+    def run(self, items, process_fn, on_done):
+        """
+        Run process_fn for every item on a thread pool.
+
+        on_done(item, result) is called on the calling thread in the order of
+        items, so completion events and counters stay ordered and need no lock.
+        process_fn is expected to handle its own errors and return a result.
+        """
+        if not items:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items)), thread_name_prefix="template-fill") as executor:
+            futures = [executor.submit(process_fn, item) for item in items]
+            for item, future in zip(items, futures):
+                on_done(item, future.result())
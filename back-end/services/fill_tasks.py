@@ -0,0 +1,398 @@
+"""
+Template fill task pipeline shared by the API background tasks and the queue workers.
+"""
+import os
+import traceback
+from typing import List
+from urllib.parse import quote
+from docx import Document
+from sqlmodel import Session
+from utils.database import engine
+from utils.config import (
+    FILL_FILE_RETRIES,
+    INCREMENTAL_FILL,
+    BATCH_TABLE_PLACEHOLDERS,
+    TABLE_BATCH_SIZE,
+    SPECULATIVE_FILL_SLICE,
+)
+from utils.task_store import task_store
+from services.llm_service import LLMService, PROCESS_FLOW_PROMPT
+from services.caption_cache import caption_cache
+from services.image_store import image_store
+from api.websocket import broadcast_progress_update_sync, send_call_log
+from services.fill_scheduler import TaskBudget, TemplateFillScheduler
+from services.job_queue import job_queue
+from services.fill_plan import fill_plan_cache
+from services.generated_files import generated_files, task_file_name
+from services.answer_store import answer_store, answer_key, corpus_version
+from services.generation_profiles import generation_profiles
+from services.speculative_fill import run_speculative_fill
+from services.placeholder_memo import PlaceholderMemo
+from services.template_filler import TemplateFiller, retrieve_placeholder_content, retrieve_table_batch
+
+
+def send_task_log(task_id: str, message: str, log_type: str = "info"):
+    """Send a template_processor call log for a task."""
+    send_call_log(task_id, "template_processor", message, log_type)
+
+
+def select_template_files(folder_path: str, selected_files: List[str] = None) -> List[str]:
+    """Return the .docx files of a folder, restricted to selected_files when given."""
+    all_docx_files = [f for f in os.listdir(folder_path) if f.endswith(".docx")]
+
+    # Filter by selected files if provided
+    if selected_files:
+        # Check which selected files actually exist in the folder
+        existing_selected = [f for f in selected_files if f in all_docx_files]
+
+        if existing_selected:
+            print(f"[TEMPLATE PROCESSING] Processing {len(existing_selected)} selected files")
+            return existing_selected
+        print(f"[TEMPLATE PROCESSING] No selected files found, processing all {len(all_docx_files)} files")
+        return all_docx_files
+
+    print(f"[TEMPLATE PROCESSING] Processing all {len(all_docx_files)} files")
+    return all_docx_files
+
+
+def describe_process_flow(task_id: str, process_flow: str):
+    """Generate the process flow description once per task and checkpoint it.
+
+    Tasks created from a registered process flow id already carry their description.
+    """
+    stored = task_store.get_request(task_id)
+    if stored and stored["process_flow_description"]:
+        return stored["process_flow_description"]
+    if not process_flow:
+        return None
+    llm_service = LLMService()
+    description = llm_service.generate_process_flow_description(process_flow)
+    if description is None:
+        # Not checkpointed, a resumed task tries again
+        print(f"[TEMPLATE PROCESSING] Process flow description failed for task {task_id}, filling without it")
+        return None
+    task_store.set_process_flow_description(task_id, description)
+    return description
+
+
+def describe_registered_process_flow(process_flow_id: str):
+    """Description of a process flow registered through /process-flow.
+
+    None if the id is unknown or the description could not be generated.
+    """
+    description = caption_cache.lookup(process_flow_id, PROCESS_FLOW_PROMPT)
+    if description:
+        return description
+    blob = image_store.get(process_flow_id)
+    if blob is None:
+        return None
+    return LLMService().generate_process_flow_description(blob.data)
+
+
+def prepare_task_files(task_id: str, folder_path: str, selected_files: List[str] = None) -> List[str]:
+    """Record the templates of a task and return the ones still to fill."""
+    docx_files = select_template_files(folder_path, selected_files)
+    task_store.set_files(task_id, docx_files)
+    pending = task_store.pending_files(task_id)
+    if len(pending) < len(docx_files):
+        send_task_log(task_id, f"Resuming task: {len(docx_files) - len(pending)} templates already done")
+    send_task_log(task_id, f"Starting to process {len(pending)} template files")
+    return pending
+
+
+def fill_template_file(
+    task_id: str,
+    folder_path: str,
+    file_name: str,
+    memo: PlaceholderMemo,
+    budget: TaskBudget,
+    corpus: str = None
+) -> dict:
+    """Fill one template and save it to the generated folder.
+
+    With a corpus version, drafts pre-generated after the last PDF upload and,
+    with INCREMENTAL_FILL, answers from the previous fill of this template are
+    reused so only new or edited placeholders are generated. Drafts are used
+    as is for requests without user prompt and process flow, and refined with
+    them otherwise.
+    """
+    task_store.mark_file(task_id, file_name, "processing")
+    send_task_log(task_id, f"Processing template: {file_name}")
+
+    folder_name = os.path.basename(os.path.normpath(folder_path))
+    drafts = {}
+
+    # Answers are memoized, so a retry only regenerates the placeholders that failed
+    for attempt in range(1 + FILL_FILE_RETRIES):
+        if attempt:
+            send_task_log(task_id, f"Retrying template: {file_name} (attempt {attempt + 1})", "warning")
+        try:
+            # Sessions are not thread-safe, so each template gets its own
+            with Session(engine) as file_session:
+                # Create retrieve function with context
+                def generate_fn(ph, context_type):
+                    return retrieve_placeholder_content(
+                        ph,
+                        context_type,
+                        file_session,
+                        user_prompt=memo.user_prompt,
+                        process_flow=memo.process_flow,
+                        task_id=task_id,
+                        corpus=corpus,
+                        context_usage=memo.context_usage,
+                        folder=folder_name,
+                        draft=drafts.get(answer_key(ph, context_type))
+                    )
+
+                def generate_batch_fn(placeholders, context_type):
+                    return retrieve_table_batch(
+                        placeholders,
+                        file_session,
+                        user_prompt=memo.user_prompt,
+                        process_flow=memo.process_flow,
+                        task_id=task_id,
+                        corpus=corpus,
+                        context_usage=memo.context_usage,
+                        folder=folder_name
+                    )
+
+                retrieve_fn = memo.wrap(budget.wrap(generate_fn))
+
+                file_path = os.path.join(folder_path, file_name)
+                doc = Document(file_path)
+                plan = fill_plan_cache.get(file_path, doc)
+                filler = TemplateFiller(task_id=task_id)
+
+                template_key = f"{folder_name}/{file_name}"
+                template_keys = {
+                    memo.key(ph, location["context_type"])
+                    for location in plan.locations
+                    for ph in location["placeholders"]
+                }
+                if corpus:
+                    draft_keys = {
+                        answer_key(ph, location["context_type"]): memo.key(ph, location["context_type"])
+                        for location in plan.locations
+                        for ph in location["placeholders"]
+                    }
+                    drafts = answer_store.load_speculative_answers(draft_keys, corpus)
+                    if memo.user_prompt or memo.process_flow:
+                        if drafts and not attempt:
+                            send_task_log(task_id, f"Refining {len(drafts)} pre-generated drafts for {file_name}")
+                    else:
+                        speculative = memo.seed({draft_keys[key]: draft for key, draft in drafts.items()})
+                        if speculative and not attempt:
+                            send_task_log(task_id, f"Using {speculative} pre-generated answers for {file_name}")
+                if corpus and INCREMENTAL_FILL:
+                    previous = answer_store.load_snapshot(template_key, corpus)
+                    memo.seed({key: answer for key, answer in previous.items() if key in template_keys})
+                    if previous and not attempt:
+                        reused = len(template_keys & previous.keys())
+                        send_task_log(
+                            task_id,
+                            f"Incremental fill of {file_name}: {reused} placeholders reused, "
+                            f"{len(template_keys) - reused} new or changed"
+                        )
+
+                # Cells of the same table are answered together, the rest falls back to single calls
+                if BATCH_TABLE_PLACEHOLDERS:
+                    batch_fn = budget.wrap(generate_batch_fn)
+                    # Drafts to refine and placeholders with a profile of their own need single calls
+                    single = {
+                        ph for ph in plan.placeholders
+                        if answer_key(ph, "table") in drafts or generation_profiles.has_placeholder_settings(folder_name, ph)
+                    }
+                    for placeholders in plan.table_batches(max(1, TABLE_BATCH_SIZE), exclude=single):
+                        try:
+                            memo.generate_batch(placeholders, "table", batch_fn)
+                        except Exception as e:
+                            print(f"Batched table fill failed for {file_name}, answering individually: {e}")
+
+                # Fill placeholders
+                filled_doc = filler.fill_from_plan(doc, plan, retrieve_fn)
+
+            if filler.failed_placeholders:
+                print(f"Error processing {file_name}: {len(filler.failed_placeholders)} placeholders failed")
+                continue
+
+            # Save filled document
+            output_filename = task_file_name(task_id, f"filled_{file_name}")
+            generated_files.save(filled_doc, output_filename, task_id=task_id)
+
+            if corpus and INCREMENTAL_FILL:
+                answers = {key: memo.answers[key] for key in template_keys if key in memo.answers}
+                answer_store.save_snapshot(template_key, plan.content_hash, corpus, answers)
+            return {"status": "done", "fileName": output_filename}
+
+        except Exception as e:
+            print(f"Error processing {file_name}: {e}")
+
+    return {"status": "error", "fileName": file_name}
+
+
+def record_template_result(task_id: str, file_name: str, result: dict):
+    """Persist a finished template and send its completion events."""
+    if result["status"] != "done":
+        task_store.mark_file(task_id, file_name, "error")
+        return
+
+    output_filename = result["fileName"]
+
+    # URL encode the filename for proper download URL
+    encoded_filename = quote(output_filename)
+    download_url = f"/api/template/download/{encoded_filename}"
+    task_store.mark_file(task_id, file_name, "done", output_file_name=output_filename, download_url=download_url)
+    task = task_store.get_task(task_id)
+
+    display_name = os.path.basename(output_filename)
+    send_task_log(task_id, f"Completed: {display_name}", "success")
+
+    # Send file update for download functionality
+    send_progress_update(task_id, {
+        "fileName": display_name,
+        "status": "done",
+        "downloadUrl": download_url,
+        "filesDone": task["files_done"],
+        "filesTotal": task["files_total"]
+    })
+
+
+def send_progress_update(task_id: str, update: dict):
+    """Send a progress update such as a file completion or the final response."""
+    try:
+        broadcast_progress_update_sync(task_id, update)
+    except Exception as ws_error:
+        print(f"[TEMPLATE PROCESSING] WebSocket error: {ws_error}")
+
+
+def finish_task(task_id: str):
+    """Send the final completion message for a task."""
+    task = task_store.get_task(task_id)
+    final_message = f"Template processing completed successfully! Generated {len(task['generated_files'])} files."
+    send_progress_update(task_id, {
+        "type": "final_response",
+        "message": final_message
+    })
+    print(f"[TEMPLATE PROCESSING] Task {task_id} completed successfully")
+
+
+def process_templates_background(
+    task_id: str,
+    folder_path: str,
+    user_prompt: str,
+    process_flow: str,
+    selected_files: List[str] = None
+):
+    """Background task to process templates."""
+    print(f"[TEMPLATE PROCESSING] Starting task {task_id}")
+    try:
+        process_flow_description = describe_process_flow(task_id, process_flow)
+        docx_files = prepare_task_files(task_id, folder_path, selected_files)
+
+        # Each unique placeholder is generated once per task and reused across templates
+        memo = PlaceholderMemo(user_prompt, process_flow_description, task_id=task_id, checkpoint=True)
+
+        # Retrieval + LLM calls of all templates share one per-task budget
+        budget = TaskBudget()
+        corpus = corpus_version()
+
+        # Fill templates concurrently, completions are reported in file order
+        TemplateFillScheduler().run(
+            docx_files,
+            lambda file_name: fill_template_file(task_id, folder_path, file_name, memo, budget, corpus),
+            lambda file_name, result: record_template_result(task_id, file_name, result)
+        )
+
+        # Report how many LLM calls the memo saved
+        send_task_log(task_id, memo.summary())
+        print(f"[TEMPLATE PROCESSING] {memo.summary()}")
+        send_task_log(task_id, memo.context_usage.summary())
+        print(f"[TEMPLATE PROCESSING] {memo.context_usage.summary()}")
+
+        task_store.set_status(task_id, "completed")
+        finish_task(task_id)
+
+    except Exception as e:
+        task_store.set_status(task_id, "error")
+        print(f"[TEMPLATE PROCESSING] Background task error: {e}")
+        traceback.print_exc()
+
+
+def enqueue_fill_task(
+    task_id: str,
+    folder_path: str,
+    user_prompt: str,
+    process_flow: str,
+    selected_files: List[str] = None
+):
+    """Queue a fill task for the standalone workers instead of running it in-process."""
+    job_queue.enqueue(task_id, "task", {
+        "folder_path": folder_path,
+        "user_prompt": user_prompt,
+        "process_flow": process_flow,
+        "selected_files": selected_files,
+    })
+
+
+def handle_task_job(task_id: str, payload: dict):
+    """Queue job: describe the process flow and fan out one job per template."""
+    process_flow_description = describe_process_flow(task_id, payload.get("process_flow"))
+    docx_files = prepare_task_files(task_id, payload["folder_path"], payload.get("selected_files"))
+    corpus = corpus_version()
+
+    for file_name in docx_files:
+        job_queue.enqueue(task_id, "template", {
+            "folder_path": payload["folder_path"],
+            "file_name": file_name,
+            "user_prompt": payload.get("user_prompt") or "",
+            "process_flow_description": process_flow_description,
+            "corpus_version": corpus,
+        })
+
+    if not docx_files and task_store.complete_if_finished(task_id):
+        finish_task(task_id)
+
+
+def handle_template_job(task_id: str, payload: dict):
+    """Queue job: fill a single template; the last one to finish completes the task."""
+    memo = PlaceholderMemo(
+        payload.get("user_prompt"),
+        payload.get("process_flow_description"),
+        task_id=task_id,
+        checkpoint=True
+    )
+    result = fill_template_file(
+        task_id,
+        payload["folder_path"],
+        payload["file_name"],
+        memo,
+        TaskBudget(),
+        payload.get("corpus_version")
+    )
+    print(f"[TEMPLATE PROCESSING] {payload['file_name']}: {memo.context_usage.summary()}")
+    record_template_result(task_id, payload["file_name"], result)
+
+    if task_store.complete_if_finished(task_id):
+        finish_task(task_id)
+
+
+def handle_speculate_job(task_id: str, payload: dict):
+    """Queue job: pre-generate one slice of answers, then make room for user jobs.
+
+    The job never waits: when user jobs are queued or running, or the slice
+    is done, it re-enqueues itself and returns the worker.
+    """
+    finished = run_speculative_fill(
+        payload.get("corpus_version"),
+        limit=max(1, SPECULATIVE_FILL_SLICE),
+        should_yield=job_queue.has_user_work
+    )
+    if not finished:
+        job_queue.enqueue_unique(task_id, "speculate", payload)
+
+
+JOB_HANDLERS = {
+    "task": handle_task_job,
+    "template": handle_template_job,
+    "speculate": handle_speculate_job,
+}
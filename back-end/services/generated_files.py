@@ -0,0 +1,204 @@
+"""
+Manifest of generated files, maintained whenever a filled document is saved.
+
+Downloads and listings read the manifest instead of probing folders and
+listing directories; the sha256 doubles as the download ETag.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import zipfile
+from io import BytesIO
+from typing import AsyncIterable, AsyncIterator, List, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select, delete, func
+from utils.database import engine
+from utils.models import GeneratedFile, utc_now
+from utils.config import GENERATED_FOLDER
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _read_umask() -> int:
+    """The process umask; it can only be read by setting it, so this runs once at import."""
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+UMASK = _read_umask()
+
+
+def task_file_name(task_id: str, file_name: str) -> str:
+    """Manifest name of a task's output, kept in a folder of its own so tasks never overwrite each other."""
+    return f"{task_id}/{file_name}"
+
+
+def _is_safe_name(file_name: str) -> bool:
+    """Whether a name stays inside the generated folder."""
+    return (
+        bool(file_name)
+        and not os.path.isabs(file_name)
+        and os.path.normpath(file_name) == file_name
+        and file_name != ".."
+        and not file_name.startswith("../")
+    )
+
+
+class GeneratedFileIndex:
+    """Name -> path, size and hash of every file in GENERATED_FOLDER.
+
+    Names are relative paths, task outputs live in a subfolder per task.
+    """
+
+    def __init__(self, folder: str = GENERATED_FOLDER):
+        self.folder = folder
+
+    def resolve(self, record: GeneratedFile) -> str:
+        """Absolute path of an indexed file."""
+        return os.path.join(self.folder, record.path)
+
+    def save(self, doc, file_name: str, task_id: str = None) -> GeneratedFile:
+        """Save a document atomically and index it."""
+        buffer = BytesIO()
+        doc.save(buffer)
+        data = buffer.getvalue()
+
+        if not _is_safe_name(file_name):
+            raise ValueError(f"Invalid generated file name: {file_name}")
+        target = os.path.join(self.folder, file_name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+
+        # Write next to the target and rename, so downloads never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+            # mkstemp creates owner-only files, give the document the mode doc.save would have
+            os.chmod(tmp_path, 0o666 & ~UMASK)
+            os.replace(tmp_path, target)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return self._upsert(file_name, len(data), hashlib.sha256(data).hexdigest(), task_id)
+
+    def register(self, file_name: str, task_id: str = None) -> Optional[GeneratedFile]:
+        """Index a file that was written to the folder by other means."""
+        file_path = os.path.join(self.folder, file_name)
+        if not os.path.isfile(file_path):
+            return None
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return self._upsert(file_name, os.path.getsize(file_path), digest.hexdigest(), task_id)
+
+    def get(self, file_name: str) -> Optional[GeneratedFile]:
+        """Manifest entry of a file, indexing it on the fly if it predates the manifest."""
+        with Session(engine) as session:
+            record = session.get(GeneratedFile, file_name)
+        if record is not None and os.path.isfile(self.resolve(record)):
+            return record
+        if not _is_safe_name(file_name):
+            return None
+        return self.register(file_name)
+
+    def list(self, offset: int = 0, limit: int = 100) -> Tuple[int, List[GeneratedFile]]:
+        """One page of the manifest ordered by name, with the total count."""
+        with Session(engine) as session:
+            total = session.exec(select(func.count()).select_from(GeneratedFile)).one()
+            records = session.exec(
+                select(GeneratedFile).order_by(GeneratedFile.name).offset(offset).limit(limit)
+            ).all()
+        return total, list(records)
+
+    def sync(self) -> Tuple[int, int]:
+        """Index files missing from the manifest and drop entries whose file is gone."""
+        on_disk = set()
+        for root, _, names in os.walk(self.folder):
+            relative = os.path.relpath(root, self.folder)
+            for name in names:
+                if not name.endswith(".tmp"):
+                    on_disk.add(name if relative == "." else f"{relative.replace(os.sep, '/')}/{name}")
+        with Session(engine) as session:
+            indexed = set(session.exec(select(GeneratedFile.name)).all())
+            gone = indexed - on_disk
+            if gone:
+                session.exec(delete(GeneratedFile).where(GeneratedFile.name.in_(gone)))
+                session.commit()
+
+        added = 0
+        for name in on_disk - indexed:
+            if self.register(name):
+                added += 1
+        return added, len(gone)
+
+    def _upsert(self, file_name: str, size: int, sha256: str, task_id: Optional[str]) -> GeneratedFile:
+        # Two tasks filling the same template may insert the same name concurrently; the retry updates
+        for attempt in range(2):
+            try:
+                with Session(engine) as session:
+                    record = session.get(GeneratedFile, file_name) or GeneratedFile(name=file_name, path=file_name)
+                    record.size = size
+                    record.sha256 = sha256
+                    record.modified_at = utc_now()
+                    if task_id:
+                        record.task_id = task_id
+                    session.add(record)
+                    session.commit()
+                    session.refresh(record)
+                    return record
+            except IntegrityError:
+                if attempt:
+                    raise
+
+
+class ZipStream:
+    """Write-only buffer that lets ZipFile produce an archive chunk by chunk."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        """Return and forget what was written since the last drain."""
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def stream_zip(
+    entries: AsyncIterable[Tuple[str, str]], chunk_size: int = HASH_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """Yield a ZIP archive of (archive name, file path) entries without a temporary file.
+
+    Entries are consumed lazily, so the caller can keep producing them while
+    the archive is already being sent; file reads run in the default executor.
+    Documents are stored uncompressed: .docx files are zip archives already.
+    """
+    loop = asyncio.get_running_loop()
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        async for arcname, file_path in entries:
+            info = zipfile.ZipInfo.from_file(file_path, arcname)
+            with open(file_path, "rb") as src, archive.open(info, mode="w", force_zip64=True) as dest:
+                while True:
+                    chunk = await loop.run_in_executor(None, src.read, chunk_size)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    yield stream.drain()
+            yield stream.drain()
+    yield stream.drain()
+
+
+generated_files = GeneratedFileIndex()
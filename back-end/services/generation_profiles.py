@@ -0,0 +1,146 @@
+"""
+Generation limits (max tokens, stop sequences, timeout) per context type.
+
+A table cell needs a sentence, a section a few pages, so each context type
+gets its own profile instead of one worst-case max_tokens. A template
+folder can override them in a generation_profiles.json file:
+
+    {
+        "table": {"max_tokens": 300, "stop": ["\\n\\n"]},
+        "section": {"timeout": 300},
+        "placeholders": {"Scope": {"max_tokens": 6000}}
+    }
+
+With GENERATION_TUNING, max_tokens is lowered to the observed output
+lengths of the folder and context type plus headroom once enough answers
+have been seen. An answer cut off at a tuned limit is regenerated with the
+configured one.
+"""
+import json
+import math
+import os
+import threading
+from collections import deque
+from typing import List, NamedTuple, Optional
+from utils.config import (
+    INPUT_FOLDER,
+    GENERATION_PROFILES,
+    GENERATION_TUNING,
+    GENERATION_TUNE_MIN_SAMPLES,
+    GENERATION_TUNE_HEADROOM,
+    GENERATION_TUNE_WINDOW,
+)
+
+PROFILE_FILE_NAME = "generation_profiles.json"
+
+# Tuned limits never go below this, short outputs are cheap to reserve
+MIN_TUNED_MAX_TOKENS = 64
+
+
+class GenerationProfile(NamedTuple):
+    max_tokens: int
+    stop: Optional[List[str]]
+    timeout: float
+    # Configured max_tokens; max_tokens is lower when it was tuned
+    limit: int
+
+    @property
+    def tuned(self) -> bool:
+        return self.max_tokens < self.limit
+
+    def untuned(self) -> "GenerationProfile":
+        return self._replace(max_tokens=self.limit)
+
+    def override(self, settings: dict) -> "GenerationProfile":
+        """Profile with the max_tokens, stop and timeout given in settings."""
+        max_tokens = int(settings.get("max_tokens", self.limit))
+        return GenerationProfile(
+            max_tokens=max_tokens,
+            stop=settings.get("stop", self.stop) or None,
+            timeout=float(settings.get("timeout", self.timeout)),
+            limit=max_tokens,
+        )
+
+
+def default_profile(context_type: str) -> GenerationProfile:
+    """The profile configured through the environment for a context type."""
+    settings = GENERATION_PROFILES.get(context_type, GENERATION_PROFILES["section"])
+    return GenerationProfile(settings["max_tokens"], None, settings["timeout"], settings["max_tokens"])
+
+
+class GenerationProfiles:
+    """Resolves and auto-tunes the generation profile of each placeholder."""
+
+    def __init__(self, input_folder: str = INPUT_FOLDER):
+        self.input_folder = input_folder
+        self._overrides = {}  # folder -> (mtime, settings)
+        self._samples = {}  # (folder, context_type) -> recent output tokens
+        self._lock = threading.Lock()
+
+    def _folder_settings(self, folder: Optional[str]) -> dict:
+        """Overrides of a template folder, reloaded when the file changes."""
+        if not folder:
+            return {}
+        path = os.path.join(self.input_folder, folder, PROFILE_FILE_NAME)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return {}
+        with self._lock:
+            cached = self._overrides.get(folder)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                settings = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[GENERATION] Ignoring invalid {PROFILE_FILE_NAME} in {folder}: {e}")
+            settings = {}
+        with self._lock:
+            self._overrides[folder] = (mtime, settings)
+        return settings
+
+    def get(self, context_type: str, folder: str = None, ph: str = None) -> GenerationProfile:
+        """Profile for a placeholder: environment, then folder, then placeholder settings."""
+        profile = default_profile(context_type)
+        settings = self._folder_settings(folder)
+        if context_type in settings:
+            profile = profile.override(settings[context_type])
+
+        placeholder_settings = settings.get("placeholders", {}).get(ph) if ph else None
+        if placeholder_settings:
+            profile = profile.override(placeholder_settings)
+            if "max_tokens" in placeholder_settings:
+                # A limit pinned for one placeholder is used as is
+                return profile
+
+        tuned = self.tuned_max_tokens(context_type, folder)
+        if tuned is not None and tuned < profile.limit:
+            profile = profile._replace(max_tokens=tuned)
+        return profile
+
+    def has_placeholder_settings(self, folder: str, ph: str) -> bool:
+        """Whether the folder's generation_profiles.json sets a profile for this placeholder."""
+        return bool(self._folder_settings(folder).get("placeholders", {}).get(ph))
+
+    def tuned_max_tokens(self, context_type: str, folder: str = None) -> Optional[int]:
+        """99th percentile of the observed output tokens plus headroom, once enough were seen."""
+        if not GENERATION_TUNING:
+            return None
+        with self._lock:
+            samples = sorted(self._samples.get((folder, context_type), ()))
+        if len(samples) < GENERATION_TUNE_MIN_SAMPLES:
+            return None
+        p99 = samples[min(len(samples) - 1, math.ceil(0.99 * len(samples)) - 1)]
+        return max(MIN_TUNED_MAX_TOKENS, math.ceil(p99 * GENERATION_TUNE_HEADROOM))
+
+    def record(self, context_type: str, folder: str, output_tokens: int):
+        """Add the length of a generated answer to the statistics."""
+        with self._lock:
+            samples = self._samples.get((folder, context_type))
+            if samples is None:
+                samples = self._samples[(folder, context_type)] = deque(maxlen=GENERATION_TUNE_WINDOW)
+            samples.append(output_tokens)
+
+
+generation_profiles = GenerationProfiles()
@@ -0,0 +1,128 @@
+"""
+Content-addressed store for images extracted from uploaded PDFs.
+
+Raw image bytes are kept once per SHA-256 in the ImageBlob table, so an
+image repeated across pages or PDFs (logos, headers) is stored a single
+time; Image rows only reference the hash. Thumbnails are derived lazily
+and cached on disk.
+"""
+import base64
+import hashlib
+import os
+import threading
+from io import BytesIO
+from typing import Optional
+from PIL import Image as PILImage
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+from utils.database import engine
+from utils.models import Image, ImageBlob
+from utils.config import THUMBNAIL_FOLDER
+from utils.image_processing import image_size, is_tiny
+
+
+class ImageStore:
+    """Deduplicated image bytes keyed by SHA-256."""
+
+    def __init__(self, thumbnail_dir: str = THUMBNAIL_FOLDER):
+        self.thumbnail_dir = thumbnail_dir
+
+    @staticmethod
+    def hash(data: bytes) -> str:
+        """Content address of image bytes."""
+        return hashlib.sha256(data).hexdigest()
+
+    def put(self, data: bytes, mime: str) -> str:
+        """Store image bytes unless already present and return their hash."""
+        sha256 = self.hash(data)
+        with Session(engine) as session:
+            if session.get(ImageBlob, sha256) is not None:
+                return sha256
+            session.add(ImageBlob(sha256=sha256, mime=mime, size=len(data), data=data))
+            try:
+                session.commit()
+            except IntegrityError:
+                # Another upload stored the same image first
+                pass
+        return sha256
+
+    def put_extracted(self, filename: str, data: bytes) -> Optional[dict]:
+        """Store an image fetched from a parsed PDF and return its page entry without the bytes.
+
+        Called as each image arrives, so a PDF's images never pile up in
+        memory. Icons and spacers below LLM_IMAGE_MIN_EDGE are not stored
+        and get no hash; unreadable images return None.
+        """
+        try:
+            width, height = image_size(data)
+        except Exception as e:
+            print(f"[IMAGES] Could not read {filename}: {e}")
+            return None
+        mime = "image/" + str(filename).split(".")[-1]
+        return {
+            "filename": filename,
+            "mime": mime,
+            "size": len(data),
+            "width": width,
+            "height": height,
+            "hash": None if is_tiny(width, height) else self.put(data, mime),
+        }
+
+    def get(self, sha256: str) -> Optional[ImageBlob]:
+        """The stored blob for a hash, or None."""
+        with Session(engine) as session:
+            return session.get(ImageBlob, sha256)
+
+    def load(self, image: Image) -> Optional[bytes]:
+        """Bytes of an Image row, including rows stored inline as base64 before the blob store."""
+        if image.image_hash:
+            blob = self.get(image.image_hash)
+            return blob.data if blob else None
+        if image.image_b64:
+            return base64.b64decode(image.image_b64)
+        return None
+
+    def thumbnail(self, sha256: str, max_edge: int) -> Optional[bytes]:
+        """JPEG thumbnail no larger than max_edge, generated on first request."""
+        path = os.path.join(self.thumbnail_dir, f"{sha256}_{max_edge}.jpg")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return f.read()
+
+        blob = self.get(sha256)
+        if blob is None:
+            return None
+        image = PILImage.open(BytesIO(blob.data))
+        image.thumbnail((max_edge, max_edge))
+        buffer = BytesIO()
+        flatten(image).save(buffer, format="JPEG", quality=85)
+        data = buffer.getvalue()
+
+        os.makedirs(self.thumbnail_dir, exist_ok=True)
+        # Unique per thread, concurrent requests for the same thumbnail each write their own file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return data
+
+
+def flatten(image: PILImage.Image) -> PILImage.Image:
+    """RGB copy of an image with transparent areas composited onto white.
+
+    JPEG has no alpha channel and a plain convert("RGB") turns them black.
+    """
+    if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = PILImage.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+image_store = ImageStore()
@@ -0,0 +1,187 @@
+"""
+Work queue for template filling on the existing Postgres database.
+
+Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so any number of
+worker processes on any number of hosts can pull from the same queue
+without handing the same job out twice.
+"""
+import json
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import List, Optional, Tuple
+from sqlmodel import Session, select, update
+from utils.database import engine
+from utils.models import FillJob, utc_now
+from utils.config import JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_HEARTBEAT_SECONDS
+
+# Background work that must never delay a user's fill
+LOW_PRIORITY_KINDS = ("speculate",)
+
+
+class JobQueue:
+    """Postgres-backed queue of fill jobs."""
+
+    def enqueue(self, task_id: str, kind: str, payload: dict) -> int:
+        """Add a job to the queue and return its id."""
+        with Session(engine) as session:
+            job = FillJob(task_id=task_id, kind=kind, payload=json.dumps(payload))
+            session.add(job)
+            session.commit()
+            return job.id
+
+    def enqueue_unique(self, task_id: str, kind: str, payload: dict) -> Optional[int]:
+        """Add a job unless the same one is already queued; returns its id, or None."""
+        with Session(engine) as session:
+            queued = session.exec(
+                select(FillJob.id).where(
+                    FillJob.status == "queued",
+                    FillJob.kind == kind,
+                    FillJob.task_id == task_id,
+                    FillJob.payload == json.dumps(payload),
+                ).limit(1)
+            ).first()
+        if queued is not None:
+            return None
+        return self.enqueue(task_id, kind, payload)
+
+    def has_user_work(self) -> bool:
+        """Whether jobs other than low priority ones are queued or running."""
+        with Session(engine) as session:
+            return session.exec(
+                select(FillJob.id).where(
+                    FillJob.status.in_(("queued", "running")),
+                    FillJob.kind.not_in(LOW_PRIORITY_KINDS),
+                ).limit(1)
+            ).first() is not None
+
+    def claim(self, worker_id: str) -> Optional[FillJob]:
+        """Claim the oldest queued job, skipping rows other workers hold locked.
+
+        Low priority jobs are only handed out while no other job is queued
+        or running, so they never hold a worker a user's fill could use and
+        at most one runs at a time.
+        """
+        with Session(engine) as session:
+            job = self._next(session, FillJob.kind.not_in(LOW_PRIORITY_KINDS))
+            if job is None:
+                running = session.exec(select(FillJob.id).where(FillJob.status == "running").limit(1)).first()
+                if running is not None:
+                    return None
+                job = self._next(session, FillJob.kind.in_(LOW_PRIORITY_KINDS))
+            if job is None:
+                return None
+
+            job.status = "running"
+            job.attempts += 1
+            job.worker_id = worker_id
+            job.locked_at = utc_now()
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+            return job
+
+    def _next(self, session: Session, kinds) -> Optional[FillJob]:
+        """Lock the oldest queued job matching kinds."""
+        return session.exec(
+            select(FillJob)
+            .where(FillJob.status == "queued", kinds)
+            .order_by(FillJob.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        ).first()
+
+    def _leased(self, job_id: int, worker_id: str):
+        """Condition matching a job only while worker_id still holds its lease."""
+        return (FillJob.id == job_id, FillJob.status == "running", FillJob.worker_id == worker_id)
+
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """Renew the lease of a running job. Returns False once the lease was lost."""
+        with Session(engine) as session:
+            result = session.exec(
+                update(FillJob).where(*self._leased(job_id, worker_id)).values(locked_at=utc_now())
+            )
+            session.commit()
+            return result.rowcount == 1
+
+    @contextmanager
+    def keep_alive(self, job_id: int, worker_id: str, interval: float = JOB_HEARTBEAT_SECONDS):
+        """Renew the job lease every interval seconds while the block runs."""
+        done = threading.Event()
+
+        def beat():
+            while not done.wait(interval):
+                try:
+                    if not self.heartbeat(job_id, worker_id):
+                        print(f"[JOB QUEUE] Lost the lease of job {job_id}")
+                        return
+                except Exception as e:
+                    print(f"[JOB QUEUE] Heartbeat of job {job_id} failed: {e}")
+
+        thread = threading.Thread(target=beat, name=f"job-{job_id}-heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+    def complete(self, job_id: int, worker_id: str) -> bool:
+        """Mark a job as done, unless its lease has passed to another worker."""
+        with Session(engine) as session:
+            result = session.exec(
+                update(FillJob).where(*self._leased(job_id, worker_id)).values(status="done")
+            )
+            session.commit()
+            return result.rowcount == 1
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> bool:
+        """Requeue a failed job, or mark it failed after JOB_MAX_ATTEMPTS.
+
+        Returns True if the job will run again: requeued here, or already
+        requeued and owned by someone else because this worker lost its lease.
+        """
+        with Session(engine) as session:
+            job = session.exec(
+                select(FillJob).where(*self._leased(job_id, worker_id)).with_for_update()
+            ).first()
+            if job is None:
+                return True
+            retry = job.attempts < JOB_MAX_ATTEMPTS
+            job.status = "queued" if retry else "failed"
+            job.error = error
+            job.worker_id = None
+            session.add(job)
+            session.commit()
+            return retry
+
+    def requeue_stale(self) -> Tuple[int, List[str]]:
+        """Put back jobs whose worker stopped renewing the lease.
+
+        Jobs that already used JOB_MAX_ATTEMPTS are failed instead. Returns
+        the number requeued and the task ids of the jobs failed.
+        """
+        cutoff = utc_now() - timedelta(seconds=JOB_LEASE_SECONDS)
+        stale = (FillJob.status == "running", FillJob.locked_at < cutoff)
+        with Session(engine) as session:
+            failed = session.exec(
+                update(FillJob)
+                .where(*stale, FillJob.attempts >= JOB_MAX_ATTEMPTS)
+                .values(status="failed", worker_id=None, error="Lease expired")
+                .returning(FillJob.task_id)
+            ).all()
+            result = session.exec(
+                update(FillJob)
+                .where(*stale)
+                .values(status="queued", worker_id=None)
+            )
+            session.commit()
+            return result.rowcount, [task_id for (task_id,) in failed]
+
+    @staticmethod
+    def payload(job: FillJob) -> dict:
+        """Decode the job arguments."""
+        return json.loads(job.payload)
+
+
+job_queue = JobQueue()
@@ -3,9 +3,41 @@ LLM service for handling MyGenAssist API calls.
 """
 import requests
 import base64
-from io import BytesIO
-from PIL import Image
+from typing import NamedTuple, Optional, Union
 from utils.config import MYGENASSIST_API_KEY, MYGENASSIST_API_URL
+from utils.image_processing import normalize_image
+from services.caption_cache import caption_cache
+from services.generation_profiles import GenerationProfile, default_profile
+
+PROCESS_FLOW_PROMPT = "Describe the following process flow image in detail."
+
+
+def decode_image(image: Union[bytes, str]) -> bytes:
+    """Raw bytes of an image given as bytes, base64 text or a data: URL."""
+    if isinstance(image, bytes):
+        return image
+    if image.startswith("data:"):
+        image = image.split(",", 1)[1]
+    return base64.b64decode(image)
+
+
+def encode_image(image: Union[bytes, str, None]) -> Optional[str]:
+    """Base64 text for the API payload; images stay raw bytes until this HTTP boundary."""
+    if image is None or isinstance(image, str):
+        return image
+    return base64.b64encode(image).decode("ascii")
+
+
+class Completion(NamedTuple):
+    content: str
+    # Reported by the API, None when it sends no usage
+    output_tokens: Optional[int]
+    finish_reason: Optional[str]
+
+    @property
+    def truncated(self) -> bool:
+        """The answer was cut off at max_tokens."""
+        return self.finish_reason == "length"
 
 
 class LLMService:
@@ -15,81 +47,80 @@ class LLMService:
         self.api_key = MYGENASSIST_API_KEY
         self.api_url = MYGENASSIST_API_URL
 
-    def query_llm(self, prompt: str, image_b64: str = None):
+    def complete(self, prompt: str, image: Union[bytes, str] = None, profile: GenerationProfile = None) -> Optional[Completion]:
         """
-        Query MyGenAssist LLM with optional image.
+        Query MyGenAssist LLM within a generation profile (defaults to the section profile).
         """
+        profile = profile or default_profile("section")
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
 
-        message_content = {"role": "user", "content": prompt}
-
         data = {
             "model": "gpt-4o",
             "messages": [            
                 {
                     "role": "user",
                     "content": prompt,
-                    "image": image_b64
+                    "image": encode_image(image)
                 }],
-            "max_tokens": 10000,
+            "max_tokens": profile.max_tokens,
             "temperature": 0
         }
+        if profile.stop:
+            data["stop"] = profile.stop
 
-        response = requests.post(self.api_url, headers=headers, json=data)
+        try:
+            response = requests.post(self.api_url, headers=headers, json=data, timeout=profile.timeout)
+        except requests.Timeout:
+            print(f"Error: no response within {profile.timeout}s")
+            return None
         if response.status_code == 200:
-            return response.json().get('choices', [{}])[0].get('message', {}).get('content', '')
+            body = response.json()
+            choice = body.get('choices', [{}])[0]
+            return Completion(
+                choice.get('message', {}).get('content', ''),
+                (body.get('usage') or {}).get('completion_tokens'),
+                choice.get('finish_reason')
+            )
         else:
             print(f"Error: {response.status_code} - {response.text}")
             return None
 
-    def query_multimodal(self, image_b64: str, prompt: str):
+    def query_llm(self, prompt: str, image: Union[bytes, str] = None, profile: GenerationProfile = None):
         """
-        Send image + prompt to multimodal MyGenAssist model.
+        Query MyGenAssist LLM with optional image (raw bytes, or base64 text).
         """
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        completion = self.complete(prompt, image, profile)
+        return completion.content if completion else None
 
-        data = {
-            "model": "gpt-4o",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt,
-                    "image": image_b64
-                }
-            ],
-            "max_tokens": 10000,
-            "temperature": 0
-        }
-
-        response = requests.post(self.api_url, headers=headers, json=data)
-        if response.status_code == 200:
-            return response.json().get('choices', [{}])[0].get('message', {}).get('content', '')
-        else:
-            print(f"Error: {response.status_code} - {response.text}")
-            return None
+    def query_multimodal(self, image: Union[bytes, str], prompt: str, profile: GenerationProfile = None):
+        """
+        Send image + prompt to multimodal MyGenAssist model.
+        """
+        completion = self.complete(prompt, image, profile or default_profile("image"))
+        return completion.content if completion else None
 
-    def generate_process_flow_description(self, process_flow_base64: str) -> str:
+    def generate_process_flow_description(self, process_flow: Union[bytes, str]) -> Optional[str]:
         """
-        Convert Base64 string to image and generate description via LLM.
+        Generate a description of a process flow image (raw bytes, or base64 text from the request).
+        Returns None if the model call fails.
         """
-        # Convert Base64 to bytes
-        process_flow_bytes = base64.b64decode(process_flow_base64)
-        image = Image.open(BytesIO(process_flow_bytes))
+        process_flow_bytes = decode_image(process_flow)
 
-        # Convert back to base64 for multimodal LLM
-        buffered = BytesIO()
-        image.save(buffered, format="PNG")
-        img_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+        # The same flow image is described only once; edited diagrams must not match, so exact bytes only
+        cached = caption_cache.get(process_flow_bytes, PROCESS_FLOW_PROMPT, similar=False)
+        if cached:
+            return cached
 
-        # Construct prompt
-        prompt = "Describe the following process flow image in detail."
+        # Downscale and re-encode for the multimodal model
+        image = normalize_image(process_flow_bytes)
+        print(f"[LLM] Process flow image {image.width}x{image.height}, {image.bytes_saved} bytes saved")
 
         # Call LLM with image
-        description = self.query_multimodal(img_base64, prompt)
-        return description if description else "Process flow description unavailable"
+        description = self.query_multimodal(image.data, PROCESS_FLOW_PROMPT, default_profile("process_flow"))
+        if not description:
+            return None
+        caption_cache.put(process_flow_bytes, PROCESS_FLOW_PROMPT, description)
+        return description
@@ -0,0 +1,146 @@
+"""
+Task-scoped memo of placeholder answers shared by the template threads of a fill task.
+"""
+import threading
+from api.websocket import send_call_log
+from utils.task_store import task_store
+from services.answer_store import answer_key
+from services.context_builder import ContextUsage
+
+
+class PlaceholderMemo:
+    """Task-scoped memo so each unique placeholder is generated only once per task.
+
+    With ``checkpoint`` enabled every answer is also persisted as soon as it
+    is generated, and answers already checkpointed for the task are loaded
+    up front, so a resumed task only regenerates missing placeholders.
+    """
+
+    def __init__(self, user_prompt: str = "", process_flow: str = "", task_id: str = None, checkpoint: bool = False):
+        self.user_prompt = user_prompt or ""
+        self.process_flow = process_flow or ""
+        self.task_id = task_id
+        self.checkpoint = checkpoint and task_id is not None
+        self.answers = task_store.load_answers(task_id) if self.checkpoint else {}
+        self.restored = len(self.answers)
+        self.seeded = 0
+        self.hits = 0
+        self.misses = 0
+        self.batched = 0
+        self.batches = 0
+        self.context_usage = ContextUsage()
+        self._lock = threading.Lock()
+        self._pending = {}
+        # Batch answers not looked up yet, their first lookup is not a reuse
+        self._fresh = set()
+
+    def key(self, ph: str, context_type: str) -> str:
+        """Build the memo key for a placeholder occurrence."""
+        return answer_key(ph, context_type, self.user_prompt, self.process_flow)
+
+    def get_or_generate(self, ph: str, context_type: str, generate_fn):
+        """Return the memoized answer, generating it on first use.
+
+        Safe to call from several template threads: concurrent requests for
+        the same key wait for the first generation instead of repeating it.
+        """
+        key = self.key(ph, context_type)
+        while True:
+            with self._lock:
+                if key in self.answers:
+                    content = self.answers[key]
+                    if key in self._fresh:
+                        self._fresh.discard(key)
+                        return content
+                    self.hits += 1
+                    break
+                pending = self._pending.get(key)
+                owner = pending is None
+                if owner:
+                    pending = self._pending[key] = threading.Event()
+                    self.misses += 1
+            if not owner:
+                pending.wait()
+                continue
+
+            try:
+                content = generate_fn(ph, context_type)
+                # Failed generations are not memoized so they are retried
+                if content is not None:
+                    with self._lock:
+                        self.answers[key] = content
+                    if self.checkpoint:
+                        task_store.save_answer(self.task_id, key, ph, context_type, content)
+                return content
+            finally:
+                with self._lock:
+                    del self._pending[key]
+                pending.set()
+
+        send_call_log(self.task_id, "template_processor", f"Reusing generated content for placeholder: {ph}")
+        return content
+
+    def generate_batch(self, placeholders, context_type: str, batch_fn) -> int:
+        """Generate the unanswered placeholders with a single batch_fn call.
+
+        batch_fn(placeholders, context_type) returns a placeholder -> answer
+        dict. Placeholders it leaves out are not memoized, so get_or_generate
+        falls back to generating them one by one. Returns the number answered.
+        """
+        with self._lock:
+            owned = {}
+            for ph in placeholders:
+                key = self.key(ph, context_type)
+                if key not in self.answers and key not in self._pending:
+                    owned[key] = ph
+            # A single placeholder gains nothing from a batch prompt
+            if len(owned) < 2:
+                return 0
+            for key in owned:
+                self._pending[key] = threading.Event()
+
+        try:
+            answers = batch_fn(list(owned.values()), context_type) or {}
+            generated = {key: answers[ph] for key, ph in owned.items() if answers.get(ph) is not None}
+            with self._lock:
+                self.answers.update(generated)
+                self._fresh.update(generated)
+                self.misses += len(generated)
+                self.batched += len(generated)
+                self.batches += 1
+            if self.checkpoint:
+                for key, content in generated.items():
+                    task_store.save_answer(self.task_id, key, owned[key], context_type, content)
+            return len(generated)
+        finally:
+            with self._lock:
+                for key in owned:
+                    self._pending.pop(key).set()
+
+    def seed(self, answers: dict) -> int:
+        """Add answers from a previous run without counting them as generated."""
+        with self._lock:
+            new = {key: answer for key, answer in answers.items() if key not in self.answers}
+            self.answers.update(new)
+            self.seeded += len(new)
+        return len(new)
+
+    def wrap(self, generate_fn):
+        """Wrap a retrieve function so repeated placeholders hit the memo."""
+        def retrieve_fn(ph, context_type):
+            return self.get_or_generate(ph, context_type, generate_fn)
+        return retrieve_fn
+
+    def summary(self) -> str:
+        """Human readable summary of the memo usage."""
+        summary = (
+            f"Generated {self.misses} unique placeholders, "
+            f"reused {self.hits} (saved {self.hits} LLM calls)"
+        )
+        if self.batches:
+            summary += f", {self.batched} table placeholders answered in {self.batches} batched calls"
+        if self.restored:
+            summary += f", {self.restored} answers restored from checkpoint"
+        if self.seeded:
+            summary += f", {self.seeded} answers reused from previous runs"
+        return summary
@@ -0,0 +1,154 @@
+"""
+Progress events of queue workers, relayed to the API processes through the database.
+
+Fill workers have no server event loop and no WebSocket clients. Their
+progress bus forwards events to this relay, which writes them to the
+ProgressEvent table in batches. Every API process polls the table and
+hands new events to its own progress bus, which numbers, coalesces and
+sends them like events of in-process fills.
+"""
+import asyncio
+import json
+import threading
+from collections import deque
+from datetime import timedelta
+from typing import List, Tuple
+from sqlmodel import Session, select, delete, func
+from utils.database import engine
+from utils.models import ProgressEvent, utc_now
+from utils.config import PROGRESS_QUEUE_MAX, PROGRESS_RELAY_POLL_SECONDS, PROGRESS_RELAY_RETENTION_SECONDS
+
+# Ids below the newest one read again, for rows whose insert committed after a later id was read
+LOOKBACK_IDS = 200
+
+# Old events are deleted every this many polls
+PRUNE_EVERY_POLLS = 120
+
+
+class ProgressRelay:
+    """Database-backed hand-off of progress events between processes."""
+
+    def __init__(self, poll_seconds: float = PROGRESS_RELAY_POLL_SECONDS, retention_seconds: int = PROGRESS_RELAY_RETENTION_SECONDS):
+        self.poll_seconds = poll_seconds
+        self.retention_seconds = retention_seconds
+        # Worker side: events waiting to be written
+        self.pending = deque(maxlen=PROGRESS_QUEUE_MAX)
+        self._stop = threading.Event()
+        self._writer = None
+        # API side: newest id when reading started, newest id handed out and the ids already read within the lookback window
+        self.start_id = None
+        self.last_id = None
+        self.seen = set()
+        self.reader = None
+
+    # Worker side
+
+    def publish(self, task_id: str, update_data: dict):
+        """Queue an event for the database; never blocks the template threads."""
+        self.pending.append((task_id, update_data))
+
+    def flush(self) -> int:
+        """Write the queued events in one transaction."""
+        events = []
+        while True:
+            try:
+                events.append(self.pending.popleft())
+            except IndexError:
+                break
+        if events:
+            with Session(engine) as session:
+                session.add_all(
+                    ProgressEvent(task_id=task_id, payload=json.dumps(update_data))
+                    for task_id, update_data in events
+                )
+                session.commit()
+        return len(events)
+
+    def start_writer(self):
+        """Write queued events every poll interval on a background thread."""
+        def write():
+            while not self._stop.wait(self.poll_seconds):
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"[PROGRESS RELAY] Writing events failed: {e}")
+
+        self._writer = threading.Thread(target=write, name="progress-relay", daemon=True)
+        self._writer.start()
+
+    def stop_writer(self):
+        """Stop the writer and write what is left."""
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+        self.flush()
+
+    # API side
+
+    def fetch(self) -> List[Tuple[str, dict]]:
+        """New events since the previous fetch, oldest first.
+
+        The first fetch only notes the newest id, events written before the
+        process started are not replayed.
+        """
+        with Session(engine) as session:
+            if self.last_id is None:
+                self.start_id = self.last_id = session.exec(select(func.max(ProgressEvent.id))).one() or 0
+                return []
+            low = max(self.last_id - LOOKBACK_IDS, self.start_id)
+            rows = session.exec(
+                select(ProgressEvent).where(ProgressEvent.id > low).order_by(ProgressEvent.id)
+            ).all()
+
+        events = []
+        for row in rows:
+            if row.id in self.seen:
+                continue
+            self.seen.add(row.id)
+            self.last_id = max(self.last_id, row.id)
+            events.append((row.task_id, json.loads(row.payload)))
+        low = self.last_id - LOOKBACK_IDS
+        self.seen = {event_id for event_id in self.seen if event_id > low}
+        return events
+
+    def prune(self) -> int:
+        """Delete events older than the retention period."""
+        cutoff = utc_now() - timedelta(seconds=self.retention_seconds)
+        with Session(engine) as session:
+            result = session.exec(delete(ProgressEvent).where(ProgressEvent.created_at < cutoff))
+            session.commit()
+            return result.rowcount
+
+    def start_reader(self, bus):
+        """Feed relayed events into bus on the running event loop."""
+        loop = asyncio.get_running_loop()
+
+        async def read():
+            polls = 0
+            while True:
+                try:
+                    # Database calls run in the default executor, off the event loop
+                    for task_id, update_data in await loop.run_in_executor(None, self.fetch):
+                        bus.publish(task_id, update_data)
+                    polls += 1
+                    if polls % PRUNE_EVERY_POLLS == 0:
+                        await loop.run_in_executor(None, self.prune)
+                except Exception as e:
+                    print(f"[PROGRESS RELAY] Reading events failed: {e}")
+                await asyncio.sleep(self.poll_seconds)
+
+        self.reader = loop.create_task(read())
+
+    async def stop_reader(self):
+        """Stop feeding relayed events."""
+        if self.reader is None:
+            return
+        self.reader.cancel()
+        try:
+            await self.reader
+        except asyncio.CancelledError:
+            pass
+        self.reader = None
+
+
+progress_relay = ProgressRelay()
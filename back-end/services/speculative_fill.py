@@ -0,0 +1,132 @@
+"""
+Speculative pre-generation of template answers after a PDF upload.
+
+Opt-in through SPECULATIVE_FILL_FOLDERS. Once ingestion has finished, the
+placeholders of the templates in those folders are retrieved and drafted
+with an empty user prompt and no process flow, keyed by placeholder,
+context type and the new corpus version. A later fill on the same corpus
+uses the drafts as answers when it has no user prompt or process flow, and
+otherwise has them refined with its instructions instead of retrieving and
+generating from scratch.
+
+In queue mode the work is split into jobs of SPECULATIVE_FILL_SLICE
+placeholders that stop as soon as a user job is waiting and re-enqueue
+themselves behind it, so pre-generation never holds a worker a fill needs.
+"""
+import os
+import threading
+import time
+from sqlmodel import Session
+from utils.database import engine
+from utils.config import (
+    INPUT_FOLDER,
+    SPECULATIVE_FILL_FOLDERS,
+    SPECULATIVE_FILL_DELAY_SECONDS,
+    TEMPLATE_FILL_MODE,
+    TASK_ACTIVE_WINDOW_SECONDS,
+)
+from utils.task_store import task_store
+from services.job_queue import job_queue
+from services.fill_plan import fill_plan_cache
+from services.answer_store import answer_store, answer_key, corpus_version
+from services.template_filler import retrieve_placeholder_content
+
+# One pre-generation run at a time per process
+_run_lock = threading.Lock()
+
+
+def schedule_speculative_fill():
+    """Start pre-generating answers for the configured folders, if enabled."""
+    if not SPECULATIVE_FILL_FOLDERS:
+        return
+    corpus = corpus_version()
+    if TEMPLATE_FILL_MODE == "queue":
+        job_queue.enqueue_unique("speculative", "speculate", {"corpus_version": corpus})
+    else:
+        threading.Thread(
+            target=run_speculative_fill,
+            args=(corpus,),
+            name="speculative-fill",
+            daemon=True
+        ).start()
+    print(f"[SPECULATIVE FILL] Scheduled for folders: {', '.join(SPECULATIVE_FILL_FOLDERS)}")
+
+
+def collect_placeholders():
+    """Unique (draft key, placeholder, context type, folder) of the configured folders' templates."""
+    items = {}
+    for folder_name in SPECULATIVE_FILL_FOLDERS:
+        folder_path = os.path.join(INPUT_FOLDER, folder_name)
+        if not os.path.isdir(folder_path):
+            print(f"[SPECULATIVE FILL] Folder not found: {folder_name}")
+            continue
+        for file_name in sorted(f for f in os.listdir(folder_path) if f.endswith(".docx")):
+            try:
+                plan = fill_plan_cache.get(os.path.join(folder_path, file_name))
+            except Exception as e:
+                print(f"[SPECULATIVE FILL] Could not compile fill plan for {file_name}: {e}")
+                continue
+            for location in plan.locations:
+                for ph in location["placeholders"]:
+                    key = answer_key(ph, location["context_type"])
+                    items.setdefault(key, (ph, location["context_type"], folder_name))
+    return items
+
+
+def run_speculative_fill(corpus: str, limit: int = None, should_yield=None) -> bool:
+    """Draft the answers for one corpus version, yielding to user fills.
+
+    In-process runs wait while user fills are active. Queue jobs pass
+    should_yield and a limit instead: the run stops when should_yield()
+    returns True or after drafting limit placeholders. Returns False if it
+    stopped with placeholders left that a later run can still draft.
+    Stops for good as soon as the corpus changes again; the upload that
+    changed it schedules a run of its own.
+    """
+    with _run_lock:
+        if corpus != corpus_version():
+            print("[SPECULATIVE FILL] Corpus changed, skipping stale run")
+            return True
+
+        answer_store.prune(corpus)
+        items = collect_placeholders()
+        done = answer_store.load_speculative_answers(items.keys(), corpus)
+        pending = [(key, *item) for key, item in items.items() if key not in done]
+        print(f"[SPECULATIVE FILL] {len(pending)} placeholders to draft, {len(done)} already drafted")
+
+        generated = attempted = 0
+        finished = True
+        with Session(engine) as session:
+            for key, ph, context_type, folder_name in pending:
+                if should_yield is not None:
+                    if limit is not None and attempted >= limit:
+                        # A slice that drafted nothing would be retried forever
+                        finished = generated == 0
+                        if finished:
+                            print(f"[SPECULATIVE FILL] No draft in the last {attempted} attempts, giving up")
+                        break
+                    if should_yield():
+                        print("[SPECULATIVE FILL] Yielding to user fills")
+                        finished = False
+                        break
+                else:
+                    # User fills that made progress recently pause the pre-generation
+                    while task_store.has_active_tasks(TASK_ACTIVE_WINDOW_SECONDS):
+                        time.sleep(TASK_ACTIVE_WINDOW_SECONDS / 10)
+                if corpus != corpus_version():
+                    print("[SPECULATIVE FILL] Corpus changed, stopping")
+                    break
+
+                attempted += 1
+                try:
+                    answer = retrieve_placeholder_content(ph, context_type, session, corpus=corpus, folder=folder_name)
+                except Exception as e:
+                    print(f"[SPECULATIVE FILL] Failed to draft {ph}: {e}")
+                    answer = None
+                if answer is not None:
+                    answer_store.save_speculative_answer(key, corpus, ph, context_type, answer)
+                    generated += 1
+                time.sleep(SPECULATIVE_FILL_DELAY_SECONDS)
+
+        print(f"[SPECULATIVE FILL] Drafted {generated} of {len(pending)} placeholders")
+        return finished
@@ -2,6 +2,7 @@
 Template filling service for processing .docx templates.
 """
 import re
+import json
 from io import BytesIO
 from docx import Document
 from docx.text.paragraph import Paragraph
@@ -10,8 +11,20 @@ from sqlmodel import Session, select
 from utils.models import PDFS
 from utils.retriver import Retriver
 from services.llm_service import LLMService
-from utils.prompt_templates import IMPROVED_PROMPT_TEMPLATE, format_retrieved_chunks
-from api.websocket import broadcast_progress_update_sync
+from utils.config import CONTEXT_TOKEN_BUDGETS
+from utils.prompt_templates import IMPROVED_PROMPT_TEMPLATE, REFINE_DRAFT_PROMPT_TEMPLATE, TABLE_BATCH_PROMPT_TEMPLATE
+from api.websocket import send_call_log
+from services.answer_store import answer_store
+from services.context_builder import ContextUsage, build_context, count_tokens
+from services.generation_profiles import generation_profiles
+from parsers.docx_parser import (
+    PLACEHOLDER_PATTERN,
+    PlaceholderMatcher,
+    iter_paragraph_refs,
+    paragraph_elements,
+    paragraph_text,
+    replace_placeholders,
+)
 
 
 class TemplateFiller:
@@ -20,20 +33,11 @@ class TemplateFiller:
     def __init__(self, task_id: str = None):
         self.llm_service = LLMService()
         self.task_id = task_id
+        self.failed_placeholders = []
 
     def send_call_log(self, service: str, message: str, log_type: str = 'info'):
         """Send a call log via WebSocket."""
-        if self.task_id:
-            try:
-                log_data = {
-                    "type": "call_log",
-                    "service": service,
-                    "message": message,
-                    "logType": log_type
-                }
-                broadcast_progress_update_sync(self.task_id, log_data)
-            except Exception as e:
-                print(f"Failed to send call log: {e}")
+        send_call_log(self.task_id, service, message, log_type)
 
     def extract_angular_context(self, text: str) -> str:
         """Extract content from angular brackets."""
@@ -55,81 +59,71 @@ class TemplateFiller:
 
     def iter_paragraphs(self, doc):
         """Yield all paragraphs including those in tables."""
-        for para in doc.paragraphs:
-            yield para
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for para in self.iter_paragraphs(cell):
-                        yield para
-
-    def fill_placeholders(self, doc: Document, placeholders, retrieve_fn):
-        """Fill all placeholders in the document."""
-        paragraphs = list(self.iter_paragraphs(doc))
-        i = 0
-        while i < len(paragraphs):
-            para = paragraphs[i]
-            para_text = para.text
-            for ph in placeholders:
-                if f"<{ph}>" in para_text:
-                    context_type = "table" if para._element.getparent().tag.endswith("tc") else "section"
-                    content = retrieve_fn(ph, context_type)
-                    generated_paragraphs = [p.strip() for p in content.split("\n\n") if p.strip()]
-                    if generated_paragraphs:
-                        para.text = generated_paragraphs[0]
-                        last_para = para
-                        for extra_para_text in generated_paragraphs[1:]:
-                            last_para = self.insert_paragraph_after(last_para, extra_para_text)
-                    break
-            i += 1
+        for ref in iter_paragraph_refs(doc):
+            yield Paragraph(ref.element, doc._body)
+
+    def fill_placeholders(self, doc: Document, placeholders, retrieve_fn, occurrences=None):
+        """Fill all placeholders in the document, editing runs in place.
+
+        ``occurrences`` is the paragraph index from ``index_placeholders``; when
+        omitted it is built here with a single pass over the paragraphs.
+        Placeholders whose generation failed are left in place and listed in
+        ``failed_placeholders``.
+        """
+        matcher = PlaceholderMatcher(placeholders)
+        refs = iter_paragraph_refs(doc)
+        if occurrences is None:
+            occurrences = matcher.index(paragraph_text(ref.element) for ref in refs)
+
+        locations = [(refs[i].element, refs[i].context_type, found) for i, found in occurrences.items()]
+        self._fill_locations(locations, retrieve_fn, matcher.placeholders)
         return doc
 
+    def fill_from_plan(self, doc: Document, plan, retrieve_fn):
+        """Fill a document using its precompiled FillPlan, skipping placeholder discovery."""
+        paragraphs = paragraph_elements(doc)
+        locations = [
+            (paragraphs[location["index"]], location["context_type"], location["placeholders"])
+            for location in plan.locations
+        ]
+        self._fill_locations(locations, retrieve_fn, set(plan.placeholders))
+        return doc
 
-def extract_placeholders(doc: Document):
-    """Extract all placeholders from document including tables."""
-    placeholders = []
+    def _fill_locations(self, locations, retrieve_fn, known):
+        """Generate and write the answers for (paragraph, context type, placeholders) locations."""
+        self.failed_placeholders = []
+        for element, context_type, found in locations:
+            answers = {}
+            for ph in found:
+                if ph in known and ph not in answers:
+                    content = retrieve_fn(ph, context_type)
+                    if content is None:
+                        self.failed_placeholders.append(ph)
+                        continue
+                    answers[ph] = content
+            if answers:
+                replace_placeholders(element, answers)
 
-    def iter_paragraphs(doc_or_cell):
-        for para in doc_or_cell.paragraphs:
-            yield para
-        for table in doc_or_cell.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    yield from iter_paragraphs(cell)
 
-    for para in iter_paragraphs(doc):
-        matches = re.findall(r"<(.*?)>", para.text)
-        placeholders.extend(matches)
+def index_placeholders(doc: Document):
+    """Extract all placeholders together with their paragraph occurrence index."""
+    occurrences = {}
+    for ref in iter_paragraph_refs(doc):
+        matches = PLACEHOLDER_PATTERN.findall(paragraph_text(ref.element))
+        if matches:
+            occurrences[ref.index] = matches
 
-    return placeholders
+    placeholders = [ph for matches in occurrences.values() for ph in matches]
+    return placeholders, occurrences
 
 
-def retrieve_placeholder_content(
-    ph: str,
-    context_type: str,
-    session: Session,
-    user_prompt: str = "",
-    process_flow: str = "",
-    task_id: str = None
-):
-    """Retrieve placeholder content using RAG + LLM with improved prompts."""
-    
-    def send_call_log(service: str, message: str, log_type: str = 'info'):
-        """Send a call log via WebSocket."""
-        if task_id:
-            try:
-                log_data = {
-                    "type": "call_log",
-                    "service": service,
-                    "message": message,
-                    "logType": log_type
-                }
-                broadcast_progress_update_sync(task_id, log_data)
-            except Exception as e:
-                print(f"Failed to send call log: {e}")
-    
-    send_call_log("retrieval_service", f"Searching for relevant documents for placeholder: {ph}")
-    
+def extract_placeholders(doc: Document):
+    """Extract all placeholders from document including tables."""
+    return index_placeholders(doc)[0]
+
+
+def retrieve_relevant_docs(ph: str, session: Session):
+    """Search every uploaded PDF for a placeholder, best matches first."""
     all_pdfs = session.exec(select(PDFS)).all()
     relevant_docs = []
 
@@ -141,23 +135,91 @@ def retrieve_placeholder_content(
 
     # Sort by relevance score
     relevant_docs.sort(key=lambda x: x.score, reverse=True)
+    return relevant_docs
+
+
+def load_relevant_docs(ph: str, session: Session, corpus: str = None):
+    """Retrieved documents for a placeholder, through the retrieval cache when a corpus version is given."""
+    relevant_docs = answer_store.load_retrieval(ph, corpus) if corpus else None
+    if relevant_docs is None:
+        relevant_docs = retrieve_relevant_docs(ph, session)
+        if corpus:
+            answer_store.save_retrieval(ph, corpus, relevant_docs)
+    return relevant_docs
+
+
+def retrieve_placeholder_content(
+    ph: str,
+    context_type: str,
+    session: Session,
+    user_prompt: str = "",
+    process_flow: str = "",
+    task_id: str = None,
+    corpus: str = None,
+    context_usage: ContextUsage = None,
+    folder: str = None,
+    draft: str = None
+):
+    """Retrieve placeholder content using RAG + LLM with improved prompts.
+
+    With a corpus version, retrieval results are cached per placeholder so
+    pre-generation and later fills on the same corpus share them. The
+    retrieved chunks are trimmed to the context type's token budget, and the
+    answer is generated within the template folder's generation profile.
+    A pre-generated ``draft`` skips retrieval: the draft, already based on
+    the documents, is only revised with the user context and process flow.
+    """
+    if draft is not None:
+        send_call_log(task_id, "llm_service", f"Refining pre-generated draft for placeholder: {ph}")
+        prompt = REFINE_DRAFT_PROMPT_TEMPLATE.format(
+            placeholder=ph,
+            draft=draft,
+            context_type=context_type,
+            user_context=user_prompt or "",
+            flow_summary=process_flow or ""
+        )
+        return generate_placeholder_answer(ph, context_type, prompt, process_flow, task_id, folder)
+
+    send_call_log(task_id, "retrieval_service", f"Searching for relevant documents for placeholder: {ph}")
+    
+    relevant_docs = load_relevant_docs(ph, session, corpus)
     
-    send_call_log("retrieval_service", f"Found {len(relevant_docs)} relevant documents")
+    send_call_log(task_id, "retrieval_service", f"Found {len(relevant_docs)} relevant documents")
 
-    # Format retrieved chunks for better LLM consumption
-    formatted_chunks = format_retrieved_chunks(relevant_docs)
+    # Deduplicated, best scoring chunks within the context type's token budget
+    context = build_context(relevant_docs, context_type)
+    if context_usage is not None:
+        context_usage.add(context)
+    send_call_log(
+        task_id,
+        "retrieval_service",
+        f"Using {context.chunks_used} of {context.chunks_retrieved} chunks "
+        f"({context.tokens} tokens, {context.tokens_saved} saved)"
+    )
 
     # Create improved prompt
-    send_call_log("llm_service", f"Generating content for placeholder: {ph}")
+    send_call_log(task_id, "llm_service", f"Generating content for placeholder: {ph}")
     
-    llm_service = LLMService()
     prompt = IMPROVED_PROMPT_TEMPLATE.format(
         placeholder=ph,
-        retrieved=formatted_chunks,
+        retrieved=context.text,
         context_type=context_type,
         user_context=user_prompt or "",
         flow_summary=process_flow or ""
     )
+    return generate_placeholder_answer(ph, context_type, prompt, process_flow, task_id, folder)
+
+
+def generate_placeholder_answer(
+    ph: str,
+    context_type: str,
+    prompt: str,
+    process_flow: str = "",
+    task_id: str = None,
+    folder: str = None
+):
+    """Run a placeholder prompt within its generation profile and clean up the answer."""
+    llm_service = LLMService()
 
     # Handle image in process flow if present
     image_base64 = None
@@ -165,11 +227,131 @@ def retrieve_placeholder_content(
         image_base64 = process_flow.split(",")[1]
 
     # Get response from LLM
-    response = llm_service.query_llm(prompt, image_base64)
+    profile = generation_profiles.get(context_type, folder, ph)
+    completion = llm_service.complete(prompt, image_base64, profile)
+    if completion is not None and completion.truncated and profile.tuned:
+        send_call_log(task_id, "llm_service", f"Answer for {ph} reached the tuned limit of {profile.max_tokens} tokens, regenerating")
+        completion = llm_service.complete(prompt, image_base64, profile.untuned())
+    if completion is not None and completion.truncated:
+        # Kept, a cut-off answer is still better than none; the limit needs raising for this placeholder
+        print(f"[GENERATION] Answer for {ph} truncated at the {context_type} limit of {profile.limit} tokens")
+        send_call_log(
+            task_id,
+            "llm_service",
+            f"Answer for {ph} was cut off at {profile.limit} tokens; raise the {context_type} max_tokens to get it in full",
+            "warning"
+        )
+    if completion is not None:
+        output_tokens = completion.output_tokens or count_tokens(completion.content)
+        generation_profiles.record(context_type, folder, output_tokens)
+    response = completion.content if completion is not None else None
     
-    send_call_log("llm_service", f"Generated content for placeholder: {ph}")
+    if response is None:
+        send_call_log(task_id, "llm_service", f"Failed to generate content for placeholder: {ph}", "error")
+        return None
+
+    send_call_log(task_id, "llm_service", f"Generated content for placeholder: {ph}")
     
     if response:
         response = str(response).removeprefix("```json").removesuffix('```')
     
     return response if isinstance(response, str) else str(response)
+
+
+def parse_batch_answers(response: str, placeholders) -> dict:
+    """Placeholder -> answer entries of a batched JSON response; unusable entries are left out."""
+    text = str(response).strip().removeprefix("```json").removeprefix("```").removesuffix("```").strip()
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        return {}
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+
+    answers = {}
+    for key, value in data.items():
+        ph = str(key).strip()
+        if ph.startswith("<") and ph.endswith(">"):
+            ph = ph[1:-1]
+        if ph in placeholders and isinstance(value, (str, int, float)) and str(value).strip():
+            answers[ph] = str(value).strip()
+    return answers
+
+
+def retrieve_table_batch(
+    placeholders,
+    session: Session,
+    user_prompt: str = "",
+    process_flow: str = "",
+    task_id: str = None,
+    corpus: str = None,
+    context_usage: ContextUsage = None,
+    folder: str = None
+) -> dict:
+    """Answer several placeholders of one table with a single LLM call.
+
+    The retrieved chunks of all placeholders are pooled and deduplicated into
+    one shared context. Placeholders missing from the returned JSON map are
+    left out of the result, for the caller to generate one by one.
+    """
+    send_call_log(task_id, "retrieval_service", f"Searching for relevant documents for {len(placeholders)} table placeholders")
+
+    relevant_docs = []
+    for ph in placeholders:
+        relevant_docs.extend(load_relevant_docs(ph, session, corpus))
+
+    # A table cell's budget per placeholder, at most a section's
+    budget = min(CONTEXT_TOKEN_BUDGETS["table"] * len(placeholders), CONTEXT_TOKEN_BUDGETS["section"])
+    context = build_context(relevant_docs, "table", budget)
+    if context_usage is not None:
+        context_usage.add(context)
+    send_call_log(
+        task_id,
+        "retrieval_service",
+        f"Using {context.chunks_used} of {context.chunks_retrieved} chunks "
+        f"({context.tokens} tokens, {context.tokens_saved} saved)"
+    )
+
+    send_call_log(task_id, "llm_service", f"Generating content for {len(placeholders)} table placeholders in one call")
+
+    llm_service = LLMService()
+    prompt = TABLE_BATCH_PROMPT_TEMPLATE.format(
+        placeholders=json.dumps(placeholders, ensure_ascii=False),
+        retrieved=context.text,
+        user_context=user_prompt or "",
+        flow_summary=process_flow or ""
+    )
+
+    # Handle image in process flow if present
+    image_base64 = None
+    if process_flow and process_flow.startswith("data:image/"):
+        image_base64 = process_flow.split(",")[1]
+
+    # Room for every cell's answer; the table stop sequences would cut the JSON short
+    cell = generation_profiles.get("table", folder)
+    profile = cell._replace(
+        max_tokens=cell.max_tokens * len(placeholders),
+        limit=cell.limit * len(placeholders),
+        stop=None,
+        timeout=max(cell.timeout, generation_profiles.get("section", folder).timeout)
+    )
+    completion = llm_service.complete(prompt, image_base64, profile)
+    if completion is not None and completion.truncated and profile.tuned:
+        completion = llm_service.complete(prompt, image_base64, profile.untuned())
+    if completion is None:
+        send_call_log(task_id, "llm_service", "Batched table call failed, generating placeholders individually", "warning")
+        return {}
+
+    answers = parse_batch_answers(completion.content, set(placeholders))
+    for answer in answers.values():
+        generation_profiles.record("table", folder, count_tokens(answer))
+
+    missing = len(placeholders) - len(answers)
+    if missing:
+        send_call_log(task_id, "llm_service", f"Batched table call answered {len(answers)} of {len(placeholders)} placeholders, generating {missing} individually", "warning")
+    else:
+        send_call_log(task_id, "llm_service", f"Generated {len(answers)} table placeholders in one call")
+    return answers
@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# Run against a throwaway SQLite database with the back-end on the import path
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    """Create the tables once for the whole run."""
+    from utils.database import init_db
+    init_db()
@@ -0,0 +1,16 @@
+import uuid
+from services.answer_store import answer_key, answer_store
+
+
+def test_drafts_are_keyed_without_request_instructions():
+    corpus = uuid.uuid4().hex
+    answer_store.save_speculative_answer(answer_key("Scope", "section"), corpus, "Scope", "section", "draft")
+
+    # A prompted fill looks drafts up by placeholder and context type only
+    prompted = answer_key("Scope", "section", "focus on validation", "flow")
+    assert prompted != answer_key("Scope", "section")
+    assert answer_store.load_speculative_answers([answer_key("Scope", "section")], corpus) == {
+        answer_key("Scope", "section"): "draft"
+    }
+    assert answer_store.load_speculative_answers([answer_key("Scope", "table")], corpus) == {}
+    assert answer_store.load_speculative_answers([answer_key("Scope", "section")], uuid.uuid4().hex) == {}
@@ -0,0 +1,33 @@
+from services.answer_store import RetrievedChunk
+from services.context_builder import merge_chunks
+
+TABLE = (
+    "| Parameter | Limit |\n"
+    "|-----------|-------|\n"
+    "| Assay     | 95.0-105.0% |\n"
+    "| Water     | NMT 0.5% |\n"
+    "| Residue   | NMT 0.1% |\n"
+)
+
+
+def chunk(text, score=0.5, kind="text"):
+    return RetrievedChunk(text, {"type": kind}, score)
+
+
+def test_overlapping_chunks_keep_their_line_breaks():
+    first = chunk(TABLE[:110], 0.4)
+    # The splitter may repeat the overlap with different whitespace
+    second = chunk("  " + TABLE[60:].replace("| Water", "|  Water"), 0.7)
+
+    merged = merge_chunks([first, second])
+
+    assert len(merged) == 1
+    assert merged[0].text == TABLE.strip()
+    assert merged[0].score == 0.7
+
+
+def test_contained_and_duplicate_chunks_are_dropped():
+    merged = merge_chunks([chunk(TABLE), chunk(TABLE[20:80]), chunk("  " + TABLE), chunk(TABLE, kind="table")])
+
+    assert [c.text for c in merged] == [TABLE.strip(), TABLE.strip()]
+    assert "\n| Assay" in merged[0].text
@@ -0,0 +1,53 @@
+from copy import deepcopy
+from docx import Document
+from docx.oxml.ns import qn
+from parsers.docx_parser import replace_placeholders
+
+
+def paragraph_texts(doc):
+    return [p.text for p in doc.paragraphs]
+
+
+def test_multi_paragraph_answer_splits_at_placeholder():
+    doc = Document()
+    p = doc.add_paragraph("<A> again <A>")
+
+    assert replace_placeholders(p._p, {"A": "ANS1\n\nANS2"}) == 2
+    assert paragraph_texts(doc) == ["ANS1", "ANS2 again ANS1", "ANS2"]
+
+
+def test_trailing_text_follows_last_answer_paragraph():
+    doc = Document()
+    p = doc.add_paragraph("Intro ")
+    p.add_run("<A>").bold = True
+    p.add_run(" mid <B> end")
+
+    replace_placeholders(p._p, {"A": "a1\n\na2\n\na3", "B": "b1\n\nb2"})
+
+    assert paragraph_texts(doc) == ["Intro a1", "a2", "a3 mid b1", "b2 end"]
+    # Answer paragraphs keep the placeholder's run formatting, moved text keeps its own
+    assert [(r.text, r.bold) for r in doc.paragraphs[2].runs] == [("a3", True), (" mid b1", None)]
+
+
+def test_single_paragraph_answer_stays_in_place():
+    doc = Document()
+    p = doc.add_paragraph("Value: <A>.")
+
+    replace_placeholders(p._p, {"A": "42"})
+
+    assert paragraph_texts(doc) == ["Value: 42."]
+
+
+def test_section_break_moves_to_last_answer_paragraph():
+    doc = Document()
+    doc.add_paragraph("First section")
+    p = doc.add_paragraph("Before <A> after")
+    p._p.get_or_add_pPr().append(deepcopy(doc.sections[0]._sectPr))
+    doc.add_paragraph("Second section")
+    assert len(doc.sections) == 2
+
+    replace_placeholders(p._p, {"A": "a1\n\na2\n\na3"})
+
+    assert paragraph_texts(doc) == ["First section", "Before a1", "a2", "a3 after", "Second section"]
+    assert len(doc.sections) == 2
+    assert doc.paragraphs[3]._p.pPr.find(qn("w:sectPr")) is not None
@@ -0,0 +1,17 @@
+from services.fill_plan import FillPlan
+
+
+def table_plan():
+    return FillPlan("hash", ["A", "B", "C", "D"], [
+        {"index": 0, "placeholders": ["A", "B"], "context_type": "table", "table_index": 0},
+        {"index": 1, "placeholders": ["C", "A"], "context_type": "table", "table_index": 0},
+        {"index": 2, "placeholders": ["D"], "context_type": "section", "table_index": None},
+    ])
+
+
+def test_table_batches_split_unique_cells():
+    assert table_plan().table_batches(2) == [["A", "B"], ["C"]]
+
+
+def test_excluded_placeholders_stay_out_of_batches():
+    assert table_plan().table_batches(2, exclude={"B"}) == [["A", "C"]]
@@ -0,0 +1,56 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from services.fill_scheduler import TaskBudget, TemplateFillScheduler
+
+
+class ConcurrencyProbe:
+    """Tracks the most calls seen running at once."""
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, delay):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(delay)
+        with self._lock:
+            self.running -= 1
+
+
+def test_completions_are_reported_in_item_order_on_the_calling_thread():
+    caller = threading.get_ident()
+    done = []
+
+    def process(item):
+        # Later items finish first
+        time.sleep(0.02 * (4 - item))
+        return item * 10
+
+    def on_done(item, result):
+        done.append((item, result, threading.get_ident() == caller))
+
+    TemplateFillScheduler(max_workers=4).run([0, 1, 2, 3], process, on_done)
+
+    assert done == [(0, 0, True), (1, 10, True), (2, 20, True), (3, 30, True)]
+
+
+def test_templates_run_concurrently_up_to_max_workers():
+    probe = ConcurrencyProbe()
+
+    TemplateFillScheduler(max_workers=3).run(list(range(8)), lambda item: probe(0.03), lambda item, result: None)
+
+    assert probe.peak == 3
+
+
+def test_budget_limits_concurrent_calls_across_templates():
+    probe = ConcurrencyProbe()
+    generate = TaskBudget(max_calls=2).wrap(lambda ph, context_type: probe(0.03))
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        list(executor.map(lambda ph: generate(ph, "section"), range(12)))
+
+    assert probe.peak == 2
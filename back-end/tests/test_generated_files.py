@@ -0,0 +1,40 @@
+import asyncio
+import io
+import os
+import stat
+import zipfile
+from docx import Document
+from services.generated_files import GeneratedFileIndex, UMASK, stream_zip, task_file_name
+
+
+def test_saved_documents_honour_the_umask(tmp_path):
+    index = GeneratedFileIndex(str(tmp_path))
+    record = index.save(Document(), "filled_test.docx")
+
+    mode = stat.S_IMODE(os.stat(index.resolve(record)).st_mode)
+    assert mode == 0o666 & ~UMASK
+
+
+def test_task_outputs_do_not_overwrite_each_other(tmp_path):
+    index = GeneratedFileIndex(str(tmp_path))
+    first = index.save(Document(), task_file_name("task-a", "filled_test.docx"), task_id="task-a")
+    second = index.save(Document(), task_file_name("task-b", "filled_test.docx"), task_id="task-b")
+
+    assert index.resolve(first) != index.resolve(second)
+    assert index.get("task-a/filled_test.docx").task_id == "task-a"
+    assert index.get("../filled_test.docx") is None
+
+
+def test_stream_zip_archives_async_entries(tmp_path):
+    index = GeneratedFileIndex(str(tmp_path))
+    record = index.save(Document(), task_file_name("task-c", "filled_test.docx"), task_id="task-c")
+
+    async def entries():
+        yield "filled_test.docx", index.resolve(record)
+
+    async def collect():
+        return b"".join([chunk async for chunk in stream_zip(entries())])
+
+    with zipfile.ZipFile(io.BytesIO(asyncio.run(collect()))) as archive:
+        assert archive.namelist() == ["filled_test.docx"]
+        assert len(archive.read("filled_test.docx")) == record.size
@@ -0,0 +1,23 @@
+from io import BytesIO
+from PIL import Image
+from utils.image_processing import ImageStats, normalize_image
+
+
+def png(width: int, height: int) -> bytes:
+    buffer = BytesIO()
+    Image.effect_noise((width, height), 64).convert("RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_image_stats_report_bytes_saved():
+    stats = ImageStats()
+    for data in (png(1200, 800), png(300, 200)):
+        stats.add_sent(data, normalize_image(data, max_edge=400).data)
+    stats.reused += 1
+
+    report = stats.as_dict()
+    assert report["described"] == 2
+    assert report["reused"] == 1
+    assert report["sent_bytes"] < report["original_bytes"]
+    assert report["bytes_saved"] == report["original_bytes"] - report["sent_bytes"] > 0
+    assert f"({report['bytes_saved']} saved)" in stats.summary()
@@ -0,0 +1,42 @@
+from io import BytesIO
+import pytest
+from PIL import Image as PILImage
+from services.image_store import ImageStore
+
+
+def png(image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("image", [
+    PILImage.new("RGBA", (40, 20), (0, 0, 0, 0)),
+    PILImage.new("RGBA", (40, 20), (0, 0, 0, 0)).convert("P"),
+], ids=["rgba", "palette"])
+def test_transparent_thumbnails_are_white(tmp_path, image):
+    store = ImageStore(str(tmp_path))
+    sha256 = store.put(png(image), "image/png")
+
+    thumbnail = PILImage.open(BytesIO(store.thumbnail(sha256, 10)))
+    assert thumbnail.size == (10, 5)
+    assert thumbnail.convert("L").getextrema()[0] > 240
+    assert list(tmp_path.glob("*.tmp")) == []
+
+
+def test_extracted_images_are_stored_and_referenced_by_hash(tmp_path):
+    store = ImageStore(str(tmp_path))
+    data = png(PILImage.new("RGB", (200, 100), (10, 20, 30)))
+
+    entry = store.put_extracted("img_1.png", data)
+
+    assert "data" not in entry
+    assert (entry["mime"], entry["size"], entry["width"], entry["height"]) == ("image/png", len(data), 200, 100)
+    assert store.get(entry["hash"]).data == data
+
+
+def test_tiny_and_unreadable_extracted_images_are_not_stored(tmp_path):
+    store = ImageStore(str(tmp_path))
+
+    assert store.put_extracted("icon.png", png(PILImage.new("RGB", (8, 8))))["hash"] is None
+    assert store.put_extracted("broken.png", b"not an image") is None
@@ -0,0 +1,88 @@
+from datetime import timedelta
+import pytest
+from sqlmodel import Session, update
+from utils.config import JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+from utils.database import engine
+from utils.models import FillJob, utc_now
+from services.job_queue import job_queue
+
+
+@pytest.fixture(autouse=True)
+def empty_queue():
+    with Session(engine) as session:
+        session.exec(update(FillJob).values(status="done"))
+        session.commit()
+
+
+def expire_lease(job_id: int):
+    with Session(engine) as session:
+        session.exec(
+            update(FillJob)
+            .where(FillJob.id == job_id)
+            .values(locked_at=utc_now() - timedelta(seconds=JOB_LEASE_SECONDS + 1))
+        )
+        session.commit()
+
+
+def get_job(job_id: int) -> FillJob:
+    with Session(engine) as session:
+        return session.get(FillJob, job_id)
+
+
+def test_heartbeat_keeps_job_from_being_requeued():
+    job_id = job_queue.enqueue("task", "template", {})
+    job_queue.claim("worker-a")
+    expire_lease(job_id)
+
+    assert job_queue.heartbeat(job_id, "worker-a")
+    assert job_queue.requeue_stale() == (0, [])
+    assert job_queue.complete(job_id, "worker-a")
+
+
+def test_stale_worker_cannot_complete_reclaimed_job():
+    job_id = job_queue.enqueue("task", "template", {})
+    job_queue.claim("worker-a")
+    expire_lease(job_id)
+    assert job_queue.requeue_stale() == (1, [])
+    assert job_queue.claim("worker-b").id == job_id
+
+    assert not job_queue.heartbeat(job_id, "worker-a")
+    assert not job_queue.complete(job_id, "worker-a")
+    assert job_queue.fail(job_id, "worker-a", "late failure")
+    assert get_job(job_id).status == "running"
+    assert job_queue.complete(job_id, "worker-b")
+
+
+def test_stale_job_fails_after_max_attempts():
+    job_id = job_queue.enqueue("task-x", "template", {})
+    for attempt in range(JOB_MAX_ATTEMPTS):
+        assert job_queue.claim(f"worker-{attempt}").id == job_id
+        expire_lease(job_id)
+        requeued, failed = job_queue.requeue_stale()
+
+    assert (requeued, failed) == (0, ["task-x"])
+    assert get_job(job_id).status == "failed"
+
+
+def test_low_priority_jobs_wait_for_user_jobs():
+    speculate_id = job_queue.enqueue("speculative", "speculate", {"corpus_version": "c1"})
+    template_id = job_queue.enqueue("task", "template", {})
+    assert job_queue.has_user_work()
+
+    assert job_queue.claim("worker-a").id == template_id
+    # Still running, a second worker stays free for the next user job
+    assert job_queue.claim("worker-b") is None
+    assert job_queue.complete(template_id, "worker-a")
+    assert not job_queue.has_user_work()
+
+    assert job_queue.claim("worker-b").id == speculate_id
+
+
+def test_speculate_jobs_are_deduplicated_per_corpus():
+    first = job_queue.enqueue_unique("speculative", "speculate", {"corpus_version": "c1"})
+
+    assert job_queue.enqueue_unique("speculative", "speculate", {"corpus_version": "c1"}) is None
+    assert job_queue.enqueue_unique("speculative", "speculate", {"corpus_version": "c2"}) not in (None, first)
+    # A running job does not block re-enqueueing the rest of its work
+    assert job_queue.claim("worker-a").id == first
+    assert job_queue.enqueue_unique("speculative", "speculate", {"corpus_version": "c1"}) is not None
@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from services.placeholder_memo import PlaceholderMemo
+
+
+class FakeGenerator:
+    """generate_fn that counts calls per placeholder and can fail the first ones."""
+
+    def __init__(self, fail_first: int = 0, delay: float = 0.05):
+        self.calls = Counter()
+        self.fail_first = fail_first
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def __call__(self, ph, context_type):
+        with self._lock:
+            self.calls[ph] += 1
+            attempt = self.calls[ph]
+        # Slow enough for the other threads to find the generation pending
+        time.sleep(self.delay)
+        if attempt <= self.fail_first:
+            return None
+        return f"{ph} answer {attempt}"
+
+
+def run_threads(memo, generate_fn, placeholders, threads=8):
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(lambda ph: memo.get_or_generate(ph, "table", generate_fn), placeholders))
+
+
+def test_concurrent_requests_generate_each_key_once():
+    memo = PlaceholderMemo()
+    generate = FakeGenerator()
+
+    results = run_threads(memo, generate, ["A"] * 8 + ["B"] * 4)
+
+    assert generate.calls == {"A": 1, "B": 1}
+    assert results == ["A answer 1"] * 8 + ["B answer 1"] * 4
+    assert (memo.misses, memo.hits) == (2, 10)
+
+
+def test_failed_generation_is_retried_by_a_waiting_thread():
+    memo = PlaceholderMemo()
+    generate = FakeGenerator(fail_first=1)
+
+    results = run_threads(memo, generate, ["A"] * 6)
+
+    assert generate.calls["A"] == 2
+    assert results.count(None) == 1
+    assert results.count("A answer 2") == 5
+    assert memo.answers[memo.key("A", "table")] == "A answer 2"
+    assert (memo.misses, memo.hits) == (2, 4)
+
+
+def test_owner_exception_releases_waiters():
+    memo = PlaceholderMemo()
+    calls = Counter()
+
+    def generate(ph, context_type):
+        calls[ph] += 1
+        time.sleep(0.05)
+        if calls[ph] == 1:
+            raise RuntimeError("LLM down")
+        return "recovered"
+
+    def lookup(_):
+        try:
+            return memo.get_or_generate("A", "section", generate)
+        except RuntimeError:
+            return "raised"
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lookup, range(4)))
+
+    assert sorted(results) == ["raised"] + ["recovered"] * 3
+    assert calls["A"] == 2
+
+
+def test_batch_answers_count_once_and_missing_ones_fall_back():
+    memo = PlaceholderMemo()
+    batches = []
+
+    def batch_fn(placeholders, context_type):
+        batches.append(placeholders)
+        return {"A": "batched A", "B": "batched B"}
+
+    generate = FakeGenerator(delay=0)
+    assert memo.generate_batch(["A", "B", "C"], "table", batch_fn) == 2
+    assert batches == [["A", "B", "C"]]
+
+    results = run_threads(memo, generate, ["A", "B", "C", "A"])
+
+    assert results == ["batched A", "batched B", "C answer 1", "batched A"]
+    assert generate.calls == {"C": 1}
+    # First lookups of batch answers are not reuses, the repeated A is
+    assert (memo.misses, memo.hits, memo.batched, memo.batches) == (3, 1, 2, 1)
+
+
+def test_batch_skips_answered_and_single_placeholders():
+    memo = PlaceholderMemo()
+    memo.seed({memo.key("A", "table"): "seeded A"})
+
+    def batch_fn(placeholders, context_type):
+        raise AssertionError("a single unanswered placeholder is not batched")
+
+    assert memo.generate_batch(["A", "B"], "table", batch_fn) == 0
+    assert memo.get_or_generate("A", "table", FakeGenerator()) == "seeded A"
+    assert (memo.seeded, memo.hits, memo.misses) == (1, 1, 0)
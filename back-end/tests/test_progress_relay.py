@@ -0,0 +1,61 @@
+from datetime import timedelta
+from sqlmodel import Session, select
+from api.websocket import ProgressEventBus
+from services.progress_relay import ProgressRelay
+from utils.database import engine
+from utils.models import ProgressEvent, utc_now
+
+
+def test_worker_events_reach_another_process_once_in_order():
+    worker = ProgressRelay()
+    api = ProgressRelay()
+    api.fetch()
+
+    worker.publish("t1", {"type": "call_log", "message": "first"})
+    worker.publish("t1", {"type": "call_log", "message": "second"})
+    worker.publish("t2", {"status": "processing"})
+    assert worker.flush() == 3
+
+    assert api.fetch() == [
+        ("t1", {"type": "call_log", "message": "first"}),
+        ("t1", {"type": "call_log", "message": "second"}),
+        ("t2", {"status": "processing"}),
+    ]
+    assert api.fetch() == []
+
+
+def test_first_fetch_skips_older_events():
+    worker = ProgressRelay()
+    worker.publish("old", {"message": "before start"})
+    worker.flush()
+
+    api = ProgressRelay()
+    assert api.fetch() == []
+    worker.publish("new", {"message": "after start"})
+    worker.flush()
+    assert api.fetch() == [("new", {"message": "after start"})]
+
+
+def test_prune_deletes_expired_events():
+    with Session(engine) as session:
+        session.add(ProgressEvent(task_id="expired", payload="{}", created_at=utc_now() - timedelta(hours=1)))
+        session.add(ProgressEvent(task_id="recent", payload="{}"))
+        session.commit()
+
+    ProgressRelay(retention_seconds=600).prune()
+
+    with Session(engine) as session:
+        task_ids = set(session.exec(select(ProgressEvent.task_id)).all())
+    assert "expired" not in task_ids
+    assert "recent" in task_ids
+
+
+def test_bus_without_loop_forwards_events():
+    bus = ProgressEventBus()
+    forwarded = []
+    bus.publish("t1", {"message": "dropped"})
+    bus.forward = lambda task_id, update_data: forwarded.append((task_id, update_data))
+    bus.publish("t1", {"message": "kept"})
+
+    assert forwarded == [("t1", {"message": "kept"})]
+    assert not bus.events
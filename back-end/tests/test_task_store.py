@@ -0,0 +1,54 @@
+import uuid
+import pytest
+from utils.task_store import task_store
+
+
+@pytest.fixture
+def task_id():
+    task_id = str(uuid.uuid4())
+    task_store.create_task(task_id)
+    task_store.set_files(task_id, ["a.docx", "b.docx"])
+    return task_id
+
+
+def test_version_increments_on_every_update(task_id):
+    version = task_store.get_version(task_id)
+    task_store.mark_file(task_id, "a.docx", "processing")
+    task_store.mark_file(task_id, "a.docx", "done")
+
+    assert task_store.get_version(task_id) == version + 2
+    assert task_store.get_task(task_id)["version"] == version + 2
+
+
+def test_since_lists_only_files_changed_after_version(task_id):
+    version = task_store.get_version(task_id)
+    task_store.mark_file(task_id, "b.docx", "done")
+
+    task = task_store.get_task(task_id, since_version=version)
+    assert [f["templateName"] for f in task["files"]] == ["b.docx"]
+    assert task_store.get_task(task_id, since_version=task["version"])["files"] == []
+
+
+def test_second_done_does_not_count_twice(task_id):
+    task_store.mark_file(task_id, "a.docx", "done")
+    task_store.mark_file(task_id, "a.docx", "done")
+
+    assert task_store.get_task(task_id)["files_done"] == 1
+
+
+def test_resume_refused_while_task_is_active(task_id):
+    task_store.mark_file(task_id, "a.docx", "processing")
+
+    assert not task_store.reset_for_resume(task_id, active_window_seconds=300)
+    assert task_store.get_task(task_id)["files"][0]["status"] == "processing"
+
+
+def test_resume_resets_unfinished_templates(task_id):
+    task_store.mark_file(task_id, "a.docx", "done")
+    task_store.mark_file(task_id, "b.docx", "error")
+    task_store.set_status(task_id, "error")
+
+    assert task_store.reset_for_resume(task_id, active_window_seconds=300)
+    task = task_store.get_task(task_id)
+    assert task["status"] == "processing"
+    assert [f["status"] for f in task["files"]] == ["done", "pending"]
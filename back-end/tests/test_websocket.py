@@ -0,0 +1,15 @@
+from api.websocket import EventHistory
+
+
+def test_sequence_numbers_survive_buffer_eviction():
+    history = EventHistory(size=10, max_tasks=2)
+    history.record("a", {"message": "first"})
+    history.record("a", {"message": "second"})
+    history.record("b", {})
+    history.record("c", {})
+
+    assert "a" not in history.tasks
+    assert history.since("a", 2) == ([], False)
+    assert history.since("a", 0) == ([], True)
+    assert history.record("a", {"message": "third"})["seq"] == 3
+    assert history.since("a", 2) == ([{"message": "third", "seq": 3}], False)
@@ -4,9 +4,12 @@ from .models import Image
 import uuid
 from sqlmodel import Session
 from services.llm_service import LLMService
+from services.image_store import image_store
+from services.caption_cache import caption_cache
+from .image_processing import ImageStats, normalize_image
 
 
-def text_n_images(data, document_id, session: Session):
+def text_n_images(data, document_id, session: Session, stats: ImageStats = None):
     documents = []
     splitter = TokenTextSplitter(chunk_size=256, chunk_overlap=50)
 
@@ -21,24 +24,59 @@ def text_n_images(data, document_id, session: Session):
     # Process images with multimodal MyGenAssist
     img_docs = []
     llm_service = LLMService()
+    image_prompt = "Please describe this image in at most 200 words, focusing on key details and semantic meaning."
+    if stats is None:
+        stats = ImageStats()
     
     for component in data:
         images = data[component]['images']
         for img in images:
-            image_prompt = "Please describe this image in at most 200 words, focusing on key details and semantic meaning."
-            desc = llm_service.query_multimodal(img["base64"], image_prompt)
-            if not desc:
-                desc = "[Description unavailable due to API error]"
+            # The parser stored the image as it arrived, only icons and spacers have no hash
+            image_hash = img["hash"]
+            if image_hash is None:
+                stats.skipped += 1
+                continue
+            # Bytes are loaded one image at a time
+            blob = image_store.get(image_hash)
+            if blob is None:
+                print(f"[IMAGES] Stored bytes of {img['filename']} are missing")
+                continue
+            original = blob.data
+
+            # Identical or near-identical images (logos, re-scanned figures) are described once
+            desc = caption_cache.get(original, image_prompt, image_hash)
+            if desc is not None:
+                stats.reused += 1
+            else:
+                # Downscaled copy for the model, the original is what gets stored
+                try:
+                    image_data = normalize_image(original).data
+                except Exception as e:
+                    print(f"[IMAGES] Sending {img['filename']} unchanged, normalization failed: {e}")
+                    image_data = original
+                stats.add_sent(original, image_data)
+                desc = llm_service.query_multimodal(image_data, image_prompt)
+                if desc:
+                    caption_cache.put(original, image_prompt, desc, image_hash)
+                else:
+                    desc = "[Description unavailable due to API error]"
 
             image_uuid = str(uuid.uuid4())
-            doc = Document(text=desc, metadata={'page_label': component, "type": "image", "image_uuid": image_uuid})
+            doc = Document(text=desc, metadata={
+                'page_label': component,
+                "type": "image",
+                "image_uuid": image_uuid,
+                "image_hash": image_hash
+            })
             img_docs.append(doc)
 
-            # Save image locally in database
-            img_record = Image(document_id=document_id, image_id=image_uuid, image_b64=img["base64"])
+            # Reference the stored image bytes by hash
+            img_record = Image(document_id=document_id, image_id=image_uuid, image_hash=image_hash)
             session.add(img_record)
     documents.extend(img_docs)
     session.commit()
+    if img_docs or stats.skipped:
+        print(f"[IMAGES] {stats.summary()}")
 
     # Process tables
     table_docs = []
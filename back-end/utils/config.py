@@ -21,6 +21,107 @@ PGVECTOR_HOST = os.getenv('PGVECTOR_HOST')
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 INPUT_FOLDER = os.path.join(BASE_DIR, "inputs")
 GENERATED_FOLDER = os.path.join(BASE_DIR, "generated")
+CACHE_FOLDER = os.path.join(BASE_DIR, "cache")
+FILL_PLAN_FOLDER = os.path.join(CACHE_FOLDER, "fill_plans")
+THUMBNAIL_FOLDER = os.path.join(CACHE_FOLDER, "thumbnails")
+
+# Images are downscaled and re-encoded before multimodal calls; smaller ones are skipped as decoration
+LLM_IMAGE_MAX_EDGE = int(os.getenv("LLM_IMAGE_MAX_EDGE", "1568"))
+LLM_IMAGE_MIN_EDGE = int(os.getenv("LLM_IMAGE_MIN_EDGE", "32"))
+LLM_IMAGE_FORMAT = os.getenv("LLM_IMAGE_FORMAT", "JPEG").upper()  # JPEG or WEBP
+LLM_IMAGE_QUALITY = int(os.getenv("LLM_IMAGE_QUALITY", "85"))
+
+# Images whose perceptual hashes differ in at most this many of 64 bits share a caption (0 = exact matches only)
+IMAGE_CAPTION_MAX_DISTANCE = int(os.getenv("IMAGE_CAPTION_MAX_DISTANCE", "4"))
+
+# Retrieved context per prompt: token budget by context type and the lowest fused retrieval score kept
+CONTEXT_TOKEN_BUDGETS = {
+    "table": int(os.getenv("CONTEXT_TOKEN_BUDGET_TABLE", "1000")),
+    "section": int(os.getenv("CONTEXT_TOKEN_BUDGET_SECTION", "4000")),
+}
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.05"))
+
+# Generation limits per context type (template folders can override them in generation_profiles.json)
+GENERATION_PROFILES = {
+    "table": {
+        "max_tokens": int(os.getenv("LLM_MAX_TOKENS_TABLE", "400")),
+        "timeout": float(os.getenv("LLM_TIMEOUT_TABLE", "60")),
+    },
+    "section": {
+        "max_tokens": int(os.getenv("LLM_MAX_TOKENS_SECTION", "3000")),
+        "timeout": float(os.getenv("LLM_TIMEOUT_SECTION", "180")),
+    },
+    "image": {
+        "max_tokens": int(os.getenv("LLM_MAX_TOKENS_IMAGE", "600")),
+        "timeout": float(os.getenv("LLM_TIMEOUT_IMAGE", "120")),
+    },
+    "process_flow": {
+        "max_tokens": int(os.getenv("LLM_MAX_TOKENS_PROCESS_FLOW", "2000")),
+        "timeout": float(os.getenv("LLM_TIMEOUT_PROCESS_FLOW", "180")),
+    },
+}
+
+# Lower max_tokens to the observed answer lengths (99th percentile x headroom) of the last window answers
+GENERATION_TUNING = os.getenv("GENERATION_TUNING", "true").lower() == "true"
+GENERATION_TUNE_MIN_SAMPLES = int(os.getenv("GENERATION_TUNE_MIN_SAMPLES", "20"))
+GENERATION_TUNE_HEADROOM = float(os.getenv("GENERATION_TUNE_HEADROOM", "1.5"))
+GENERATION_TUNE_WINDOW = int(os.getenv("GENERATION_TUNE_WINDOW", "200"))
+
+# Table placeholders of the same table are answered together, at most TABLE_BATCH_SIZE per LLM call
+BATCH_TABLE_PLACEHOLDERS = os.getenv("BATCH_TABLE_PLACEHOLDERS", "false").lower() == "true"
+TABLE_BATCH_SIZE = int(os.getenv("TABLE_BATCH_SIZE", "20"))
+
+# Template filling concurrency (per task)
+TEMPLATE_FILL_CONCURRENCY = int(os.getenv("TEMPLATE_FILL_CONCURRENCY", "4"))
+LLM_CALL_CONCURRENCY = int(os.getenv("LLM_CALL_CONCURRENCY", "4"))
+
+# Extra attempts for a template whose fill failed (only failed placeholders are regenerated)
+FILL_FILE_RETRIES = int(os.getenv("FILL_FILE_RETRIES", "1"))
+
+# Reuse answers of the previous fill of a template while the PDF corpus is unchanged
+INCREMENTAL_FILL = os.getenv("INCREMENTAL_FILL", "true").lower() == "true"
+
+# Template folders whose answers are pre-generated after each PDF upload (comma separated, empty disables)
+SPECULATIVE_FILL_FOLDERS = [f.strip() for f in os.getenv("SPECULATIVE_FILL_FOLDERS", "").split(",") if f.strip()]
+SPECULATIVE_FILL_DELAY_SECONDS = float(os.getenv("SPECULATIVE_FILL_DELAY_SECONDS", "0.5"))
+# Placeholders drafted per queue job before it is re-enqueued behind user jobs
+SPECULATIVE_FILL_SLICE = int(os.getenv("SPECULATIVE_FILL_SLICE", "20"))
+
+# WebSocket progress events are batched every PROGRESS_FLUSH_SECONDS; at most PROGRESS_QUEUE_MAX wait to be sent
+PROGRESS_FLUSH_SECONDS = float(os.getenv("PROGRESS_FLUSH_SECONDS", "0.05"))
+PROGRESS_QUEUE_MAX = int(os.getenv("PROGRESS_QUEUE_MAX", "10000"))
+
+# Long-polling of GET /api/template/progress: longest allowed wait and how often the task is re-read
+PROGRESS_MAX_WAIT_SECONDS = float(os.getenv("PROGRESS_MAX_WAIT_SECONDS", "30"))
+PROGRESS_WAIT_POLL_SECONDS = float(os.getenv("PROGRESS_WAIT_POLL_SECONDS", "0.5"))
+
+# A followed task bundle download is closed after the task made no progress for this long
+BUNDLE_IDLE_TIMEOUT_SECONDS = float(os.getenv("BUNDLE_IDLE_TIMEOUT_SECONDS", "600"))
+
+# Progress events kept per task for WebSocket replay (?since=<seq>), for this many recent tasks
+EVENT_HISTORY_SIZE = int(os.getenv("EVENT_HISTORY_SIZE", "1000"))
+EVENT_HISTORY_TASKS = int(os.getenv("EVENT_HISTORY_TASKS", "200"))
+
+# Per-connection WebSocket backpressure: clients that fall this far behind or stall a send are dropped
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "5"))
+
+# Template tasks are garbage collected this long after their last update
+TASK_TTL_SECONDS = int(os.getenv("TASK_TTL_SECONDS", str(24 * 60 * 60)))
+
+# A processing task that made progress this recently is considered running (no resume, speculative fill waits)
+TASK_ACTIVE_WINDOW_SECONDS = int(os.getenv("TASK_ACTIVE_WINDOW_SECONDS", "300"))
+
+# Template fill execution: "background" runs in the API process, "queue" hands work to run_worker.py
+TEMPLATE_FILL_MODE = os.getenv("TEMPLATE_FILL_MODE", "background")
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", str(30 * 60)))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", str(JOB_LEASE_SECONDS / 6)))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# Progress events of queue workers reach the API processes through the database
+PROGRESS_RELAY_POLL_SECONDS = float(os.getenv("PROGRESS_RELAY_POLL_SECONDS", "0.5"))
+PROGRESS_RELAY_RETENTION_SECONDS = int(os.getenv("PROGRESS_RELAY_RETENTION_SECONDS", "600"))
 
 # Ensure generated folder exists
 os.makedirs(GENERATED_FOLDER, exist_ok=True)
@@ -1,4 +1,5 @@
 import os
+from sqlalchemy import inspect, text
 from sqlmodel import create_engine, SQLModel, Session
 from dotenv import load_dotenv
 load_dotenv()
@@ -9,6 +10,34 @@ engine = create_engine(DATABASE_URL, echo=True)
 
 def init_db():
     SQLModel.metadata.create_all(engine)
+    upgrade_schema()
+
+def upgrade_schema():
+    """Bring tables created by older versions up to date: add new nullable or defaulted columns,
+    relax columns that became optional and create missing indexes
+    (create_all only creates missing tables)."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"]: column for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    if not column.nullable and column.server_default is None:
+                        continue
+                    definition = f'"{column.name}" {column.type.compile(dialect=engine.dialect)}'
+                    if not column.nullable:
+                        definition += f" NOT NULL DEFAULT {column.server_default.arg}"
+                    conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN {definition}'))
+                    print(f"[DATABASE] Added column {table.name}.{column.name}")
+                elif column.nullable and not existing[column.name]["nullable"] and engine.dialect.name == "postgresql":
+                    conn.execute(text(f'ALTER TABLE "{table.name}" ALTER COLUMN "{column.name}" DROP NOT NULL'))
+                    print(f"[DATABASE] Made column {table.name}.{column.name} nullable")
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
 
 def get_session():
     with Session(engine) as session:
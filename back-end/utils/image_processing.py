@@ -0,0 +1,133 @@
+"""
+Image normalization before multimodal LLM calls.
+
+Images are downscaled to LLM_IMAGE_MAX_EDGE and re-encoded as JPEG or
+WebP, which is all the model needs to describe them and far smaller than
+full resolution PNG scans. The stored originals are left untouched.
+"""
+from io import BytesIO
+from typing import NamedTuple
+from PIL import Image, ImageOps
+from utils.config import (
+    LLM_IMAGE_MAX_EDGE,
+    LLM_IMAGE_MIN_EDGE,
+    LLM_IMAGE_FORMAT,
+    LLM_IMAGE_QUALITY,
+)
+
+
+class NormalizedImage(NamedTuple):
+    data: bytes
+    mime: str
+    original_size: int
+    width: int
+    height: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_size - len(self.data)
+
+
+class ImageStats:
+    """Per upload counts of the images described and the bytes sent for them."""
+
+    def __init__(self):
+        self.described = 0
+        self.reused = 0
+        self.skipped = 0
+        self.original_bytes = 0
+        self.sent_bytes = 0
+
+    def add_sent(self, original: bytes, sent: bytes):
+        self.described += 1
+        self.original_bytes += len(original)
+        self.sent_bytes += len(sent)
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - self.sent_bytes
+
+    def as_dict(self) -> dict:
+        return {
+            "described": self.described,
+            "reused": self.reused,
+            "skipped": self.skipped,
+            "original_bytes": self.original_bytes,
+            "sent_bytes": self.sent_bytes,
+            "bytes_saved": self.bytes_saved,
+        }
+
+    def summary(self) -> str:
+        """Human readable summary of the images described and the bytes saved."""
+        return (
+            f"Described {self.described} images, reused {self.reused} cached captions, "
+            f"skipped {self.skipped} tiny ones; sent {self.sent_bytes} of {self.original_bytes} bytes "
+            f"({self.bytes_saved} saved)"
+        )
+
+
+def image_size(data: bytes):
+    """(width, height) read from the image header without decoding the pixels."""
+    with Image.open(BytesIO(data)) as image:
+        return image.size
+
+
+def image_mime(data: bytes) -> str:
+    """MIME type from the image header."""
+    with Image.open(BytesIO(data)) as image:
+        return Image.MIME.get(image.format, "application/octet-stream")
+
+
+def is_tiny(width: int, height: int) -> bool:
+    """Icons, bullets and spacers that are not worth a description."""
+    return max(width, height) < LLM_IMAGE_MIN_EDGE
+
+
+def normalize_image(data: bytes, max_edge: int = LLM_IMAGE_MAX_EDGE) -> NormalizedImage:
+    """Downscale and re-encode an image for a multimodal call.
+
+    The original bytes are kept when re-encoding would not make them smaller
+    and no resize was needed.
+    """
+    image = Image.open(BytesIO(data))
+    original_format = image.format
+    image = ImageOps.exif_transpose(image)
+
+    resized = max(image.size) > max_edge
+    if resized:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    if image.mode not in ("RGB", "L"):
+        # Flatten transparency onto white, JPEG has no alpha channel
+        background = Image.new("RGB", image.size, "white")
+        rgba = image.convert("RGBA")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+
+    buffer = BytesIO()
+    if LLM_IMAGE_FORMAT == "WEBP":
+        image.save(buffer, format="WEBP", quality=LLM_IMAGE_QUALITY, method=4)
+        mime = "image/webp"
+    else:
+        image.save(buffer, format="JPEG", quality=LLM_IMAGE_QUALITY, optimize=True)
+        mime = "image/jpeg"
+    encoded = buffer.getvalue()
+
+    if not resized and len(encoded) >= len(data) and original_format in ("PNG", "JPEG", "WEBP"):
+        return NormalizedImage(data, f"image/{original_format.lower()}", len(data), *image.size)
+    return NormalizedImage(encoded, mime, len(data), *image.size)
+
+
+def difference_hash(data: bytes, hash_size: int = 8) -> int:
+    """64-bit perceptual difference hash: near-identical images differ in only a few bits."""
+    with Image.open(BytesIO(data)) as image:
+        # JPEG decoders can decode at reduced size directly
+        image.draft("L", (hash_size * 8, hash_size * 8))
+        pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
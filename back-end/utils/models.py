@@ -1,8 +1,14 @@
 from sqlmodel import Field, SQLModel
 from typing import Optional
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 load_dotenv()
 
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
 class PDFS(SQLModel, table=True):
     pdf_file_name: str = Field(index=True, primary_key=True)
     pdf_uuid: str = Field(index=True)
@@ -11,4 +17,106 @@ class Image(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     document_id: str = Field(index=True)
     image_id: str = Field(index=True)
-    image_b64: str
+    image_hash: Optional[str] = Field(default=None, index=True)  # ImageBlob.sha256
+    image_b64: Optional[str] = None  # only set on rows stored before the image blob store
+
+
+class ImageBlob(SQLModel, table=True):
+    sha256: str = Field(primary_key=True)
+    mime: str
+    size: int
+    data: bytes
+    created_at: datetime = Field(default_factory=utc_now)
+
+
+class TemplateTask(SQLModel, table=True):
+    task_id: str = Field(primary_key=True)
+    status: str = Field(default="processing")
+    files_done: int = Field(default=0)
+    files_total: int = Field(default=0)
+    folder_name: Optional[str] = None
+    user_prompt: Optional[str] = None
+    process_flow: Optional[str] = None
+    process_flow_description: Optional[str] = None
+    selected_files: Optional[str] = None  # JSON encoded list
+    created_at: datetime = Field(default_factory=utc_now)
+    updated_at: datetime = Field(default_factory=utc_now, index=True)
+    # Incremented by the database on every change, used as progress version and ETag
+    version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+
+class TemplateTaskFile(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    task_id: str = Field(index=True)
+    position: int
+    template_name: str
+    status: str = Field(default="pending")  # pending, processing, done, error
+    output_file_name: Optional[str] = None
+    download_url: Optional[str] = None
+    updated_at: datetime = Field(default_factory=utc_now)
+    version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})  # task version of the last change
+
+class PlaceholderAnswer(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    task_id: str = Field(index=True)
+    answer_key: str = Field(index=True)  # hash of placeholder, context type, user prompt and flow
+    placeholder: str
+    context_type: str
+    answer: str
+    created_at: datetime = Field(default_factory=utc_now)
+
+class TemplateSnapshot(SQLModel, table=True):
+    template_key: str = Field(primary_key=True)  # "<folder>/<template file>"
+    content_hash: str
+    corpus_version: str
+    answers: str  # JSON encoded answer key -> answer of the last successful fill
+    updated_at: datetime = Field(default_factory=utc_now)
+
+class FillJob(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    task_id: str = Field(index=True)
+    kind: str  # "task" or "template"
+    payload: str  # JSON encoded job arguments
+    status: str = Field(default="queued", index=True)  # queued, running, done, failed
+    attempts: int = Field(default=0)
+    worker_id: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=utc_now)
+    locked_at: Optional[datetime] = None
+
+class ProgressEvent(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    task_id: str = Field(index=True)
+    payload: str  # JSON encoded progress event, relayed from fill workers to the API processes
+    created_at: datetime = Field(default_factory=utc_now, index=True)
+
+class SpeculativeAnswer(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    answer_key: str = Field(index=True)  # PlaceholderMemo key without user prompt / process flow
+    corpus_version: str = Field(index=True)
+    placeholder: str
+    context_type: str
+    answer: str
+    created_at: datetime = Field(default_factory=utc_now)
+
+class RetrievalCache(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    query_key: str = Field(index=True)  # sha256 of the retrieval query
+    corpus_version: str = Field(index=True)
+    chunks: str  # JSON encoded list of {text, metadata, score}
+    created_at: datetime = Field(default_factory=utc_now)
+
+class GeneratedFile(SQLModel, table=True):
+    name: str = Field(primary_key=True)  # file name inside GENERATED_FOLDER
+    path: str  # path relative to GENERATED_FOLDER
+    size: int
+    sha256: str
+    task_id: Optional[str] = Field(default=None, index=True)
+    modified_at: datetime = Field(default_factory=utc_now)
+
+class ImageCaption(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    image_hash: str = Field(index=True)  # sha256 of the image bytes
+    prompt_key: str = Field(index=True)  # sha256 of the prompt the caption answers
+    phash: str  # 64-bit difference hash as 16 hex digits
+    caption: str
+    created_at: datetime = Field(default_factory=utc_now)
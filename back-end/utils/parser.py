@@ -1,12 +1,12 @@
 import re
 from llama_cloud_services import LlamaParse
 from dotenv import load_dotenv
-import base64
 import os
 import asyncio
 import json
 import pandas as pd
 from io import StringIO
+from services.image_store import image_store
 
 load_dotenv()
 
@@ -31,15 +31,14 @@ async def extract_pdf_llamaparse(filename: str):
         for image in page.images:
             try:
                 image_data = await result.aget_image_data(image.name)
-                image_b64 = base64.b64encode(image_data).decode("utf-8")
-                image_list.append({
-                    "filename": image.name,
-                    "mime": "image/" + str(image.name).split(".")[-1],
-                    "base64": image_b64
-                })
-                num_images += 1
             except Exception as e:
                 print(f"Failed to fetch image {image.name}: {e}")
+                continue
+            # Stored right away, pages only keep the hash
+            entry = await asyncio.to_thread(image_store.put_extracted, image.name, image_data)
+            if entry is not None:
+                image_list.append(entry)
+                num_images += 1
 
         table_list = []
         for item in page.items:
@@ -63,7 +62,7 @@ def save_output(json_data):
     os.makedirs(images_dir, exist_ok=True)
     os.makedirs(tables_dir, exist_ok=True)
 
-    # Save JSON dump
+    # Save JSON dump, images are referenced by hash and written as files below
     with open(os.path.join(output_dir, "output.json"), "w", encoding="utf-8") as f:
         json.dump(json_data, f, ensure_ascii=False, indent=4)
 
@@ -72,11 +71,13 @@ def save_output(json_data):
 
         # Save images
         for idx, img in enumerate(content["images"], start=1):
+            blob = image_store.get(img["hash"]) if img["hash"] else None
+            if blob is None:
+                continue
             ext = img["filename"].split(".")[-1]
-            img_bytes = base64.b64decode(img["base64"])
             image_path = os.path.join(images_dir, f"page_{page_num}_image_{idx}.{ext}")
             with open(image_path, "wb") as f:
-                f.write(img_bytes)
+                f.write(blob.data)
 
         # Save tables
         for idx, tbl in enumerate(content["tables"], start=1):
@@ -20,6 +20,43 @@ Rules:
 - If info missing, use reasonable domain knowledge.
 """
 
+REFINE_DRAFT_PROMPT_TEMPLATE = """
+You are an advanced AI assistant specialized in filling placeholders in .docx templates.
+A draft answer for the placeholder was already written from the retrieved documents; adapt it to the user's request.
+
+Inputs:
+1. Placeholder Text: {placeholder}
+2. Draft Answer: {draft}
+3. Context Type: {context_type} (table or section)
+4. User Context: {user_context}
+5. Process Flow Summary: {flow_summary}
+
+Rules:
+- Keep the facts of the draft; revise, extend or reorder it to reflect the user context and flow summary where relevant.
+- If neither adds anything relevant, return the draft unchanged.
+- If context_type=table → produce concise 1–3 sentences or short bullets.
+- If context_type=section → produce detailed, structured text.
+- Output plain text only (no markdown, no asterisks).
+"""
+
+TABLE_BATCH_PROMPT_TEMPLATE = """
+You are an advanced AI assistant specialized in filling placeholders in .docx templates using provided context.
+All placeholders below are cells of the same table.
+
+Inputs:
+1. Placeholders (JSON list): {placeholders}
+2. Retrieved Chunks: {retrieved}
+3. User Context: {user_context}
+4. Process Flow Summary: {flow_summary}
+
+Rules:
+- For every placeholder produce concise 1–3 sentences or short bullets.
+- Plain text answers only (no markdown, no asterisks).
+- Incorporate user context and flow summary if relevant.
+- If info missing, use reasonable domain knowledge.
+- Respond with a single JSON object mapping each placeholder, exactly as given, to its answer string. No other text.
+"""
+
 def format_retrieved_chunks(docs):
     """Format retrieved documents for better LLM consumption."""
     formatted_chunks = []
@@ -6,6 +6,7 @@ from llama_index.vector_stores.postgres import PGVectorStore
 from llama_index.core.base.embeddings.base import BaseEmbedding
 from .parser import extract_pdf_llamaparse
 from .chunker import text_n_images
+from .image_processing import ImageStats
 from sqlalchemy import make_url
 from sqlmodel import Session
 from llama_index.core.retrievers import QueryFusionRetriever
@@ -93,7 +94,9 @@ class Retriver:
 
     async def extract_text_from_pdf(self, session: Session):
         data, num_images, num_tables = await extract_pdf_llamaparse(self.path)
-        docs = text_n_images(data, self.document_id, session)
+        # Images described and bytes saved by normalization, reported in the upload response
+        self.image_stats = ImageStats()
+        docs = text_n_images(data, self.document_id, session, self.image_stats)
         return docs
 
     async def upsert(self, session: Session):
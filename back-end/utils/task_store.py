@@ -0,0 +1,282 @@
+"""
+Durable registry of template processing tasks backed by the SQLModel database.
+
+Replaces the in-memory task dict so progress survives restarts and is
+visible to every uvicorn worker and host sharing the database.
+"""
+import json
+from datetime import timedelta
+from typing import Dict, List, Optional
+from sqlmodel import Session, select, update, delete, func, or_
+from utils.database import engine
+from utils.models import TemplateTask, TemplateTaskFile, PlaceholderAnswer, utc_now
+from utils.config import TASK_TTL_SECONDS
+
+class TaskStore:
+    """Persistent store for tasks, per-file status and generated file records."""
+
+    def __init__(self, ttl_seconds: int = TASK_TTL_SECONDS):
+        self.ttl = timedelta(seconds=ttl_seconds)
+
+    def create_task(
+        self,
+        task_id: str,
+        folder_name: str = None,
+        user_prompt: str = "",
+        process_flow: str = "",
+        selected_files: List[str] = None
+    ):
+        """Register a new task with the request needed to resume it, and drop expired ones."""
+        self.collect_garbage()
+        with Session(engine) as session:
+            session.add(TemplateTask(
+                task_id=task_id,
+                folder_name=folder_name,
+                user_prompt=user_prompt,
+                process_flow=process_flow,
+                selected_files=json.dumps(selected_files) if selected_files else None
+            ))
+            session.commit()
+
+    def get_request(self, task_id: str) -> Optional[dict]:
+        """Return the stored request parameters of a task."""
+        with Session(engine) as session:
+            task = session.get(TemplateTask, task_id)
+            if task is None:
+                return None
+            return {
+                "folder_name": task.folder_name,
+                "user_prompt": task.user_prompt or "",
+                "process_flow": task.process_flow or "",
+                "process_flow_description": task.process_flow_description,
+                "selected_files": json.loads(task.selected_files) if task.selected_files else None,
+            }
+
+    def set_process_flow_description(self, task_id: str, description: str):
+        """Checkpoint the process flow description so a resume does not regenerate it."""
+        with Session(engine) as session:
+            _touch(session, task_id, process_flow_description=description)
+            session.commit()
+
+    def set_files(self, task_id: str, template_names: List[str]):
+        """Record the templates a task will process; already recorded templates are kept."""
+        now = utc_now()
+        with Session(engine) as session:
+            version = _touch(session, task_id, files_total=len(template_names))
+            known = set(session.exec(
+                select(TemplateTaskFile.template_name).where(TemplateTaskFile.task_id == task_id)
+            ).all())
+            for position, template_name in enumerate(template_names):
+                if template_name not in known:
+                    session.add(TemplateTaskFile(
+                        task_id=task_id,
+                        position=position,
+                        template_name=template_name,
+                        updated_at=now,
+                        version=version
+                    ))
+            session.commit()
+
+    def mark_file(
+        self,
+        task_id: str,
+        template_name: str,
+        status: str,
+        output_file_name: Optional[str] = None,
+        download_url: Optional[str] = None
+    ):
+        """Update the status of one template; the first "done" also bumps files_done atomically."""
+        with Session(engine) as session:
+            version = _touch(session, task_id)
+            result = session.exec(
+                update(TemplateTaskFile)
+                .where(
+                    TemplateTaskFile.task_id == task_id,
+                    TemplateTaskFile.template_name == template_name,
+                    # A template finished twice (e.g. by an overlapping run) is only counted once
+                    TemplateTaskFile.status != "done"
+                )
+                .values(
+                    status=status,
+                    output_file_name=output_file_name,
+                    download_url=download_url,
+                    updated_at=utc_now(),
+                    version=version
+                )
+            )
+            if status == "done" and result.rowcount == 1:
+                session.exec(
+                    update(TemplateTask)
+                    .where(TemplateTask.task_id == task_id)
+                    .values(files_done=TemplateTask.files_done + 1)
+                )
+            session.commit()
+
+    def pending_files(self, task_id: str) -> List[str]:
+        """Templates of a task that are not done yet, in task order."""
+        with Session(engine) as session:
+            return list(session.exec(
+                select(TemplateTaskFile.template_name)
+                .where(TemplateTaskFile.task_id == task_id, TemplateTaskFile.status != "done")
+                .order_by(TemplateTaskFile.position)
+            ).all())
+
+    def reset_for_resume(self, task_id: str, active_window_seconds: int) -> bool:
+        """Put unfinished or failed templates back to pending and reopen the task.
+
+        Returns False, changing nothing, while the task is still processing and
+        made progress within the window, so a live run is never doubled.
+        """
+        cutoff = utc_now() - timedelta(seconds=active_window_seconds)
+        with Session(engine) as session:
+            result = session.exec(
+                update(TemplateTask)
+                .where(
+                    TemplateTask.task_id == task_id,
+                    or_(TemplateTask.status != "processing", TemplateTask.updated_at < cutoff)
+                )
+                .values(status="processing")
+            )
+            if result.rowcount != 1:
+                return False
+            version = _touch(session, task_id)
+            session.exec(
+                update(TemplateTaskFile)
+                .where(TemplateTaskFile.task_id == task_id, TemplateTaskFile.status != "done")
+                .values(status="pending", updated_at=utc_now(), version=version)
+            )
+            session.commit()
+            return True
+
+    def save_answer(self, task_id: str, answer_key: str, placeholder: str, context_type: str, answer: str):
+        """Checkpoint a generated placeholder answer as soon as it arrives.
+
+        Also marks the task as alive, without a new progress version, so a
+        long template still counts as active for resume and has_active_tasks.
+        """
+        with Session(engine) as session:
+            session.add(PlaceholderAnswer(
+                task_id=task_id,
+                answer_key=answer_key,
+                placeholder=placeholder,
+                context_type=context_type,
+                answer=answer
+            ))
+            session.exec(update(TemplateTask).where(TemplateTask.task_id == task_id).values(updated_at=utc_now()))
+            session.commit()
+
+    def load_answers(self, task_id: str) -> Dict[str, str]:
+        """Return the checkpointed answers of a task keyed by answer key."""
+        with Session(engine) as session:
+            rows = session.exec(
+                select(PlaceholderAnswer.answer_key, PlaceholderAnswer.answer)
+                .where(PlaceholderAnswer.task_id == task_id)
+            ).all()
+        return {answer_key: answer for answer_key, answer in rows}
+
+    def set_status(self, task_id: str, status: str):
+        """Set the overall task status."""
+        with Session(engine) as session:
+            _touch(session, task_id, status=status)
+            session.commit()
+
+    def has_active_tasks(self, window_seconds: int) -> bool:
+        """True if a task is processing and made progress within the window."""
+        cutoff = utc_now() - timedelta(seconds=window_seconds)
+        with Session(engine) as session:
+            active = session.exec(
+                select(func.count())
+                .select_from(TemplateTask)
+                .where(TemplateTask.status == "processing", TemplateTask.updated_at >= cutoff)
+            ).one()
+        return active > 0
+
+    def complete_if_finished(self, task_id: str) -> bool:
+        """Mark the task completed once every file is done or failed.
+
+        Returns True only for the single caller that made the transition, so
+        exactly one worker sends the final response.
+        """
+        unfinished = (
+            select(func.count())
+            .select_from(TemplateTaskFile)
+            .where(TemplateTaskFile.task_id == task_id, TemplateTaskFile.status.not_in(("done", "error")))
+            .scalar_subquery()
+        )
+        with Session(engine) as session:
+            result = session.exec(
+                update(TemplateTask)
+                .where(TemplateTask.task_id == task_id, TemplateTask.status == "processing", unfinished == 0)
+                .values(status="completed", updated_at=utc_now(), version=TemplateTask.version + 1)
+            )
+            session.commit()
+            return result.rowcount == 1
+
+    def get_version(self, task_id: str) -> Optional[int]:
+        """Progress version of a task, or None if unknown; incremented on every update."""
+        with Session(engine) as session:
+            return session.exec(
+                select(TemplateTask.version).where(TemplateTask.task_id == task_id)
+            ).first()
+
+    def get_task(self, task_id: str, since_version: Optional[int] = None) -> Optional[dict]:
+        """Return the task progress, or None if unknown or expired.
+
+        With ``since_version`` only the files updated after that version are listed.
+        """
+        with Session(engine) as session:
+            task = session.get(TemplateTask, task_id)
+            if task is None:
+                return None
+            files = session.exec(
+                select(TemplateTaskFile)
+                .where(TemplateTaskFile.task_id == task_id)
+                .order_by(TemplateTaskFile.position)
+            ).all()
+
+        if since_version is not None:
+            files = [f for f in files if f.version > since_version]
+
+        return {
+            "task_id": task.task_id,
+            "status": task.status,
+            "version": task.version,
+            "files_done": task.files_done,
+            "files_total": task.files_total,
+            "generated_files": [
+                {
+                    "fileName": f.output_file_name or f.template_name,
+                    "status": f.status,
+                    "downloadUrl": f.download_url
+                }
+                for f in files if f.status in ("done", "error")
+            ],
+            "files": [{"templateName": f.template_name, "status": f.status} for f in files],
+        }
+
+    def collect_garbage(self):
+        """Delete tasks (and their file records) not updated within the TTL."""
+        cutoff = utc_now() - self.ttl
+        with Session(engine) as session:
+            expired = select(TemplateTask.task_id).where(TemplateTask.updated_at < cutoff)
+            session.exec(delete(TemplateTaskFile).where(TemplateTaskFile.task_id.in_(expired)))
+            session.exec(delete(PlaceholderAnswer).where(PlaceholderAnswer.task_id.in_(expired)))
+            session.exec(delete(TemplateTask).where(TemplateTask.updated_at < cutoff))
+            session.commit()
+
+
+def _touch(session: Session, task_id: str, **values) -> Optional[int]:
+    """Update a task row and increment its version in the database; returns the new version.
+
+    The row stays locked until the session commits, so concurrent writers
+    from any worker or host get consecutive versions.
+    """
+    session.exec(
+        update(TemplateTask)
+        .where(TemplateTask.task_id == task_id)
+        .values(version=TemplateTask.version + 1, updated_at=utc_now(), **values)
+    )
+    return session.exec(select(TemplateTask.version).where(TemplateTask.task_id == task_id)).first()
+
+
+task_store = TaskStore()
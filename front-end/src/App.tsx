@@ -138,21 +138,28 @@ const App = () => {
   }
 
   const promptFileInputRef = useRef<HTMLInputElement>(null);
+  // Sequence number of the last progress event received, used to replay missed events on connect
+  const lastSeqRef = useRef<number>(0);
 
   // WebSocket connection for real-time updates
   useEffect(() => {
     if (taskId && !wsConnection) {
-      const ws = new WebSocket(`ws://localhost:8000/api/ws/progress/${taskId}`);
+      const ws = new WebSocket(`ws://localhost:8000/api/ws/progress/${taskId}?since=${lastSeqRef.current}`);
       
       ws.onopen = () => {
         console.log('WebSocket connected');
         setWsConnection(ws);
       };
 
-      ws.onmessage = (event) => {
-        const data = JSON.parse(event.data);
-        console.log('WebSocket message received:', data);
-        
+      const handleMessage = (data: any) => {
+        // Skip events already received before a reconnect
+        if (data.seq !== undefined) {
+          if (data.seq <= lastSeqRef.current) {
+            return;
+          }
+          lastSeqRef.current = data.seq;
+        }
+
         // Handle call logs
         if (data.type === 'call_log') {
           setCallLogs(prev => [...prev, {
@@ -191,6 +198,18 @@ const App = () => {
         }
       };
 
+      ws.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        console.log('WebSocket message received:', data);
+
+        // Rapid updates arrive batched into one frame
+        if (data.type === 'batch') {
+          data.events.forEach(handleMessage);
+        } else {
+          handleMessage(data);
+        }
+      };
+
       ws.onclose = () => {
         console.log('WebSocket disconnected');
         setWsConnection(null);
@@ -266,6 +285,7 @@ const App = () => {
         }
 
         const data = await response.json();
+        lastSeqRef.current = 0;
         setTaskId(data.task_id);
         setResponse("");
         setCallLogs([]); // Clear previous logs